@@ -0,0 +1,256 @@
+import os
+import math
+import time
+import hmac
+import heapq
+import logging
+import threading
+import itertools
+from contextlib import contextmanager
+
+import deadline as request_deadline
+
+logger = logging.getLogger(__name__)
+
+# Priority classes in the order they are served; lower rank wins
+PRIORITIES = {"interactive": 0, "batch": 1}
+PRIORITY_HEADER = 'X-Priority'
+CLIENT_HEADER = 'X-Client-ID'
+
+# Any client can send X-Priority. With a token set, a request may only claim a class above
+# ADMISSION_DEFAULT_PRIORITY when it also sends the token (the UI does), so with the default
+# set to batch only trusted callers are served as interactive.
+PRIORITY_TOKEN = os.environ.get('ADMISSION_PRIORITY_TOKEN', '')
+PRIORITY_TOKEN_HEADER = 'X-Priority-Token'
+
+# Queries handled at once by one worker process and how many may wait behind them
+MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', '4'))
+MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', '16'))
+
+# Longest acceptable queue wait per priority class; requests expected to wait longer are shed
+QUEUE_SLO_SECONDS = {
+    "interactive": float(os.environ.get('ADMISSION_SLO_INTERACTIVE_SECONDS', '5')),
+    "batch": float(os.environ.get('ADMISSION_SLO_BATCH_SECONDS', '30')),
+}
+
+# Starting estimate of how long a query holds its slot, refined by an EWMA of observed times
+INITIAL_SERVICE_SECONDS = float(os.environ.get('ADMISSION_INITIAL_SERVICE_SECONDS', '8'))
+SERVICE_TIME_ALPHA = 0.2
+
+# Per-stage concurrency caps inside a worker, e.g. to keep vLLM from being oversubscribed
+STAGE_LIMITS = {
+    'embedding': int(os.environ.get('STAGE_LIMIT_EMBEDDING', '8')),
+    'search': int(os.environ.get('STAGE_LIMIT_SEARCH', '8')),
+    'generation': int(os.environ.get('STAGE_LIMIT_GENERATION', '4')),
+}
+
+
+def _parse_weights(raw):
+    """Parse "client=weight,client=weight" into a dict, ignoring malformed entries"""
+    weights = {}
+    for item in raw.split(','):
+        name, _, value = item.partition('=')
+        try:
+            if name.strip() and float(value) > 0:
+                weights[name.strip()] = float(value)
+        except ValueError:
+            logger.warning(f"Ignoring malformed client weight: {item}")
+    return weights
+
+
+def _parse_priority(raw):
+    priority = raw.strip().lower()
+    if priority not in PRIORITIES:
+        logger.warning(f"Unknown ADMISSION_DEFAULT_PRIORITY '{raw}', using interactive")
+        return "interactive"
+    return priority
+
+
+# Fair-share weights by client identity; unlisted clients have weight 1
+CLIENT_WEIGHTS = _parse_weights(os.environ.get('ADMISSION_CLIENT_WEIGHTS', ''))
+
+# Class of requests that do not (or may not) name one
+DEFAULT_PRIORITY = _parse_priority(os.environ.get('ADMISSION_DEFAULT_PRIORITY', 'interactive'))
+
+
+def request_priority(headers):
+    """Priority class of a request: its X-Priority if valid and allowed (see PRIORITY_TOKEN)"""
+    priority = (headers.get(PRIORITY_HEADER) or DEFAULT_PRIORITY).strip().lower()
+    if priority not in PRIORITIES:
+        return DEFAULT_PRIORITY
+    if PRIORITY_TOKEN and PRIORITIES[priority] < PRIORITIES[DEFAULT_PRIORITY] and \
+            not hmac.compare_digest(headers.get(PRIORITY_TOKEN_HEADER, ''), PRIORITY_TOKEN):
+        return DEFAULT_PRIORITY
+    return priority
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; `retry_after` is a suggested back-off in seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A request's place in the admission queue, and later its in-flight slot"""
+
+    def __init__(self, controller, client_id, priority, rank, start_tag, finish_tag, seq):
+        self.controller = controller
+        self.client_id = client_id
+        self.priority = priority
+        self.start_tag = start_tag
+        self.sort_key = (rank, finish_tag, seq)
+        self.granted = False
+        self.rejected = None
+        self.released = False
+        self.granted_at = None
+
+    def __lt__(self, other):
+        return self.sort_key < other.sort_key
+
+    def release(self):
+        """Give the slot back (idempotent)"""
+        self.controller._release(self)
+
+
+class AdmissionController:
+    """
+    Bounded in-flight work with a priority-ordered, weighted-fair wait queue.
+
+    Waiting requests are ordered by priority class first, then by a virtual finish tag
+    per client (weighted fair queuing), so one chatty client cannot starve the others
+    in its class. A request whose expected wait exceeds its class SLO, or that does not
+    fit the queue, is rejected up front rather than left to time out.
+    """
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, max_queue=MAX_QUEUE):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.service_time = INITIAL_SERVICE_SECONDS
+        self._queue = []
+        self._virtual_time = 0.0
+        self._client_finish = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _expected_wait(self, position):
+        """Seconds until the request at `position` in the queue (0 = head) gets a slot"""
+        return (position // self.max_in_flight + 1) * self.service_time
+
+    def _position(self, ticket):
+        return sum(1 for waiting in self._queue if waiting < ticket)
+
+    def admit(self, client_id, priority, timeout):
+        """
+        Wait for an in-flight slot. Returns a Ticket to release when the request is done.
+        Raises AdmissionRejected when shedding, or when no slot frees up within `timeout`.
+        """
+        priority = priority if priority in PRIORITIES else DEFAULT_PRIORITY
+        slo = QUEUE_SLO_SECONDS.get(priority, QUEUE_SLO_SECONDS["interactive"])
+
+        with self._cond:
+            idle = self.in_flight < self.max_in_flight and not self._queue
+            if idle and self._client_finish:
+                # Nobody waits, so nobody is owed service: virtual time catches up with
+                # every client and their finish tags are forgotten
+                self._virtual_time = max(self._virtual_time, max(self._client_finish.values()))
+                self._client_finish = {}
+            weight = CLIENT_WEIGHTS.get(client_id, 1.0)
+            start_tag = max(self._virtual_time, self._client_finish.get(client_id, 0.0))
+            ticket = Ticket(self, client_id, priority, PRIORITIES[priority],
+                            start_tag, start_tag + 1.0 / weight, next(self._seq))
+
+            if idle:
+                self._client_finish[client_id] = ticket.sort_key[1]
+                self._grant(ticket)
+                return ticket
+
+            expected = self._expected_wait(self._position(ticket))
+            if expected > slo:
+                raise AdmissionRejected(
+                    f"Expected queue wait {expected:.1f}s exceeds {priority} SLO of {slo:.0f}s",
+                    math.ceil(expected))
+
+            if len(self._queue) >= self.max_queue:
+                worst = max(self._queue)
+                if not ticket < worst:
+                    raise AdmissionRejected("Admission queue is full", math.ceil(self._expected_wait(len(self._queue))))
+                # A higher-ranked arrival displaces the lowest-ranked waiter
+                self._queue.remove(worst)
+                heapq.heapify(self._queue)
+                worst.rejected = AdmissionRejected(
+                    "Displaced by higher-priority work", math.ceil(self._expected_wait(len(self._queue))))
+                self._cond.notify_all()
+
+            self._client_finish[client_id] = ticket.sort_key[1]
+            heapq.heappush(self._queue, ticket)
+
+            wait_until = time.monotonic() + min(timeout, slo)
+            while not ticket.granted and ticket.rejected is None:
+                remaining = wait_until - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    raise AdmissionRejected("Timed out waiting for an in-flight slot", math.ceil(self.service_time))
+                self._cond.wait(remaining)
+
+            if ticket.rejected is not None:
+                raise ticket.rejected
+            return ticket
+
+    def _grant(self, ticket):
+        ticket.granted = True
+        ticket.granted_at = time.monotonic()
+        self.in_flight += 1
+        # Virtual time follows the start tag of the work being served
+        if ticket.start_tag > self._virtual_time:
+            self._virtual_time = ticket.start_tag
+            # A client whose finish tag virtual time has passed starts from virtual time
+            # anyway, so it need not be remembered
+            self._client_finish = {client_id: finish for client_id, finish in self._client_finish.items()
+                                   if finish > self._virtual_time}
+
+    def _release(self, ticket):
+        with self._cond:
+            if ticket.released or not ticket.granted:
+                return
+            ticket.released = True
+            self.in_flight -= 1
+            elapsed = time.monotonic() - ticket.granted_at
+            self.service_time = (1 - SERVICE_TIME_ALPHA) * self.service_time + SERVICE_TIME_ALPHA * elapsed
+            while self._queue and self.in_flight < self.max_in_flight:
+                self._grant(heapq.heappop(self._queue))
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "in_flight": self.in_flight,
+                "queued": len(self._queue),
+                "service_time_seconds": round(self.service_time, 2)
+            }
+
+
+_stage_semaphores = {stage: threading.BoundedSemaphore(limit) for stage, limit in STAGE_LIMITS.items()}
+
+
+@contextmanager
+def stage_slot(stage):
+    """
+    Hold one of the stage's concurrency slots for the duration of the block.
+    Waits at most the current request's remaining budget for the stage.
+    """
+    semaphore = _stage_semaphores.get(stage)
+    if semaphore is None:
+        yield
+        return
+    deadline = request_deadline.get_current()
+    timeout = deadline.stage_budget(stage) if deadline is not None else None
+    if not semaphore.acquire(timeout=timeout):
+        raise request_deadline.DeadlineExceeded(f"No {stage} slot freed up within the request budget")
+    try:
+        yield
+    finally:
+        semaphore.release()
@@ -0,0 +1,209 @@
+import os
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Numeric sensor fields summarized per group
+NUMERIC_FIELDS = ["engine_temp", "battery_voltage", "fuel_pressure", "speed", "battery_level"]
+
+# Keyword fields a summary can be grouped by
+GROUP_FIELDS = ["error_code", "vehicle_id", "service", "vehicle_state"]
+
+AGGREGATE_MAX_HITS = int(os.environ.get('AGGREGATE_MAX_HITS', '2000'))
+AGGREGATE_MAX_GROUPS = int(os.environ.get('AGGREGATE_MAX_GROUPS', '15'))
+
+
+def build_window_query(date_filter, group_by, filters=None, max_groups=AGGREGATE_MAX_GROUPS):
+    """
+    Size-0 query whose aggregations summarize every log in the time window (and `filters`,
+    e.g. spatial clauses): total count, the window's span, the number of groups and, for the
+    `max_groups` largest groups, their count, distinct vehicles and stats of each reading.
+    """
+    group_aggs = {"vehicles": {"cardinality": {"field": "vehicle_id"}}}
+    for field in NUMERIC_FIELDS:
+        group_aggs[field] = {"stats": {"field": f"sensor_readings.{field}"}}
+    return {
+        "size": 0,
+        "track_total_hits": True,
+        "query": {"bool": {"filter": [{"range": {"timestamp": date_filter}}] + list(filters or [])}},
+        "aggs": {
+            "first": {"min": {"field": "timestamp"}},
+            "last": {"max": {"field": "timestamp"}},
+            "group_count": {"cardinality": {"field": group_by}},
+            "groups": {
+                "terms": {"field": group_by, "size": max_groups, "order": {"_count": "desc"}},
+                "aggs": group_aggs
+            }
+        }
+    }
+
+
+def build_candidate_query(embedding, group_by, size=AGGREGATE_MAX_HITS, filters=None):
+    """
+    Query for the `size` logs nearest to the question by vector similarity (restricted by
+    `filters`), with `_source` limited to what the summary needs. Used when the question
+    names no time window, so there is no natural set to aggregate over.
+    """
+    source = [f"sensor_readings.{field}" for field in NUMERIC_FIELDS] + ["timestamp", "vehicle_id"]
+    if group_by not in source:
+        source.append(group_by)
+
+    knn = {"vector": embedding, "k": size}
+    if filters:
+        knn["filter"] = {"bool": {"filter": list(filters)}}
+    return {
+        "size": size,
+        "_source": source,
+        "query": {"knn": {"message_embedding": knn}}
+    }
+
+
+def hits_to_arrays(hits, group_by):
+    """
+    Convert search hits into column arrays.
+
+    Returns (group_keys, vehicle_ids, values, timestamps) where `values` is an
+    (n_hits, len(NUMERIC_FIELDS)) float64 matrix with NaN for missing readings.
+    """
+    n = len(hits)
+    values = np.full((n, len(NUMERIC_FIELDS)), np.nan)
+    group_keys = np.empty(n, dtype=object)
+    vehicle_ids = np.empty(n, dtype=object)
+    timestamps = []
+
+    for row, hit in enumerate(hits):
+        source = hit.get("_source", {})
+        readings = source.get("sensor_readings") or {}
+        for col, field in enumerate(NUMERIC_FIELDS):
+            value = readings.get(field)
+            if value is not None:
+                values[row, col] = value
+        group_keys[row] = str(source.get(group_by, "N/A"))
+        vehicle_ids[row] = str(source.get("vehicle_id", "N/A"))
+        if source.get("timestamp"):
+            timestamps.append(source["timestamp"])
+
+    return group_keys, vehicle_ids, values, timestamps
+
+
+def summarize(hits, group_by, max_groups=AGGREGATE_MAX_GROUPS):
+    """
+    Per-group count of the nearest-neighbour candidates, distinct vehicles and min/max/mean of each numeric field.
+
+    All statistics are computed with vectorized NumPy reductions over the group index,
+    so cost is linear in the number of hits with no per-group Python loops over rows.
+    Groups beyond `max_groups` (by count) are folded into an "other" bucket count so the
+    summary stays a fixed size regardless of how many hits were scanned.
+    """
+    group_keys, vehicle_ids, values, timestamps = hits_to_arrays(hits, group_by)
+    summary = {
+        "group_by": group_by,
+        "scope": "nearest",
+        "total_hits": len(hits),
+        "window": {"first": min(timestamps), "last": max(timestamps)} if timestamps else None,
+        "groups": [],
+        "other_groups": 0,
+        "other_count": 0
+    }
+    if len(hits) == 0:
+        return summary
+
+    keys, inverse = np.unique(group_keys.astype(str), return_inverse=True)
+    n_groups = len(keys)
+    counts = np.bincount(inverse, minlength=n_groups)
+
+    # Distinct vehicles per group: unique (group, vehicle) pairs counted per group
+    _, vehicle_codes = np.unique(vehicle_ids.astype(str), return_inverse=True)
+    pairs = np.unique(inverse.astype(np.int64) * (vehicle_codes.max() + 1) + vehicle_codes)
+    vehicles = np.bincount(pairs // (vehicle_codes.max() + 1), minlength=n_groups)
+
+    present = ~np.isnan(values)
+    n_present = np.stack([np.bincount(inverse, weights=present[:, c], minlength=n_groups)
+                          for c in range(values.shape[1])], axis=1)
+    sums = np.stack([np.bincount(inverse, weights=np.where(present[:, c], values[:, c], 0.0), minlength=n_groups)
+                     for c in range(values.shape[1])], axis=1)
+    mins = np.full((n_groups, values.shape[1]), np.inf)
+    maxs = np.full((n_groups, values.shape[1]), -np.inf)
+    np.fmin.at(mins, inverse, values)
+    np.fmax.at(maxs, inverse, values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / n_present
+
+    order = np.argsort(-counts, kind='stable')
+    for g in order[:max_groups]:
+        stats = {}
+        for c, field in enumerate(NUMERIC_FIELDS):
+            if n_present[g, c] > 0:
+                stats[field] = {
+                    "min": round(float(mins[g, c]), 2),
+                    "max": round(float(maxs[g, c]), 2),
+                    "mean": round(float(means[g, c]), 2)
+                }
+        summary["groups"].append({
+            "key": str(keys[g]),
+            "count": int(counts[g]),
+            "vehicles": int(vehicles[g]),
+            "stats": stats
+        })
+
+    if n_groups > max_groups:
+        summary["other_groups"] = int(n_groups - max_groups)
+        summary["other_count"] = int(counts[order[max_groups:]].sum())
+
+    return summary
+
+
+def summarize_aggregations(response, group_by):
+    """Summary (same shape as `summarize`) of a `build_window_query` response"""
+    aggs = response.get("aggregations", {})
+    total = response.get("hits", {}).get("total", {})
+    buckets = aggs.get("groups", {}).get("buckets", [])
+    first, last = aggs.get("first", {}), aggs.get("last", {})
+    summary = {
+        "group_by": group_by,
+        "scope": "window",
+        "total_hits": total.get("value", 0) if isinstance(total, dict) else total,
+        "window": {"first": first.get("value_as_string", first.get("value")),
+                   "last": last.get("value_as_string", last.get("value"))} if first.get("value") is not None else None,
+        "groups": [],
+        "other_groups": max(0, aggs.get("group_count", {}).get("value", 0) - len(buckets)),
+        "other_count": aggs.get("groups", {}).get("sum_other_doc_count", 0)
+    }
+    for bucket in buckets:
+        stats = {}
+        for field in NUMERIC_FIELDS:
+            field_stats = bucket.get(field, {})
+            if field_stats.get("count"):
+                stats[field] = {
+                    "min": round(float(field_stats["min"]), 2),
+                    "max": round(float(field_stats["max"]), 2),
+                    "mean": round(float(field_stats["avg"]), 2)
+                }
+        summary["groups"].append({
+            "key": str(bucket["key"]),
+            "count": int(bucket["doc_count"]),
+            "vehicles": int(bucket.get("vehicles", {}).get("value", 0)),
+            "stats": stats
+        })
+    return summary
+
+
+def format_summary(summary):
+    """Render a summary as compact prompt context for the LLM"""
+    if summary.get("scope") == "nearest":
+        scope = f"the {summary['total_hits']} logs most similar to the question"
+    else:
+        scope = f"all {summary['total_hits']} logs in the time window"
+    lines = [f"Aggregated statistics over {scope}, grouped by {summary['group_by']}."]
+    if summary["window"]:
+        lines.append(f"Time span covered: {summary['window']['first']} to {summary['window']['last']}")
+    for group in summary["groups"]:
+        stats = "; ".join(
+            f"{field} min {s['min']} / max {s['max']} / mean {s['mean']}"
+            for field, s in group["stats"].items()
+        )
+        lines.append(f"- {group['key']}: {group['count']} logs, {group['vehicles']} vehicles. {stats}")
+    if summary["other_groups"]:
+        lines.append(f"- {summary['other_groups']} other groups: {summary['other_count']} logs")
+    return "\n".join(lines)
@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+
+import hottier
+import tailer
+
+logger = logging.getLogger(__name__)
+
+# Logs older than ARCHIVE_AFTER_DAYS are exported (export_archive.py) into one directory per
+# UTC day under ARCHIVE_DIR, which must be shared with (or synced to) every service pod.
+# Empty disables the archive tier.
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', '')
+ARCHIVE_AFTER_DAYS = float(os.environ.get('ARCHIVE_AFTER_DAYS', '30'))
+
+# How often the list of archived days is re-read, and how many days stay memory-mapped
+ARCHIVE_REFRESH_SECONDS = float(os.environ.get('ARCHIVE_REFRESH_SECONDS', '60'))
+ARCHIVE_OPEN_DAYS = int(os.environ.get('ARCHIVE_OPEN_DAYS', '64'))
+
+# Embeddings are scored in chunks of this many rows to bound temporary memory
+ARCHIVE_SCAN_ROWS = int(os.environ.get('ARCHIVE_SCAN_ROWS', '65536'))
+
+DAY_FORMAT = "%Y-%m-%d"
+DAY = timedelta(days=1)
+
+# Files of a day directory; rows are ordered by timestamp
+TIMESTAMPS_FILE = "timestamps.npy"    # float64 epoch seconds
+EMBEDDINGS_FILE = "embeddings.npy"    # float16 (rows x dimension)
+NORMS_FILE = "squared_norms.npy"      # float32 |v|² of the stored embeddings
+KEYWORDS_FILE = "keywords.npy"        # int32 codes (rows x KEYWORD_FIELDS), -1 when missing
+DICTIONARIES_FILE = "dictionaries.json"
+DOCUMENTS_FILE = "documents.jsonl"    # result fields of each row, one JSON object per line
+OFFSETS_FILE = "offsets.npy"          # int64 byte offset of each row in DOCUMENTS_FILE
+
+
+def day_start(day):
+    """Epoch seconds at the start of a YYYY-MM-DD day (UTC)"""
+    return datetime.strptime(day, DAY_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+
+
+def day_of(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime(DAY_FORMAT)
+
+
+class DayWriter:
+    """
+    Writes one archived day page by page into a temporary directory that replaces the
+    day's directory on close(), so readers never see a partial day.
+    """
+
+    def __init__(self, root, day):
+        self.path = os.path.join(root, day)
+        self.tmp_path = os.path.join(root, f".{day}.tmp")
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(self.tmp_path)
+        self._documents = open(os.path.join(self.tmp_path, DOCUMENTS_FILE), "wb")
+        self._timestamps, self._embeddings, self._keywords, self._offsets = [], [], [], []
+        self._dictionaries = {field: hottier.Dictionary() for field in hottier.KEYWORD_FIELDS}
+        self.rows = 0
+
+    def add(self, sources):
+        """Append documents (sources with timestamp and embedding), oldest first"""
+        for source in sources:
+            epoch = tailer.parse_timestamp(source.get("timestamp"))
+            embedding = source.get(hottier.VECTOR_FIELD)
+            if epoch is None or not embedding:
+                continue
+            self._timestamps.append(epoch)
+            self._embeddings.append(np.asarray(embedding, dtype=np.float16))
+            self._keywords.append([self._dictionaries[field].encode(source.get(field))
+                                   for field in hottier.KEYWORD_FIELDS])
+            self._offsets.append(self._documents.tell())
+            document = {field: source.get(field) for field in hottier.RESULT_FIELDS}
+            self._documents.write(json.dumps(document).encode("utf-8") + b"\n")
+            self.rows += 1
+
+    def close(self):
+        self._documents.close()
+        embeddings = (np.stack(self._embeddings) if self._embeddings
+                      else np.zeros((0, hottier.EMBEDDING_DIMENSION), dtype=np.float16))
+        widened = embeddings.astype(np.float32)
+        np.save(os.path.join(self.tmp_path, TIMESTAMPS_FILE), np.asarray(self._timestamps, dtype=np.float64))
+        np.save(os.path.join(self.tmp_path, EMBEDDINGS_FILE), embeddings)
+        np.save(os.path.join(self.tmp_path, NORMS_FILE), np.einsum('ij,ij->i', widened, widened))
+        np.save(os.path.join(self.tmp_path, KEYWORDS_FILE),
+                np.asarray(self._keywords, dtype=np.int32).reshape(-1, len(hottier.KEYWORD_FIELDS)))
+        np.save(os.path.join(self.tmp_path, OFFSETS_FILE), np.asarray(self._offsets, dtype=np.int64))
+        with open(os.path.join(self.tmp_path, DICTIONARIES_FILE), "w") as f:
+            json.dump({field: list(dictionary.codes) for field, dictionary in self._dictionaries.items()}, f)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.tmp_path, self.path)
+
+
+class ArchivedDay:
+    """Memory-mapped columns of one archived day"""
+
+    def __init__(self, path):
+        self.path = path
+        self.timestamps = np.load(os.path.join(path, TIMESTAMPS_FILE), mmap_mode='r')
+        self.embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode='r')
+        self.squared_norms = np.load(os.path.join(path, NORMS_FILE), mmap_mode='r')
+        self.keywords = np.load(os.path.join(path, KEYWORDS_FILE), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode='r')
+        with open(os.path.join(path, DICTIONARIES_FILE)) as f:
+            self.dictionaries = {field: {value: code for code, value in enumerate(values)}
+                                 for field, values in json.load(f).items()}
+
+    def mask(self, start, end, terms):
+        """Rows with start <= timestamp < end matching every {field: [values]} term filter"""
+        mask = np.ones(len(self.timestamps), dtype=bool)
+        if start is not None:
+            mask &= self.timestamps >= start
+        mask &= self.timestamps < end
+        for field, values in terms.items():
+            codes = [self.dictionaries.get(field, {})[v] for v in values if v in self.dictionaries.get(field, {})]
+            mask &= np.isin(self.keywords[:, hottier.KEYWORD_FIELDS.index(field)], codes)
+        return mask
+
+    def documents(self, rows):
+        with open(os.path.join(self.path, DOCUMENTS_FILE), "rb") as f:
+            found = []
+            for row in rows:
+                f.seek(int(self.offsets[row]))
+                found.append(json.loads(f.readline()))
+            return found
+
+
+class ArchiveTier:
+    """
+    Logs older than the live index keeps, as per-day NumPy files with float16 embeddings.
+
+    A long-range kNN search is split at the end of the newest archived day: the older part
+    of the window is an exact, vectorized scan of the memory-mapped days it overlaps and the
+    rest goes to OpenSearch as usual. Scores are OpenSearch's L2 scores, 1 / (1 + d²), so
+    both result lists merge by score.
+    """
+
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+        self._days = []
+        self._listed_at = 0.0
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+
+    def days(self):
+        """Archived days, oldest first (re-listed every ARCHIVE_REFRESH_SECONDS)"""
+        with self._lock:
+            if time.time() - self._listed_at >= ARCHIVE_REFRESH_SECONDS:
+                try:
+                    names = os.listdir(self.root)
+                except OSError as e:
+                    logger.warning(f"Could not list archive {self.root}: {e}")
+                    names = []
+                days = []
+                for name in names:
+                    try:
+                        day_start(name)
+                    except ValueError:
+                        continue
+                    days.append(name)
+                self._days = sorted(days)
+                self._listed_at = time.time()
+            return self._days
+
+    def covered_until(self):
+        """Epoch seconds where the archive ends (the end of its newest day), or None when empty"""
+        days = self.days()
+        return day_start(days[-1]) + DAY.total_seconds() if days else None
+
+    def _day(self, day):
+        with self._lock:
+            opened = self._open.get(day)
+            if opened is not None:
+                self._open.move_to_end(day)
+                return opened
+        opened = ArchivedDay(os.path.join(self.root, day))
+        with self._lock:
+            self._open[day] = opened
+            while len(self._open) > ARCHIVE_OPEN_DAYS:
+                self._open.popitem(last=False)
+        return opened
+
+    def split(self, date_filter, filters=None, now=None):
+        """
+        (start, until, terms, live_date_filter) for a search whose window reaches into the
+        archive; live_date_filter is the rest of the window for OpenSearch, None when nothing
+        of it is newer than the archive. None when the archive does not apply.
+        """
+        if not date_filter:
+            return None
+        now = time.time() if now is None else now
+        clauses = [{"range": {"timestamp": date_filter}}] + list(filters or [])
+        compiled = hottier.compile_filters(clauses, now)
+        if compiled is None:
+            return None
+        start, end, terms = compiled
+        until = self.covered_until()
+        if start is None or until is None or start >= until:
+            return None
+        live_date_filter = None
+        if end is None or end >= until:
+            live_date_filter = {op: value for op, value in date_filter.items() if op in ("lte", "lt")}
+            live_date_filter["gte"] = tailer.iso(until)
+        return start, until if end is None else min(end + 1e-6, until), terms, live_date_filter
+
+    def search(self, embedding, k, start, end, terms):
+        """
+        [(score, source)] of the k nearest archived documents with start <= timestamp < end,
+        best first and newest first among equal scores
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        query_norm = float(query @ query)
+        best = []
+        for day in self.days():
+            first = day_start(day)
+            if first >= end or first + DAY.total_seconds() <= start:
+                continue
+            archived = self._day(day)
+            rows = np.flatnonzero(archived.mask(start, end, terms))
+            for offset in range(0, rows.size, ARCHIVE_SCAN_ROWS):
+                chunk = rows[offset:offset + ARCHIVE_SCAN_ROWS]
+                vectors = archived.embeddings[chunk].astype(np.float32)
+                distances = np.maximum(archived.squared_norms[chunk] - 2 * (vectors @ query) + query_norm, 0)
+                if chunk.size > k:
+                    keep = np.argpartition(distances, k - 1)[:k]
+                    chunk, distances = chunk[keep], distances[keep]
+                best += [(float(d), -float(archived.timestamps[row]), day, int(row))
+                         for d, row in zip(distances, chunk)]
+                best = sorted(best)[:k]
+
+        results = []
+        for distance, _, day, row in best:
+            source, = self._day(day).documents([row])
+            results.append((1 / (1 + distance), source))
+        return results
+
+    def stats(self):
+        days = self.days()
+        return {"days": len(days), "first": days[0] if days else None, "last": days[-1] if days else None}
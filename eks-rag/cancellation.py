@@ -0,0 +1,212 @@
+import os
+import re
+import time
+import uuid
+import errno
+import select
+import socket
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Header used to correlate a query with later cancel calls
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# In-flight markers and cancel flags are files in a pod-local directory so a cancel that
+# lands on a different gunicorn worker than the query still reaches it. Cancels for other
+# pods are passed on over the peer port (see the /cancel route).
+CANCEL_DIR = os.environ.get('CANCEL_DIR', '/tmp/eks-rag-cancel')
+_ACTIVE_DIR = os.path.join(CANCEL_DIR, 'active')
+_FLAG_DIR = os.path.join(CANCEL_DIR, 'flags')
+# Markers and flags left behind (e.g. by a worker that died mid-request) are swept after this long
+CANCEL_FLAG_TTL_SECONDS = int(os.environ.get('CANCEL_FLAG_TTL_SECONDS', '300'))
+
+# How often the (cheap, but not free) cross-worker and disconnect checks run
+CHECK_INTERVAL_SECONDS = float(os.environ.get('CANCEL_CHECK_INTERVAL_SECONDS', '0.25'))
+
+_REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+_current_token = contextvars.ContextVar('current_cancel_token', default=None)
+_active = {}
+_active_lock = threading.Lock()
+
+
+class RequestCancelled(Exception):
+    """Raised inside a pipeline stage once its request has been cancelled"""
+
+
+def is_valid_request_id(request_id):
+    """Request IDs double as flag file names, so only a safe character set is accepted"""
+    return bool(_REQUEST_ID_PATTERN.match(request_id or ''))
+
+
+def new_request_id(headers):
+    """Use the caller's request ID when it is well-formed, otherwise generate one"""
+    request_id = headers.get(REQUEST_ID_HEADER, '')
+    if is_valid_request_id(request_id):
+        return request_id
+    return uuid.uuid4().hex
+
+
+def _flag_path(request_id):
+    return os.path.join(_FLAG_DIR, request_id)
+
+
+def _active_path(request_id):
+    return os.path.join(_ACTIVE_DIR, request_id)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _peer_closed(sock):
+    """True when the client end of `sock` has been closed"""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        # Readable with no data means EOF; pipelined bytes mean the client is still there
+        return sock.recv(1, socket.MSG_PEEK) == b''
+    except (OSError, ValueError) as e:
+        if isinstance(e, OSError) and e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+            return False
+        return True
+
+
+class CancelToken:
+    """
+    Cancellation state of one in-flight request.
+
+    A request is cancelled when `cancel()` is called in this process, when a cancel
+    flag for its ID exists (set by another worker), or when its client disconnects.
+    A token with a `parent` (e.g. one attempt of a hedged call) is also cancelled with it.
+    """
+
+    def __init__(self, request_id, client_socket=None, parent=None):
+        self.request_id = request_id
+        self.reason = None
+        self._event = threading.Event()
+        self._socket = client_socket
+        self._parent = parent
+        self._last_check = 0.0
+
+    def cancel(self, reason):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+            logger.info(f"Request {self.request_id} cancelled: {reason}")
+
+    def cancelled(self):
+        if self._event.is_set():
+            return True
+        if self._parent is not None and self._parent.cancelled():
+            self.cancel(self._parent.reason)
+            return True
+        now = time.monotonic()
+        if now - self._last_check < CHECK_INTERVAL_SECONDS:
+            return False
+        self._last_check = now
+        if os.path.exists(_flag_path(self.request_id)):
+            self.cancel("cancel requested")
+        elif self._socket is not None and _peer_closed(self._socket):
+            self.cancel("client disconnected")
+        return self._event.is_set()
+
+    def check(self):
+        """Raise RequestCancelled if the request should stop"""
+        if self.cancelled():
+            raise RequestCancelled(self.reason)
+
+
+def get_current():
+    """Cancel token of the request being handled by this thread, or None"""
+    return _current_token.get()
+
+
+def check_current():
+    """Raise RequestCancelled if the current request has been cancelled"""
+    token = _current_token.get()
+    if token is not None:
+        token.check()
+
+
+@contextmanager
+def activate(token):
+    """Make `token` the current cancel token for the duration of the block"""
+    context_token = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(context_token)
+
+
+@contextmanager
+def track(request_id, environ):
+    """
+    Register a request as in-flight, in this worker and for the other workers of the pod,
+    for the duration of the block. A cancel flag left for an earlier request with the same
+    ID is dropped. The client socket is taken from the WSGI environ when the server exposes it.
+    """
+    token = CancelToken(request_id, environ.get('gunicorn.socket'))
+    with _active_lock:
+        _active[request_id] = token
+    _remove(_flag_path(request_id))
+    try:
+        os.makedirs(_ACTIVE_DIR, exist_ok=True)
+        with open(_active_path(request_id), 'w'):
+            pass
+    except OSError as e:
+        logger.warning(f"Could not mark request {request_id} as in flight: {e}")
+    context_token = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(context_token)
+        with _active_lock:
+            _active.pop(request_id, None)
+        _remove(_active_path(request_id))
+        _remove(_flag_path(request_id))
+
+
+def cancel(request_id):
+    """
+    Cancel a request in flight in this pod by ID. Returns False when no worker of the pod
+    is running it; nothing is left behind then, so a later request reusing the ID runs.
+    The worker running it elsewhere in the pod picks up a flag file on its next check.
+    """
+    with _active_lock:
+        token = _active.get(request_id)
+    if token is not None:
+        token.cancel("cancel requested")
+        return True
+    if not os.path.exists(_active_path(request_id)):
+        return False
+    try:
+        os.makedirs(_FLAG_DIR, exist_ok=True)
+        with open(_flag_path(request_id), 'w'):
+            pass
+        _sweep_stale_files()
+    except OSError as e:
+        logger.warning(f"Could not write cancel flag for {request_id}: {e}")
+        return False
+    return True
+
+
+def _sweep_stale_files():
+    """Remove markers and flags of requests whose worker went away without removing them"""
+    cutoff = time.time() - CANCEL_FLAG_TTL_SECONDS
+    for directory in (_ACTIVE_DIR, _FLAG_DIR):
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,81 @@
+import os
+import logging
+import threading
+
+import boto3
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Read timeouts clients are built with; a requested timeout is rounded up to one of them,
+# so a process holds a handful of clients per service and region however budgets vary
+READ_TIMEOUT_TIERS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+
+# Connections each client keeps per endpoint; the STAGE_LIMIT_* caps keep concurrent calls
+# of a worker below it
+MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '10'))
+
+_process_lock = threading.Lock()
+_process_state = None
+
+
+def _state():
+    """Session and clients of this process, rebuilt in a forked child so no sockets are shared with the parent"""
+    global _process_state
+    with _process_lock:
+        if _process_state is None or _process_state['pid'] != os.getpid():
+            _process_state = {'pid': os.getpid(), 'session': boto3.session.Session(), 'clients': {}}
+        return _process_state
+
+
+def timeout_tier(seconds, limit=None):
+    """
+    Smallest read timeout tier not below `seconds`, so a call that times out has used them
+    up; the largest tier not above `limit` (e.g. the request's remaining budget) when that
+    one would run past it
+    """
+    tier = min([tier for tier in READ_TIMEOUT_TIERS if tier >= seconds] or [READ_TIMEOUT_TIERS[-1]])
+    if limit is not None and tier > limit:
+        tier = max([tier for tier in READ_TIMEOUT_TIERS if tier <= limit] or [READ_TIMEOUT_TIERS[0]])
+    return tier
+
+
+def get_client(service_name, region_name=None, connect_timeout=5, read_timeout=30, max_attempts=2, endpoint_url=None):
+    """
+    boto3 client shared by all threads (or greenlets) of this worker process.
+
+    Clients are thread-safe once built, so each process builds one per service, region,
+    endpoint and read timeout tier lazily (under a lock, as sessions are not thread-safe)
+    and reuses it, with its connection pool, for every later call. `read_timeout` is
+    rounded up to a tier (see `timeout_tier`). `endpoint_url` overrides the regional
+    endpoint (e.g. a local stand-in for testing).
+    """
+    read_timeout = timeout_tier(read_timeout)
+    key = (service_name, region_name, endpoint_url, connect_timeout, read_timeout, max_attempts)
+    state = _state()
+    client = state['clients'].get(key)
+    if client is None:
+        with _process_lock:
+            client = state['clients'].get(key)
+            if client is None:
+                client = state['session'].client(
+                    service_name=service_name,
+                    region_name=region_name,
+                    endpoint_url=endpoint_url,
+                    config=Config(
+                        connect_timeout=connect_timeout,
+                        read_timeout=read_timeout,
+                        retries={'max_attempts': max_attempts},
+                        max_pool_connections=MAX_POOL_CONNECTIONS
+                    )
+                )
+                state['clients'][key] = client
+    return client
+
+
+def credentials():
+    """
+    Refreshable AWS credentials shared by all threads of this process.
+    botocore refreshes them in place (under its own lock) before they expire.
+    """
+    return _state()['session'].get_credentials()
@@ -0,0 +1,119 @@
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+
+# Default end-to-end budget for a request when the caller does not send one.
+# Kept below the gunicorn worker timeout (120s) so we give up before gunicorn kills us.
+DEFAULT_TIMEOUT_SECONDS = float(os.environ.get('REQUEST_TIMEOUT_SECONDS', '100'))
+MAX_TIMEOUT_SECONDS = float(os.environ.get('REQUEST_TIMEOUT_MAX_SECONDS', '115'))
+
+# Header carrying the caller's timeout in seconds (relative, so no clock sync is needed)
+DEADLINE_HEADER = 'X-Request-Timeout'
+
+# Share of the budget reserved for each pipeline stage, in pipeline order.
+# Time a stage does not use is handed on to the stages after it.
+STAGE_SHARES = {
+    'embedding': float(os.environ.get('DEADLINE_SHARE_EMBEDDING', '0.15')),
+    'search': float(os.environ.get('DEADLINE_SHARE_SEARCH', '0.25')),
+    'generation': float(os.environ.get('DEADLINE_SHARE_GENERATION', '0.60')),
+}
+STAGE_ORDER = list(STAGE_SHARES)
+
+_current_deadline = contextvars.ContextVar('current_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a downstream call is attempted after the request budget is spent"""
+
+
+class Deadline:
+    """
+    Absolute point in time by which a request must be answered.
+
+    Uses the monotonic clock so wall-clock adjustments cannot stretch a budget.
+    """
+
+    def __init__(self, timeout_seconds):
+        self.timeout = timeout_seconds
+        self.expires_at = time.monotonic() + timeout_seconds
+        self._stage_ends = {}
+
+    @classmethod
+    def from_headers(cls, headers):
+        """
+        Build a deadline from the request headers, falling back to the default budget.
+        Invalid or non-positive values are ignored; values above the maximum are capped.
+        """
+        timeout = DEFAULT_TIMEOUT_SECONDS
+        raw = headers.get(DEADLINE_HEADER)
+        if raw:
+            try:
+                requested = float(raw)
+                if requested > 0:
+                    timeout = min(requested, MAX_TIMEOUT_SECONDS)
+            except ValueError:
+                pass
+        return cls(timeout)
+
+    def remaining(self):
+        """Seconds left before the deadline (never negative)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def stage_budget(self, stage):
+        """
+        Seconds the given stage may spend.
+
+        The remaining time is split between this stage and the stages still to come
+        in proportion to their shares, so a fast embedding leaves more for generation.
+        """
+        remaining = self.remaining()
+        if stage not in STAGE_SHARES:
+            return remaining
+        later = STAGE_ORDER[STAGE_ORDER.index(stage):]
+        total_share = sum(STAGE_SHARES[s] for s in later)
+        if total_share <= 0:
+            return remaining
+        return remaining * STAGE_SHARES[stage] / total_share
+
+    def for_stage(self, stage):
+        """Child deadline that expires when the stage budget is spent"""
+        child = Deadline.__new__(Deadline)
+        child.timeout = self.stage_budget(stage)
+        child.expires_at = min(self.expires_at, time.monotonic() + child.timeout)
+        child._stage_ends = {}
+        return child
+
+    def begin(self, stage):
+        """Fix the budget of a stage from now on (once per request), for `stage_expired`"""
+        self._stage_ends.setdefault(stage, time.monotonic() + self.stage_budget(stage))
+
+    def exhaust(self, stage):
+        """Mark a stage's budget as spent, e.g. when it cannot be met by waiting"""
+        self._stage_ends[stage] = time.monotonic()
+
+    def stage_expired(self, stage):
+        """
+        Whether the request budget, or the budget the stage had when it began, is spent. A
+        stage that failed this way gets a 504 even though later stages still had time left.
+        """
+        end = self._stage_ends.get(stage)
+        return self.expired() or (end is not None and time.monotonic() >= end)
+
+
+def get_current():
+    """Deadline of the request being handled by this thread, or None"""
+    return _current_deadline.get()
+
+
+@contextmanager
+def activate(deadline):
+    """Make `deadline` the current deadline for the duration of the block"""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
@@ -0,0 +1,87 @@
+import os
+import re
+
+import tailer
+
+# Logs can become searchable this long after their own timestamp (batching, ingestion and
+# index refresh), so each poll searches again from this far before the client watermark
+DELTA_LAG_SECONDS = float(os.environ.get('DELTA_LAG_SECONDS', '60'))
+
+# IDs of the logs within the lag margin a response hands back as "seen", so the next poll
+# does not deliver them again; beyond this many, older ones may be repeated
+DELTA_MAX_SEEN = int(os.environ.get('DELTA_MAX_SEEN', '500'))
+
+INSTRUCTIONS = (
+    "The context only holds logs indexed since the client's previous answer. Describe what "
+    "is new or has changed in them; do not repeat the general state of the fleet."
+)
+
+
+def parse_since(value):
+    """Epoch seconds of a client watermark (ISO timestamp); raises ValueError when invalid"""
+    epoch = tailer.parse_timestamp(value)
+    if epoch is None:
+        raise ValueError(f"Invalid since watermark '{value}', expected an ISO-8601 timestamp")
+    return epoch
+
+
+def watermark_iso(value):
+    """ISO timestamp of an index watermark (epoch milliseconds, as a max aggregation returns it)"""
+    return tailer.iso(value / 1000) if value is not None else None
+
+
+def parse_seen(value):
+    """IDs of logs a client already received (the "seen" of its previous response); raises ValueError"""
+    if value is None:
+        return []
+    if not isinstance(value, list) or len(value) > DELTA_MAX_SEEN or \
+            not all(isinstance(doc_id, str) and re.match(r'^\S{1,512}$', doc_id) for doc_id in value):
+        raise ValueError(f"'seen' must be a list of at most {DELTA_MAX_SEEN} document IDs")
+    return value
+
+
+def exclude_seen(seen):
+    """Filter clauses leaving out logs the client already received"""
+    return [{"bool": {"must_not": [{"ids": {"values": list(seen)}}]}}] if seen else []
+
+
+def narrow(date_filter, since, now=None):
+    """
+    Range filter for the part of the query window a poll searches: from DELTA_LAG_SECONDS
+    before the client watermark (epoch seconds), or from the window start when that is later
+    """
+    date_filter = date_filter or {}
+    start = since - DELTA_LAG_SECONDS
+    narrowed = {op: value for op, value in date_filter.items() if op in ("lte", "lt")}
+    for op in ("gte", "gt"):
+        bound = tailer.resolve_time(date_filter[op], now) if op in date_filter else None
+        if bound is not None and bound > start:
+            narrowed[op] = date_filter[op]
+            return narrowed
+    narrowed["gte"] = tailer.iso(start)
+    return narrowed
+
+
+def change_query(date_filter, filters):
+    """
+    Newest timestamp among the logs a poll would search (its narrowed window, the question's
+    filters and the seen exclusion); null when there are none
+    """
+    return {
+        "size": 0,
+        "query": {"bool": {"filter": [{"range": {"timestamp": date_filter}}] + list(filters)}},
+        "aggs": {"latest": {"max": {"field": "timestamp"}}}
+    }
+
+
+def seen_query(watermark, filters):
+    """IDs of the logs within DELTA_LAG_SECONDS before a new watermark (epoch ms), newest first"""
+    return {
+        "size": DELTA_MAX_SEEN,
+        "_source": False,
+        "sort": [{"timestamp": {"order": "desc"}}],
+        "query": {"bool": {"filter": [
+            {"range": {"timestamp": {"gte": tailer.iso(watermark / 1000 - DELTA_LAG_SECONDS),
+                                     "lte": tailer.iso(watermark / 1000)}}}
+        ] + list(filters)}}
+    }
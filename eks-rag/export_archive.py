@@ -0,0 +1,135 @@
+"""
+Export logs older than ARCHIVE_AFTER_DAYS from the live index into the archive tier.
+
+Run periodically with the service image and configuration, e.g. as a daily CronJob:
+
+    python export_archive.py [--delete]
+
+Each complete UTC day after the newest archived one is written to ARCHIVE_DIR (see
+archive.py), including days without logs so the archive stays contiguous. With --delete the
+exported day is then removed from the live index: its partitions are dropped when
+INDEX_PARTITIONING is set, otherwise its documents are deleted by ID. A day is only deleted
+when the live index still holds exactly the logs that were written; otherwise it is kept and
+the run fails once the remaining days are exported.
+"""
+import sys
+import time
+import logging
+
+import archive
+import hottier
+import partitions
+import tailer
+import vector_search_service as service
+
+logger = logging.getLogger("export_archive")
+
+PAGE_SIZE = 1000
+
+OLDEST_QUERY = {"size": 0, "aggs": {"oldest": {"min": {"field": "timestamp"}}}}
+
+
+def _oldest_timestamp():
+    response = service._index_search(OLDEST_QUERY, filter_path="aggregations.oldest.value")
+    return response.get('aggregations', {}).get('oldest', {}).get('value')
+
+
+def _count(start, end):
+    """Logs in the live index with start <= timestamp < end"""
+    body = {
+        "size": 0,
+        "track_total_hits": True,
+        "query": {"range": {"timestamp": {"gte": tailer.iso(start), "lt": tailer.iso(end)}}}
+    }
+    response = service._index_search(body, filter_path="hits.total")
+    return response.get('hits', {}).get('total', {}).get('value', 0)
+
+
+def _pages(start, end):
+    """
+    Pages of [(id, source)] with start <= timestamp < end, oldest first. Pages continue from
+    the last timestamp seen; documents sharing it are fetched again and dropped by ID.
+    """
+    since, seen = tailer.iso(start), set()
+    while True:
+        body = {
+            "size": PAGE_SIZE,
+            "_source": list(hottier.RESULT_FIELDS) + [hottier.VECTOR_FIELD],
+            "sort": [{"timestamp": {"order": "asc"}}],
+            "query": {"range": {"timestamp": {"gte": since, "lt": tailer.iso(end)}}}
+        }
+        response = service._index_search(body, filter_path="hits.hits._id,hits.hits._source")
+        hits = response.get('hits', {}).get('hits', [])
+        page = []
+        for hit in hits:
+            if hit['_id'] in seen:
+                continue
+            timestamp = hit['_source'].get('timestamp')
+            if timestamp != since:
+                since, seen = timestamp, set()
+            seen.add(hit['_id'])
+            page.append((hit['_id'], hit['_source']))
+        if page:
+            yield page
+        if len(hits) < PAGE_SIZE or not page:
+            return
+
+
+def _delete_day(start, end, ids):
+    endpoints = service.ensure_opensearch_endpoints()
+    if partitions.partitioned():
+        for index in partitions.partitions_between(start, end - 1):
+            endpoints.call(lambda client: client.indices.delete(index=index, ignore=[404]))
+        return
+    for offset in range(0, len(ids), PAGE_SIZE):
+        actions = [{"delete": {"_index": partitions.INDEX_NAME, "_id": doc_id}}
+                   for doc_id in ids[offset:offset + PAGE_SIZE]]
+        endpoints.call(lambda client: client.bulk(body=actions))
+
+
+def export(delete=False, now=None):
+    """Archive every complete day older than ARCHIVE_AFTER_DAYS; returns the days written"""
+    now = time.time() if now is None else now
+    horizon = now - archive.ARCHIVE_AFTER_DAYS * 86400
+    tier = archive.ArchiveTier()
+    until = tier.covered_until()
+    if until is None:
+        oldest = tailer.parse_timestamp(_oldest_timestamp())
+        if oldest is None:
+            logger.info("No logs to archive")
+            return []
+        until = archive.day_start(archive.day_of(oldest))
+
+    written, kept = [], []
+    while until + archive.DAY.total_seconds() <= horizon:
+        day, end = archive.day_of(until), until + archive.DAY.total_seconds()
+        writer = archive.DayWriter(archive.ARCHIVE_DIR, day)
+        ids = []
+        for page in _pages(until, end):
+            writer.add([source for _, source in page])
+            ids += [doc_id for doc_id, _ in page]
+        writer.close()
+        logger.info(f"Archived {writer.rows} logs of {day}")
+        if delete:
+            # Logs that became searchable after the export (or pages that came back short)
+            # would be lost with the day
+            live = _count(until, end)
+            if live != writer.rows:
+                logger.error(f"Not deleting {day}: the live index holds {live} logs, {writer.rows} were archived")
+                kept.append(day)
+            else:
+                _delete_day(until, end, ids)
+                logger.info(f"Deleted {day} from the live index")
+        written.append(day)
+        until = end
+    if kept:
+        raise RuntimeError(f"Archived but kept in the live index (count mismatch): {', '.join(kept)}")
+    return written
+
+
+if __name__ == '__main__':
+    if not archive.ARCHIVE_DIR:
+        sys.exit("ARCHIVE_DIR is not set")
+    if service.ensure_opensearch_endpoints(discover=True) is None:
+        sys.exit("OpenSearch endpoint not available")
+    export(delete='--delete' in sys.argv[1:])
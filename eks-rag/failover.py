@@ -0,0 +1,228 @@
+import os
+import time
+import logging
+import threading
+
+import cancellation
+import deadline as request_deadline
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest observation in the latency and error EWMAs
+EWMA_ALPHA = float(os.environ.get('FAILOVER_EWMA_ALPHA', '0.3'))
+
+# An endpoint is ejected after this many consecutive failures, or when its error EWMA passes the limit
+EJECT_CONSECUTIVE_FAILURES = int(os.environ.get('FAILOVER_EJECT_FAILURES', '3'))
+EJECT_ERROR_RATE = float(os.environ.get('FAILOVER_EJECT_ERROR_RATE', '0.5'))
+
+# Ejected endpoints get a single trial request after the cooldown, which doubles on every
+# failed trial up to the maximum. Healthy standby endpoints get one request per cooldown
+# so their scores stay current.
+COOLDOWN_SECONDS = float(os.environ.get('FAILOVER_COOLDOWN_SECONDS', '10'))
+MAX_COOLDOWN_SECONDS = float(os.environ.get('FAILOVER_MAX_COOLDOWN_SECONDS', '120'))
+
+# Successful trials needed before a recovered endpoint can take traffic back
+RECOVERY_SUCCESSES = int(os.environ.get('FAILOVER_RECOVERY_SUCCESSES', '3'))
+
+# Traffic moves to another healthy endpoint only when its score is this much better,
+# so two endpoints with similar latency do not trade places on every blip
+SWITCH_MARGIN = float(os.environ.get('FAILOVER_SWITCH_MARGIN', '0.3'))
+
+# How strongly the error EWMA inflates an endpoint's latency score
+ERROR_PENALTY = 10.0
+
+HEALTHY = "healthy"
+EJECTED = "ejected"
+PROBATION = "probation"
+
+
+def _is_control_flow(exc):
+    """Deadline and cancellation say nothing about the endpoint and must not be failed over"""
+    return isinstance(exc, (request_deadline.DeadlineExceeded, cancellation.RequestCancelled))
+
+
+class Endpoint:
+    """One endpoint of a dependency with its health statistics"""
+
+    def __init__(self, name, value, order):
+        self.name = name
+        self.value = value
+        self.order = order
+        self.latency = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.state = HEALTHY
+        self.cooldown = COOLDOWN_SECONDS
+        self.retry_at = 0.0
+        self.trial_successes = 0
+        self.last_used = 0.0
+
+    def score(self):
+        """Expected cost of a call: EWMA latency inflated by the error EWMA (None if unmeasured)"""
+        if self.latency is None:
+            return None
+        return self.latency * (1 + ERROR_PENALTY * self.error_rate)
+
+    def snapshot(self):
+        return {
+            "name": self.name,
+            "state": self.state,
+            "latency_ms": round(self.latency * 1000) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3)
+        }
+
+
+class EndpointSet:
+    """
+    Ordered endpoints of one dependency (e.g. Bedrock regions or OpenSearch collections).
+
+    Calls go to the current endpoint, which starts as the first one. A call that fails on
+    an endpoint is retried on the next best one within the same request. Endpoints that
+    keep failing are ejected, tried again with a single request after a cooldown and only
+    take traffic back after RECOVERY_SUCCESSES successful trials (sticky recovery). Among
+    healthy endpoints, traffic moves to a lower-scored one only by a clear margin, or back
+    to a preferred (earlier) endpoint once it is healthy and not clearly slower.
+    """
+
+    def __init__(self, dependency, endpoints):
+        """`endpoints` is an ordered list of (name, value) pairs, most preferred first"""
+        if not endpoints:
+            raise ValueError(f"No endpoints configured for {dependency}")
+        self.dependency = dependency
+        self.endpoints = [Endpoint(name, value, order) for order, (name, value) in enumerate(endpoints)]
+        self._current = self.endpoints[0]
+        self._lock = threading.Lock()
+
+    @property
+    def current(self):
+        return self._current
+
+    def _better(self, candidate, current):
+        if current.state != HEALTHY:
+            return True
+        candidate_score, current_score = candidate.score(), current.score()
+        if candidate_score is None or current_score is None:
+            # Without measurements for both, only the configured preference counts
+            return candidate_score is None and current_score is None and candidate.order < current.order
+        if candidate.order < current.order:
+            return candidate_score <= current_score * (1 + SWITCH_MARGIN)
+        return candidate_score < current_score * (1 - SWITCH_MARGIN)
+
+    def _plan(self):
+        """Endpoints to try for one call, in order"""
+        now = time.monotonic()
+        with self._lock:
+            trial = None
+            for endpoint in self.endpoints:
+                if trial is not None:
+                    break
+                if endpoint.state != HEALTHY and now >= endpoint.retry_at:
+                    # One request probes the endpoint; the next trial waits for another cooldown
+                    endpoint.state = PROBATION
+                    endpoint.retry_at = now + endpoint.cooldown
+                    trial = endpoint
+                elif endpoint.state == HEALTHY and endpoint is not self._current \
+                        and now - endpoint.last_used >= COOLDOWN_SECONDS:
+                    endpoint.last_used = now
+                    trial = endpoint
+
+            healthy = [e for e in self.endpoints if e.state == HEALTHY]
+            for candidate in healthy:
+                if candidate is not self._current and self._better(candidate, self._current):
+                    logger.info(f"{self.dependency}: routing to {candidate.name} instead of {self._current.name}")
+                    self._current = candidate
+
+            plan = [trial] if trial else []
+            if self._current.state == HEALTHY and self._current is not trial:
+                plan.append(self._current)
+            plan += sorted(
+                (e for e in healthy if e not in plan),
+                key=lambda e: (e.score() is None, e.score() or 0, e.order)
+            )
+            # With nothing healthy left, still try the endpoints closest to their next trial
+            unhealthy = sorted((e for e in self.endpoints if e not in plan), key=lambda e: e.retry_at)
+            return plan + unhealthy
+
+    def record_success(self, endpoint, latency):
+        with self._lock:
+            endpoint.last_used = time.monotonic()
+            endpoint.latency = latency if endpoint.latency is None else \
+                (1 - EWMA_ALPHA) * endpoint.latency + EWMA_ALPHA * latency
+            endpoint.error_rate = (1 - EWMA_ALPHA) * endpoint.error_rate
+            endpoint.consecutive_failures = 0
+            if endpoint.state != HEALTHY:
+                endpoint.trial_successes += 1
+                if endpoint.trial_successes >= RECOVERY_SUCCESSES:
+                    endpoint.state = HEALTHY
+                    endpoint.cooldown = COOLDOWN_SECONDS
+                    endpoint.trial_successes = 0
+                    logger.info(f"{self.dependency}: endpoint {endpoint.name} recovered")
+                else:
+                    endpoint.retry_at = time.monotonic()
+
+    def record_failure(self, endpoint, error):
+        with self._lock:
+            endpoint.last_used = time.monotonic()
+            endpoint.error_rate = (1 - EWMA_ALPHA) * endpoint.error_rate + EWMA_ALPHA
+            endpoint.consecutive_failures += 1
+            endpoint.trial_successes = 0
+            if endpoint.state == PROBATION:
+                endpoint.state = EJECTED
+                endpoint.cooldown = min(MAX_COOLDOWN_SECONDS, endpoint.cooldown * 2)
+                endpoint.retry_at = time.monotonic() + endpoint.cooldown
+            elif endpoint.state == HEALTHY and (
+                    endpoint.consecutive_failures >= EJECT_CONSECUTIVE_FAILURES
+                    or endpoint.error_rate >= EJECT_ERROR_RATE):
+                endpoint.state = EJECTED
+                endpoint.retry_at = time.monotonic() + endpoint.cooldown
+                logger.warning(f"{self.dependency}: ejecting endpoint {endpoint.name} after error: {error}")
+
+    def call(self, fn, fails_over=lambda exc: True):
+        """
+        Call `fn(endpoint.value)` on the best endpoint, failing over to the next one when it
+        raises an error for which `fails_over(exc)` is true. Other errors, deadline expiry and
+        cancellation propagate immediately. Raises the last error if every endpoint failed.
+        """
+        error = None
+        for endpoint in self._plan():
+            cancellation.check_current()
+            deadline = request_deadline.get_current()
+            if deadline is not None and deadline.expired():
+                raise request_deadline.DeadlineExceeded(f"{self.dependency} budget exhausted during failover")
+            started = time.monotonic()
+            try:
+                result = fn(endpoint.value)
+            except Exception as e:
+                if _is_control_flow(e) or not fails_over(e):
+                    raise
+                self.record_failure(endpoint, e)
+                logger.warning(f"{self.dependency}: call to {endpoint.name} failed, trying next endpoint: {e}")
+                error = e
+                continue
+            self.record_success(endpoint, time.monotonic() - started)
+            return result
+        raise error
+
+    def probe(self, fn):
+        """
+        Call `fn(endpoint.value)` on every endpoint to refresh their scores (e.g. from a
+        background checker). Returns the number of endpoints that answered.
+        """
+        answered = 0
+        for endpoint in self.endpoints:
+            started = time.monotonic()
+            try:
+                fn(endpoint.value)
+            except Exception as e:
+                self.record_failure(endpoint, e)
+                continue
+            self.record_success(endpoint, time.monotonic() - started)
+            answered += 1
+        return answered
+
+    def stats(self):
+        with self._lock:
+            return {
+                "current": self._current.name,
+                "endpoints": [endpoint.snapshot() for endpoint in self.endpoints]
+            }
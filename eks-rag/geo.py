@@ -0,0 +1,119 @@
+import os
+import re
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# geo_point copy of location.latitude/longitude, added to each log at ingest (a field's
+# type cannot change in place, so the float fields stay for existing readers)
+GEO_FIELD = "location.point"
+
+# Named places (center and default radius) and regions (bounding boxes) questions may mention
+GAZETTEER_FILE = os.environ.get(
+    'GAZETTEER_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gazetteer.json')
+)
+
+# Radius of "near <lat>,<lon>" and of places without their own radius_km
+GEO_DEFAULT_RADIUS_KM = float(os.environ.get('GEO_DEFAULT_RADIUS_KM', '50'))
+
+_UNITS = {"km": "km", "kilometer": "km", "kilometre": "km", "mi": "mi", "mile": "mi"}
+_NUMBER = r'-?\d+(?:\.\d+)?'
+_COORDINATES = rf'\(?\s*({_NUMBER})\s*,\s*({_NUMBER})\s*\)?'
+
+
+def point(latitude, longitude):
+    """Value of GEO_FIELD for a log's location"""
+    return {"lat": latitude, "lon": longitude}
+
+
+def _load_gazetteer(path):
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not load gazetteer {path}: {e}")
+        return {}, {}
+    return ({name.lower(): place for name, place in data.get("places", {}).items()},
+            {name.lower(): region for name, region in data.get("regions", {}).items()})
+
+
+places, regions = _load_gazetteer(GAZETTEER_FILE)
+
+
+def _name_pattern(names):
+    """Alternation of gazetteer names, longest first so "salt lake city" wins over shorter names"""
+    names = sorted(names, key=len, reverse=True)
+    return "|".join(re.escape(name) for name in names) or r"(?!)"
+
+
+_PLACE = rf'(?:{_COORDINATES}|({_name_pattern(places)}))'
+_RADIUS_PATTERN = re.compile(
+    rf'\bwithin\s+({_NUMBER})\s*(km|kilomet(?:er|re)s?|mi|miles?)\s+(?:of|from|around)\s+{_PLACE}')
+_NEAR_PATTERN = re.compile(rf'\b(?:near|around|close to|nearby)\s+(?:the\s+)?{_PLACE}')
+_BOX_PATTERN = re.compile(rf'\b(?:bounding box|bbox|box)\s*(?:from\s+)?{_COORDINATES}\s*(?:to|and|-|,)\s*{_COORDINATES}')
+_REGION_PATTERN = re.compile(
+    rf'\b(?:in|across|within|throughout|inside|near|around)\s+(?:the\s+)?({_name_pattern(list(regions) + list(places))})\b')
+
+
+def _valid(latitude, longitude):
+    return -90 <= latitude <= 90 and -180 <= longitude <= 180
+
+
+def distance_filter(latitude, longitude, radius, unit="km"):
+    return {"geo_distance": {"distance": f"{radius:g}{unit}", GEO_FIELD: point(latitude, longitude)}}
+
+
+def box_filter(top_left, bottom_right):
+    return {"geo_bounding_box": {GEO_FIELD: {"top_left": top_left, "bottom_right": bottom_right}}}
+
+
+def _place_center(match, first_group):
+    """(lat, lon, default radius km) of a _PLACE match starting at `first_group`, or None"""
+    latitude, longitude, name = match.group(first_group, first_group + 1, first_group + 2)
+    if name:
+        place = places[name]
+        return place["lat"], place["lon"], place.get("radius_km", GEO_DEFAULT_RADIUS_KM)
+    latitude, longitude = float(latitude), float(longitude)
+    if not _valid(latitude, longitude):
+        return None
+    return latitude, longitude, GEO_DEFAULT_RADIUS_KM
+
+
+def parse_query(text):
+    """
+    Spatial scope of a question as a geo_distance or geo_bounding_box filter clause on
+    GEO_FIELD, or None. Recognized, most specific first:
+    "within 30 miles of Denver" / "within 20 km of 39.7,-105.0", "bbox 41,-109 to 37,-102",
+    "near Reno" (the place's radius), "in Colorado" (a region's box, or a place's radius).
+    """
+    text = text.lower()
+
+    match = _RADIUS_PATTERN.search(text)
+    if match:
+        center = _place_center(match, 3)
+        if center:
+            return distance_filter(center[0], center[1], float(match.group(1)), _UNITS[match.group(2).rstrip("s")])
+
+    match = _BOX_PATTERN.search(text)
+    if match:
+        lat1, lon1, lat2, lon2 = (float(value) for value in match.groups())
+        if _valid(lat1, lon1) and _valid(lat2, lon2):
+            return box_filter(point(max(lat1, lat2), min(lon1, lon2)), point(min(lat1, lat2), max(lon1, lon2)))
+
+    match = _NEAR_PATTERN.search(text)
+    if match:
+        center = _place_center(match, 1)
+        if center:
+            return distance_filter(*center)
+
+    match = _REGION_PATTERN.search(text)
+    if match:
+        name = match.group(1)
+        if name in regions:
+            return box_filter(regions[name]["top_left"], regions[name]["bottom_right"])
+        place = places[name]
+        return distance_filter(place["lat"], place["lon"], place.get("radius_km", GEO_DEFAULT_RADIUS_KM))
+
+    return None
@@ -0,0 +1,63 @@
+# Gunicorn configuration for the RAG service.
+#
+# The serving mode is chosen with SERVING_MODE (see SERVING_MODES.md for the trade-offs):
+#   gthread - a few processes with a thread pool each (default)
+#   gevent  - a few processes with cooperative greenlets, for very high I/O concurrency
+#   sync    - one request per process, the original behaviour
+import gc
+import os
+
+SERVING_MODE = os.environ.get('SERVING_MODE', 'gthread')
+
+if SERVING_MODE == 'gevent':
+    # Must happen before the app (and ssl/requests/boto3) is preloaded in the master
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = [f"0.0.0.0:{os.environ.get('PORT', '5000')}"]
+if os.environ.get('PEER_CACHE_SERVICE') or os.environ.get('PEER_CACHE_PEERS'):
+    # Peer cache traffic has its own port (see peercache.py)
+    bind.append(f"0.0.0.0:{os.environ.get('PEER_CACHE_PORT', '5001')}")
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+
+if SERVING_MODE == 'gevent':
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '100'))
+elif SERVING_MODE == 'sync':
+    worker_class = 'sync'
+else:
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+
+# Import the app once in the master so workers share its read-only pages copy-on-write
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+if preload_app:
+    # No collections while importing: the garbage collector writes to every object header
+    # it visits, which would later un-share the pages of the forked workers
+    gc.disable()
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        # Move everything allocated so far into the permanent generation so the
+        # collectors in the workers never touch (and copy) those pages
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    gc.enable()
+    server.log.info(f"Worker {worker.pid} started ({SERVING_MODE}, preload={preload_app})")
+
+
+def post_worker_init(worker):
+    # Start checking dependencies (and warming connections) as soon as the worker has
+    # loaded the app, so it is ready by the time the first readiness probe arrives
+    import readiness
+    readiness.monitor.start()
+    # Likewise recompute the pinned answers before the first user asks for them
+    import vector_search_service
+    if vector_search_service.prewarmer is not None:
+        vector_search_service.prewarmer.start()
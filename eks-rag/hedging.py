@@ -0,0 +1,187 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import cancellation
+import deadline as request_deadline
+
+logger = logging.getLogger(__name__)
+
+# Hedging is opt-in: a duplicate call costs a second Bedrock invocation or search
+HEDGING_ENABLED = os.environ.get('HEDGING_ENABLED', 'false').lower() == 'true'
+
+# The duplicate is sent when the primary has not answered within this latency percentile
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', '90'))
+HEDGE_MIN_DELAY_SECONDS = float(os.environ.get('HEDGE_MIN_DELAY_MS', '50')) / 1000
+HEDGE_MIN_SAMPLES = int(os.environ.get('HEDGE_MIN_SAMPLES', '20'))
+HEDGE_WINDOW = int(os.environ.get('HEDGE_WINDOW', '256'))
+
+# Hedge budget shared by every dependency in the worker: each call earns HEDGE_BUDGET_RATIO
+# of a hedge, up to HEDGE_BUDGET_BURST saved, so hedges stay a small fraction of the traffic
+# and dry up on their own when calls slow down across the board (an overload, not a tail)
+HEDGE_BUDGET_RATIO = float(os.environ.get('HEDGE_BUDGET_RATIO', '0.05'))
+HEDGE_BUDGET_BURST = float(os.environ.get('HEDGE_BUDGET_BURST', '5'))
+
+HEDGE_MAX_THREADS = int(os.environ.get('HEDGE_MAX_THREADS', '32'))
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies for one dependency"""
+
+    def __init__(self, window=HEDGE_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percentile):
+        """Latency at `percentile` (0-100), or None until HEDGE_MIN_SAMPLES calls were seen"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100))
+        return samples[index]
+
+
+class HedgeBudget:
+    """Token bucket limiting hedges to a fraction of all hedgeable calls"""
+
+    def __init__(self, ratio=HEDGE_BUDGET_RATIO, burst=HEDGE_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+        self.hedges_sent = 0
+        self.hedges_denied = 0
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.hedges_sent += 1
+                return True
+            self.hedges_denied += 1
+            return False
+
+
+budget = HedgeBudget()
+_trackers = {}
+_trackers_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+
+
+def tracker(name):
+    with _trackers_lock:
+        if name not in _trackers:
+            _trackers[name] = LatencyTracker()
+        return _trackers[name]
+
+
+def _get_executor():
+    """Attempt pool of this process (threads do not survive a fork)"""
+    global _executor, _executor_pid
+    with _trackers_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_THREADS, thread_name_prefix="hedge")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def hedge_delay(name):
+    """How long to wait for the primary before hedging, or None if there is no estimate yet"""
+    estimate = tracker(name).percentile(HEDGE_PERCENTILE)
+    if estimate is None:
+        return None
+    return max(HEDGE_MIN_DELAY_SECONDS, estimate)
+
+
+def call(name, fn, *args, **kwargs):
+    """
+    Call `fn(*args, **kwargs)`, an idempotent read, with an optional hedge.
+
+    If the primary attempt has not returned after the dependency's percentile latency,
+    one duplicate is started (budget permitting) and the first successful result wins.
+    The losing attempt's cancel token is cancelled, which stops it before its next
+    transport retry; its result is discarded. Exceptions propagate only when every
+    attempt failed.
+    """
+    latencies = tracker(name)
+    budget.deposit()
+    delay = hedge_delay(name) if HEDGING_ENABLED else None
+    if delay is None:
+        started = time.monotonic()
+        result = fn(*args, **kwargs)
+        latencies.record(time.monotonic() - started)
+        return result
+
+    parent = cancellation.get_current()
+    request_id = parent.request_id if parent is not None else "hedged-call"
+    executor = _get_executor()
+    attempts = {}
+
+    def start(label):
+        token = cancellation.CancelToken(request_id, parent=parent)
+        future = executor.submit(contextvars.copy_context().run, _attempt, latencies, token, fn, args, kwargs)
+        attempts[future] = (label, token)
+        return future
+
+    pending = {start("primary")}
+    deadline = request_deadline.get_current()
+    if deadline is None or deadline.remaining() > delay:
+        done, pending = wait(pending, timeout=delay)
+        if not done and budget.try_spend():
+            logger.info(f"Hedging {name} call after {delay * 1000:.0f}ms")
+            pending.add(start("hedge"))
+    else:
+        done = set()
+
+    error = None
+    while True:
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            label, _ = attempts[future]
+            for other, (_, token) in attempts.items():
+                if other is not future:
+                    token.cancel(f"{name} {label} attempt answered first")
+            return result
+        if not pending:
+            raise error
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+
+def _attempt(latencies, token, fn, args, kwargs):
+    with cancellation.activate(token):
+        token.check()
+        started = time.monotonic()
+        result = fn(*args, **kwargs)
+        # Slow attempts that lost the race are recorded too, so the percentile stays honest
+        latencies.record(time.monotonic() - started)
+        return result
+
+
+def stats():
+    return {
+        "enabled": HEDGING_ENABLED,
+        "hedges_sent": budget.hedges_sent,
+        "hedges_denied": budget.hedges_denied,
+        "delays_ms": {
+            name: round(delay * 1000) if delay is not None else None
+            for name, delay in ((name, hedge_delay(name)) for name in list(_trackers))
+        }
+    }
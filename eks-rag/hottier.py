@@ -0,0 +1,335 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+import tailer
+
+logger = logging.getLogger(__name__)
+
+# Optional: approximate search over the distinct vectors once there are many of them
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# Recent documents answered from memory instead of OpenSearch. Every gunicorn worker keeps
+# its own copy: about 4 KB per distinct message embedding plus the document fields.
+HOT_TIER_ENABLED = os.environ.get('HOT_TIER_ENABLED', 'false').lower() == 'true'
+HOT_TIER_WINDOW_SECONDS = float(os.environ.get('HOT_TIER_WINDOW_HOURS', '6')) * 3600
+HOT_TIER_MAX_DOCS = int(os.environ.get('HOT_TIER_MAX_DOCS', '20000'))
+EMBEDDING_DIMENSION = int(os.environ.get('EMBEDDING_DIMENSION', '1024'))
+
+# HNSW is used (when hnswlib is installed) above this many distinct vectors, fetching
+# this many candidate vectors per requested result with the given search breadth (ef)
+HOT_TIER_HNSW_MIN_VECTORS = int(os.environ.get('HOT_TIER_HNSW_MIN_VECTORS', '5000'))
+HOT_TIER_HNSW_CANDIDATES = int(os.environ.get('HOT_TIER_HNSW_CANDIDATES', '10'))
+HOT_TIER_HNSW_EF = int(os.environ.get('HOT_TIER_HNSW_EF', '200'))
+
+# Replacing evicted vectors in place degrades the graph, so it is rebuilt after this
+# share of its vectors has changed
+HOT_TIER_HNSW_REBUILD_FRACTION = float(os.environ.get('HOT_TIER_HNSW_REBUILD_FRACTION', '0.2'))
+
+# Source fields kept per document, as returned by vector_search
+RESULT_FIELDS = ("timestamp", "message", "service", "error_code", "vehicle_id",
+                 "vehicle_state", "sensor_readings", "diagnostic_info")
+
+# Keyword fields that term filters can be evaluated on
+KEYWORD_FIELDS = ("service", "error_code", "vehicle_id", "vehicle_state", "level")
+
+VECTOR_FIELD = "message_embedding"
+
+
+class Dictionary:
+    """Codes for the distinct values of a keyword column (-1 is missing)"""
+
+    def __init__(self):
+        self.codes = {}
+
+    def encode(self, value):
+        if value is None:
+            return -1
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.codes)
+        return code
+
+    def lookup(self, values):
+        return [self.codes[value] for value in values if value in self.codes]
+
+
+def compile_filters(clauses, now=None):
+    """
+    (start, end, terms) for a list of OpenSearch filter clauses: the timestamp range as epoch
+    seconds and {field: [values]} for term filters. None when a clause cannot be evaluated
+    in memory, so the search goes to OpenSearch instead.
+    """
+    now = time.time() if now is None else now
+    start, end, terms = None, None, {}
+    for clause in clauses:
+        if set(clause) == {"range"} and set(clause["range"]) == {"timestamp"}:
+            for op, value in clause["range"]["timestamp"].items():
+                bound = tailer.resolve_time(value, now)
+                if bound is None or op not in ("gte", "gt", "lte", "lt"):
+                    return None
+                # Timestamps are compared at microsecond precision
+                if op in ("gt", "lt"):
+                    bound += 1e-6 if op == "gt" else -1e-6
+                if op in ("gte", "gt"):
+                    start = bound if start is None else max(start, bound)
+                else:
+                    end = bound if end is None else min(end, bound)
+        elif set(clause) & {"term", "terms"} and len(clause) == 1:
+            kind = next(iter(clause))
+            (field, value), = clause[kind].items()
+            if field not in KEYWORD_FIELDS:
+                return None
+            values = value if kind == "terms" else [value.get("value") if isinstance(value, dict) else value]
+            terms[field] = [v for v in terms[field] if v in values] if field in terms else list(values)
+        else:
+            return None
+    return start, end, terms
+
+
+def _result(source, score):
+    """One result in vector_search's format"""
+    return {
+        "score": score,
+        "timestamp": source.get("timestamp") or "N/A",
+        "message": source.get("message"),
+        "service": source.get("service"),
+        "error_code": source.get("error_code"),
+        "vehicle_id": source.get("vehicle_id") or "N/A",
+        "vehicle_state": source.get("vehicle_state") or "N/A",
+        "sensor_readings": source.get("sensor_readings") or {},
+        "diagnostic_info": source.get("diagnostic_info") or {}
+    }
+
+
+class HotTier:
+    """
+    The last HOT_TIER_WINDOW_SECONDS of documents with their embeddings, for kNN searches
+    whose time window lies entirely inside it.
+
+    Documents live in fixed-size slots (NumPy columns for timestamps, keyword codes and the
+    row of their embedding). Log messages repeat a lot, so embeddings are stored once per
+    distinct vector (by content hash) in a float32 matrix with reference counts. A search
+    scores each distinct candidate vector once, spreads the distances over the documents
+    that pass the filter mask and keeps the k nearest, newest first among equal scores.
+    Scores are OpenSearch's L2 scores, 1 / (1 + d²).
+    """
+
+    def __init__(self, log_tailer, window_seconds=HOT_TIER_WINDOW_SECONDS, max_docs=HOT_TIER_MAX_DOCS,
+                 dimension=EMBEDDING_DIMENSION):
+        self.tailer = log_tailer
+        self.window_seconds = window_seconds
+        self.max_docs = max_docs
+        self.dimension = dimension
+        self._lock = threading.Lock()
+
+        # Document slots
+        self.timestamps = np.full(max_docs, -np.inf)
+        self.valid = np.zeros(max_docs, dtype=bool)
+        self.vector_rows = np.zeros(max_docs, dtype=np.int32)
+        self.keywords = {field: np.full(max_docs, -1, dtype=np.int32) for field in KEYWORD_FIELDS}
+        self.dictionaries = {field: Dictionary() for field in KEYWORD_FIELDS}
+        self.sources = [None] * max_docs
+        self.ids = [None] * max_docs
+        self._slot_of = {}
+        self._free_slots = list(range(max_docs - 1, -1, -1))
+
+        # Distinct vectors, grown on demand up to one per document
+        self.vectors = np.zeros((min(1024, max_docs), dimension), dtype=np.float32)
+        self.squared_norms = np.zeros(len(self.vectors), dtype=np.float32)
+        self.refcounts = np.zeros(len(self.vectors), dtype=np.int32)
+        self._row_of = {}
+        self._hash_of_row = {}
+        self._free_rows = list(range(len(self.vectors) - 1, -1, -1))
+        self._hnsw = None
+        self._hnsw_changes = 0
+
+        # Newest document dropped for lack of room; windows starting earlier are incomplete
+        self.evicted_through = -np.inf
+
+        log_tailer.subscribe(self.add, RESULT_FIELDS + KEYWORD_FIELDS + (VECTOR_FIELD,), window_seconds)
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def covers(self, start, now=None):
+        now = time.time() if now is None else now
+        return start is not None and start >= now - self.window_seconds and start > self.evicted_through \
+            and self.tailer.covers(start)
+
+    # -- maintenance ------------------------------------------------------------------
+
+    def add(self, docs):
+        """Tailer listener: store a batch of new documents, evicting expired and oldest ones"""
+        now = time.time()
+        docs = [doc for doc in docs if doc["timestamp"] >= now - self.window_seconds
+                and doc["id"] not in self._slot_of
+                and len(doc["source"].get(VECTOR_FIELD) or ()) == self.dimension]
+        with self._lock:
+            self._evict(self.valid & (self.timestamps < now - self.window_seconds))
+            shortfall = len(docs) - len(self._free_slots)
+            if shortfall > 0:
+                self._evict_oldest(shortfall)
+            if len(docs) > self.max_docs:
+                self.evicted_through = max(self.evicted_through, max(doc["timestamp"] for doc in docs[:-self.max_docs]))
+                docs = docs[-self.max_docs:]
+            for doc in docs:
+                self._insert(doc)
+        self._refresh_hnsw()
+
+    def _evict(self, mask):
+        for slot in np.flatnonzero(mask):
+            self._release_vector(self.vector_rows[slot])
+            self._slot_of.pop(self.ids[slot], None)
+            self.valid[slot] = False
+            self.timestamps[slot] = -np.inf
+            self.sources[slot] = self.ids[slot] = None
+            self._free_slots.append(int(slot))
+
+    def _evict_oldest(self, count):
+        valid_slots = np.flatnonzero(self.valid)
+        count = min(count, len(valid_slots))
+        if count <= 0:
+            return
+        oldest = valid_slots[np.argpartition(self.timestamps[valid_slots], count - 1)[:count]]
+        self.evicted_through = max(self.evicted_through, float(self.timestamps[oldest].max()))
+        mask = np.zeros(self.max_docs, dtype=bool)
+        mask[oldest] = True
+        self._evict(mask)
+
+    def _insert(self, doc):
+        source = doc["source"]
+        slot = self._free_slots.pop()
+        self._slot_of[doc["id"]] = slot
+        self.ids[slot] = doc["id"]
+        self.timestamps[slot] = doc["timestamp"]
+        self.vector_rows[slot] = self._acquire_vector(source[VECTOR_FIELD])
+        for field in KEYWORD_FIELDS:
+            self.keywords[field][slot] = self.dictionaries[field].encode(source.get(field))
+        self.sources[slot] = {field: source.get(field) for field in RESULT_FIELDS}
+        self.valid[slot] = True
+
+    def _acquire_vector(self, values):
+        vector = np.asarray(values, dtype=np.float32)
+        digest = hashlib.sha1(vector.tobytes()).digest()
+        row = self._row_of.get(digest)
+        if row is None:
+            if not self._free_rows:
+                self._grow_vectors()
+            row = self._free_rows.pop()
+            self._row_of[digest] = row
+            self._hash_of_row[row] = digest
+            self.vectors[row] = vector
+            self.squared_norms[row] = float(vector @ vector)
+            if self._hnsw is not None:
+                self._hnsw.add_items(vector[np.newaxis], np.array([row]))
+                self._hnsw_changes += 1
+        self.refcounts[row] += 1
+        return row
+
+    def _release_vector(self, row):
+        self.refcounts[row] -= 1
+        if self.refcounts[row] == 0:
+            del self._row_of[self._hash_of_row.pop(int(row))]
+            self._free_rows.append(int(row))
+            if self._hnsw is not None:
+                self._hnsw.mark_deleted(int(row))
+                self._hnsw_changes += 1
+
+    def _grow_vectors(self):
+        old = len(self.vectors)
+        new = min(self.max_docs, old * 2)
+        self.vectors = np.concatenate([self.vectors, np.zeros((new - old, self.dimension), dtype=np.float32)])
+        self.squared_norms = np.concatenate([self.squared_norms, np.zeros(new - old, dtype=np.float32)])
+        self.refcounts = np.concatenate([self.refcounts, np.zeros(new - old, dtype=np.int32)])
+        self._free_rows = list(range(new - 1, old - 1, -1))
+        if self._hnsw is not None:
+            self._hnsw.resize_index(new)
+
+    def _refresh_hnsw(self):
+        """
+        Build (or rebuild after enough churn) the HNSW graph. Runs on the tailer thread, the
+        only one that changes the vectors, so the build needs no lock and searches keep
+        using the previous graph until the new one is swapped in.
+        """
+        distinct = len(self._row_of)
+        if hnswlib is None or distinct < HOT_TIER_HNSW_MIN_VECTORS:
+            self._hnsw = None
+            return
+        if self._hnsw is not None and self._hnsw_changes < HOT_TIER_HNSW_REBUILD_FRACTION * distinct:
+            return
+        rows = np.array(sorted(self._hash_of_row), dtype=np.int64)
+        index = hnswlib.Index(space='l2', dim=self.dimension)
+        index.init_index(max_elements=len(self.vectors), ef_construction=HOT_TIER_HNSW_EF, M=16)
+        index.add_items(self.vectors[rows], rows)
+        with self._lock:
+            self._hnsw = index
+            self._hnsw_changes = 0
+        logger.info(f"Hot tier: HNSW index built over {len(rows)} distinct vectors")
+
+    # -- search -----------------------------------------------------------------------
+
+    def search(self, embedding, k, date_filter=None, filters=None):
+        """
+        Results in vector_search's format, or None when the window is not entirely held
+        in memory or a filter cannot be evaluated here.
+        """
+        now = time.time()
+        clauses = ([{"range": {"timestamp": date_filter}}] if date_filter else []) + list(filters or [])
+        compiled = compile_filters(clauses, now)
+        if compiled is None:
+            return None
+        start, end, terms = compiled
+        if not self.covers(start, now):
+            return None
+
+        query = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            mask = self.valid & (self.timestamps >= start)
+            if end is not None:
+                mask &= self.timestamps <= end
+            for field, values in terms.items():
+                mask &= np.isin(self.keywords[field], self.dictionaries[field].lookup(values))
+            slots = np.flatnonzero(mask)
+            if slots.size == 0:
+                return []
+
+            rows = self.vector_rows[slots]
+            if self._hnsw is not None:
+                candidates = self._hnsw_candidates(query, k)
+                narrowed = slots[np.isin(rows, candidates)]
+                if narrowed.size >= k:
+                    slots, rows = narrowed, self.vector_rows[narrowed]
+
+            # Each distinct vector is scored once: d² = |v|² - 2 v·q + |q|²
+            distinct, inverse = np.unique(rows, return_inverse=True)
+            distances = self.squared_norms[distinct] - 2 * (self.vectors[distinct] @ query) + float(query @ query)
+            distances = np.maximum(distances, 0)[inverse]
+
+            if slots.size > k:
+                threshold = np.partition(distances, k - 1)[k - 1]
+                keep = distances <= threshold
+                slots, distances = slots[keep], distances[keep]
+            order = np.lexsort((-self.timestamps[slots], distances))[:k]
+            return [_result(self.sources[slots[i]], float(1 / (1 + distances[i]))) for i in order]
+
+    def _hnsw_candidates(self, query, k):
+        count = min(len(self._row_of), k * HOT_TIER_HNSW_CANDIDATES)
+        self._hnsw.set_ef(max(count, HOT_TIER_HNSW_EF))
+        labels, _ = self._hnsw.knn_query(query, k=count)
+        return labels[0]
+
+    def stats(self):
+        return {
+            "documents": len(self._slot_of),
+            "distinct_vectors": len(self._row_of),
+            "hnsw": self._hnsw is not None,
+            "watermark": self.tailer.watermark
+        }
@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import zlib
+import random
+import logging
+from datetime import datetime, timezone
+
+import numpy as np
+
+import cancellation
+
+# "json" writes one JSON object per line (what CloudWatch Logs Insights parses), "text" is for local runs
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+# Share of requests whose hot-path records are written, per category, e.g. "search=0.1,generation=0.05".
+# Categories not listed are always written, and warnings and errors are never sampled.
+SAMPLE_RATES = {
+    category.strip(): float(rate)
+    for category, _, rate in (item.partition('=') for item in
+                              os.environ.get('LOG_SAMPLE_RATES', 'embedding=0.1,search=0.1,generation=0.1').split(','))
+    if category.strip() and rate.strip()
+}
+
+# Numeric sequences at least this long are logged as "<vector len=N>" instead of their values
+REDACT_VECTOR_MIN_LENGTH = int(os.environ.get('LOG_REDACT_VECTOR_MIN_LENGTH', '16'))
+
+# Longer string fields are truncated
+MAX_FIELD_CHARS = int(os.environ.get('LOG_MAX_FIELD_CHARS', '2000'))
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def _is_vector(value):
+    if isinstance(value, np.ndarray):
+        return value.size >= REDACT_VECTOR_MIN_LENGTH
+    return isinstance(value, (list, tuple)) and len(value) >= REDACT_VECTOR_MIN_LENGTH and \
+        all(isinstance(item, (int, float)) and not isinstance(item, bool) for item in value)
+
+
+def redact(value):
+    """Copy of `value` safe to log: embeddings replaced by their length, long strings truncated"""
+    if _is_vector(value):
+        return f"<vector len={len(value)}>"
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, str) and len(value) > MAX_FIELD_CHARS:
+        return f"{value[:MAX_FIELD_CHARS]}... <{len(value) - MAX_FIELD_CHARS} more chars>"
+    return value
+
+
+def _request_fraction(request_id):
+    """Stable position of a request in [0, 1), so one request is sampled in or out as a whole"""
+    return zlib.crc32(request_id.encode()) / 2 ** 32
+
+
+def sampled(category):
+    """Whether records of `category` are written for the current request"""
+    rate = SAMPLE_RATES.get(category, 1.0)
+    if rate >= 1:
+        return True
+    if rate <= 0:
+        return False
+    token = cancellation.get_current()
+    if token is None:
+        return random.random() < rate
+    return _request_fraction(token.request_id) < rate
+
+
+def event(logger, category, message, *args, level=logging.INFO, **fields):
+    """
+    Hot-path log record. Nothing is formatted unless the level is enabled and the current
+    request is sampled for `category`; field values may be callables, which are only called
+    when the record is written. Fields are redacted (see `redact`) before formatting.
+    """
+    if level < logging.WARNING and (not logger.isEnabledFor(level) or not sampled(category)):
+        return
+    logger.log(level, message, *args, extra={"category": category, "fields": fields})
+
+
+def _fields(record):
+    fields = dict(getattr(record, 'fields', None) or {})
+    for key, value in vars(record).items():
+        if key not in _RECORD_ATTRIBUTES and key not in ('fields', 'category', 'request_id'):
+            fields[key] = value
+    return {key: redact(value() if callable(value) else value) for key, value in fields.items()}
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the ID of the request being served (the X-Request-ID correlation ID)"""
+
+    def filter(self, record):
+        token = cancellation.get_current()
+        record.request_id = token.request_id if token is not None else None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry["request_id"] = record.request_id
+        if getattr(record, 'category', None):
+            entry["category"] = record.category
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain text with the request ID and fields appended"""
+
+    def __init__(self):
+        super().__init__('%(levelname)s:%(name)s:%(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        if getattr(record, 'request_id', None):
+            line = f"{line} [request_id={record.request_id}]"
+        fields = _fields(record)
+        if fields:
+            line = f"{line} {json.dumps(fields, default=str, ensure_ascii=False)}"
+        return line
+
+
+def configure():
+    """Install the structured handler on the root logger (replaces logging.basicConfig)"""
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+    handler.addFilter(RequestIdFilter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
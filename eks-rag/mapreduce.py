@@ -0,0 +1,142 @@
+import os
+import re
+import logging
+import contextvars
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+MAPREDUCE_SLICES = int(os.environ.get('MAPREDUCE_SLICES', '6'))
+MAPREDUCE_CONCURRENCY = int(os.environ.get('MAPREDUCE_CONCURRENCY', '4'))
+MAPREDUCE_DOCS_PER_SLICE = int(os.environ.get('MAPREDUCE_DOCS_PER_SLICE', '8'))
+MAPREDUCE_MAP_MAX_TOKENS = int(os.environ.get('MAPREDUCE_MAP_MAX_TOKENS', '256'))
+MAPREDUCE_MAX_SERVICE_SLICES = int(os.environ.get('MAPREDUCE_MAX_SERVICE_SLICES', '10'))
+
+# Window used when a map-reduce query has no temporal expression
+MAPREDUCE_DEFAULT_WINDOW = {"gte": os.environ.get('MAPREDUCE_DEFAULT_WINDOW', 'now-1d')}
+
+# Share of the remaining request budget given to the map phase; the rest is for the reduce
+MAP_PHASE_SHARE = float(os.environ.get('MAPREDUCE_MAP_PHASE_SHARE', '0.6'))
+
+PARTITIONS = ("time", "service")
+
+MAP_INSTRUCTIONS = (
+    "You are summarizing one slice of a larger set of vehicle error logs. "
+    "List only the facts from this slice that are relevant to the question, as at most five short bullet points "
+    "(vehicles, error codes, notable sensor readings, timing). If nothing is relevant, answer 'Nothing relevant.'"
+)
+
+REDUCE_INSTRUCTIONS = (
+    "You are given partial summaries, one per slice of the logs, produced from a much larger set of logs. "
+    "Combine them into one answer to the question, noting trends across slices and the most critical issues."
+)
+
+_DATE_MATH_PATTERN = re.compile(r'^now-(\d+)([hdwM])$')
+_UNIT_DELTAS = {'h': timedelta(hours=1), 'd': timedelta(days=1), 'w': timedelta(weeks=1), 'M': timedelta(days=30)}
+
+
+def window_bounds(date_filter, now=None):
+    """
+    Absolute (start, end) datetimes of a "now-N<unit>" range filter.
+    Months are treated as 30 days, which is only used to place slice boundaries.
+    """
+    now = now or datetime.utcnow()
+    match = _DATE_MATH_PATTERN.match((date_filter or MAPREDUCE_DEFAULT_WINDOW).get('gte', ''))
+    if not match:
+        match = _DATE_MATH_PATTERN.match(MAPREDUCE_DEFAULT_WINDOW['gte'])
+    return now - int(match.group(1)) * _UNIT_DELTAS[match.group(2)], now
+
+
+def _iso(moment):
+    return moment.isoformat(timespec='seconds') + "Z"
+
+
+def time_slices(date_filter, n_slices=MAPREDUCE_SLICES, now=None):
+    """Split the window into `n_slices` equal, contiguous time ranges (oldest first)"""
+    start, end = window_bounds(date_filter, now)
+    step = (end - start) / n_slices
+    slices = []
+    for i in range(n_slices):
+        slice_start = start + step * i
+        slice_end = end if i == n_slices - 1 else start + step * (i + 1)
+        slices.append({
+            "label": f"{_iso(slice_start)} to {_iso(slice_end)}",
+            "filters": [{"range": {"timestamp": {"gte": _iso(slice_start), "lt": _iso(slice_end)}}}]
+        })
+    return slices
+
+
+def service_slices(services, date_filter):
+    """One slice per service, each restricted to the query window"""
+    window = date_filter or MAPREDUCE_DEFAULT_WINDOW
+    return [
+        {
+            "label": f"service {service}",
+            "filters": [{"range": {"timestamp": window}}, {"term": {"service": service}}]
+        }
+        for service in services[:MAPREDUCE_MAX_SERVICE_SLICES]
+    ]
+
+
+def services_query(date_filter):
+    """Terms aggregation listing the services that logged in the window"""
+    return {
+        "size": 0,
+        "query": {"bool": {"filter": {"range": {"timestamp": date_filter or MAPREDUCE_DEFAULT_WINDOW}}}},
+        "aggs": {"services": {"terms": {"field": "service", "size": MAPREDUCE_MAX_SERVICE_SLICES}}}
+    }
+
+
+def format_partials(slices, partials):
+    """Context for the reduce step: each slice's partial summary under its label"""
+    return "\n\n".join(
+        f"[{slice_['label']}]\n{partial}"
+        for slice_, partial in zip(slices, partials)
+        if partial
+    )
+
+
+def run(slices, map_fn, reduce_fn, concurrency=MAPREDUCE_CONCURRENCY):
+    """
+    Map every slice concurrently, then reduce the partial summaries.
+
+    `map_fn(slice)` returns a partial summary (or None on failure) and `reduce_fn(partials)`
+    the final answer. Yields progress events as slices complete and finally a
+    {"stage": "done", ...} or {"stage": "error", ...} event. Each task runs in a copy of
+    the caller's context so the request deadline and cancel token apply inside workers.
+    """
+    total = len(slices)
+    partials = [None] * total
+    failed = 0
+    yield {"stage": "map", "completed": 0, "total": total}
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, total)))
+    try:
+        futures = {
+            executor.submit(contextvars.copy_context().run, map_fn, slice_): index
+            for index, slice_ in enumerate(slices)
+        }
+        for completed, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            try:
+                partials[index] = future.result()
+            except Exception as e:
+                logger.error(f"Map step failed for slice {slices[index]['label']}: {e}")
+            if partials[index] is None:
+                failed += 1
+            yield {"stage": "map", "completed": completed, "total": total, "slice": slices[index]["label"]}
+    finally:
+        # Drops queued slices when the consumer stops early (cancel, disconnect)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if failed == total:
+        yield {"stage": "error", "error": "All map steps failed"}
+        return
+
+    yield {"stage": "reduce", "completed": total - failed, "total": total}
+    answer = reduce_fn(partials)
+    if answer is None:
+        yield {"stage": "error", "error": "Reduce step failed"}
+        return
+    yield {"stage": "done", "llm_response": answer, "slices": total, "failed_slices": failed}
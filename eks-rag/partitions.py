@@ -0,0 +1,105 @@
+import os
+import time
+from datetime import datetime, timezone, timedelta
+
+import tailer
+
+INDEX_NAME = os.environ.get('INDEX_NAME', 'error-logs-mock')
+
+# "none" keeps everything in INDEX_NAME. "daily" / "hourly" must match the consumer, which
+# writes each log to INDEX_NAME-YYYY.MM.DD(.HH) by its timestamp. OpenSearch Serverless has
+# no aliases, so searches are routed to the partitions of their time window here.
+INDEX_PARTITIONING = os.environ.get('INDEX_PARTITIONING', 'none').lower()
+
+# Windows spanning more partitions than this search the INDEX_NAME-* pattern instead
+MAX_LISTED_PARTITIONS = int(os.environ.get('INDEX_MAX_LISTED_PARTITIONS', '48'))
+
+PARTITION_FORMATS = {
+    "daily": ("%Y.%m.%d", timedelta(days=1)),
+    "hourly": ("%Y.%m.%d.%H", timedelta(hours=1)),
+}
+
+# Logs stamped slightly ahead of this host's clock still land in a searched partition
+CLOCK_SKEW_SECONDS = float(os.environ.get('INDEX_CLOCK_SKEW_SECONDS', '300'))
+
+# Boolean clauses that do not narrow the documents searched
+_NON_RESTRICTING = ("should", "must_not")
+
+
+def partitioned():
+    return INDEX_PARTITIONING in PARTITION_FORMATS
+
+
+def pattern():
+    """Index expression covering all data"""
+    return f"{INDEX_NAME}-*" if partitioned() else INDEX_NAME
+
+
+def partition_name(moment):
+    """Partition holding documents timestamped at `moment` (an aware datetime)"""
+    suffix_format, _ = PARTITION_FORMATS[INDEX_PARTITIONING]
+    return f"{INDEX_NAME}-{moment.astimezone(timezone.utc).strftime(suffix_format)}"
+
+
+def partitions_between(start, end):
+    """Names of the partitions overlapping [start, end] (epoch seconds), oldest first"""
+    suffix_format, step = PARTITION_FORMATS[INDEX_PARTITIONING]
+    moment = datetime.fromtimestamp(start, timezone.utc)
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if step >= timedelta(days=1):
+        moment = moment.replace(hour=0)
+    last = datetime.fromtimestamp(end, timezone.utc)
+    names = []
+    while moment <= last:
+        names.append(partition_name(moment))
+        moment += step
+    return names
+
+
+def _timestamp_ranges(node):
+    """Range clauses on timestamp that every hit of the query must satisfy"""
+    if isinstance(node, list):
+        return [found for item in node for found in _timestamp_ranges(item)]
+    if not isinstance(node, dict):
+        return []
+    found = []
+    for key, value in node.items():
+        if key == "range" and isinstance(value, dict) and "timestamp" in value:
+            found.append(value["timestamp"])
+        elif key not in _NON_RESTRICTING:
+            found += _timestamp_ranges(value)
+    return found
+
+
+def time_bounds(body, now=None):
+    """(start, end) epoch seconds the query is restricted to; either may be None"""
+    now = time.time() if now is None else now
+    start, end = None, None
+    for bounds in _timestamp_ranges(body.get("query", {})):
+        for op, value in bounds.items():
+            moment = tailer.resolve_time(value, now)
+            if moment is None:
+                continue
+            if op in ("gte", "gt"):
+                start = moment if start is None else max(start, moment)
+            elif op in ("lte", "lt"):
+                end = moment if end is None else min(end, moment)
+    return start, end
+
+
+def index_for(body, now=None):
+    """
+    Index expression for a search: the partitions overlapping the query's time window, or
+    the pattern over all partitions when the query has no (usable) lower time bound.
+    """
+    if not partitioned():
+        return INDEX_NAME
+    now = time.time() if now is None else now
+    start, end = time_bounds(body, now)
+    if start is None:
+        return pattern()
+    latest = now + CLOCK_SKEW_SECONDS
+    names = partitions_between(start, min(end, latest) if end is not None else latest)
+    if not names or len(names) > MAX_LISTED_PARTITIONS:
+        return pattern()
+    return ",".join(names)
@@ -0,0 +1,293 @@
+import os
+import json
+import time
+import bisect
+import socket
+import hmac
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import requests
+
+import deadline as request_deadline
+
+logger = logging.getLogger(__name__)
+
+# Peers are either a static list of base URLs or the pod IPs behind a headless service
+PEERS = [peer.strip().rstrip('/') for peer in os.environ.get('PEER_CACHE_PEERS', '').split(',') if peer.strip()]
+PEER_SERVICE = os.environ.get('PEER_CACHE_SERVICE', '')
+# Peers talk on their own port, which only the headless service and the pod-to-pod network
+# policy expose; the public port does not serve the peer endpoint
+PEER_PORT = int(os.environ.get('PEER_CACHE_PORT', '5001'))
+PEER_REFRESH_SECONDS = float(os.environ.get('PEER_CACHE_REFRESH_SECONDS', '15'))
+
+# This replica's own URL, to recognise the keys it owns (POD_IP comes from the downward API)
+SELF_URL = os.environ.get('PEER_CACHE_SELF', '').rstrip('/') or \
+    (f"http://{os.environ['POD_IP']}:{PEER_PORT}" if os.environ.get('POD_IP') else '')
+
+# Points per peer on the hash ring; more points spread keys more evenly
+RING_REPLICAS = int(os.environ.get('PEER_CACHE_RING_REPLICAS', '64'))
+
+# Peer fetches never wait longer than this, and a failed fetch falls back to a local load
+FETCH_TIMEOUT_SECONDS = float(os.environ.get('PEER_CACHE_FETCH_TIMEOUT_SECONDS', '2'))
+
+# Path of the peer endpoint served by the Flask app
+PEER_PATH = '/peercache'
+
+# Shared secret every peer request carries; without one the peer cache is disabled
+PEER_SECRET = os.environ.get('PEER_CACHE_SECRET', '')
+PEER_SECRET_HEADER = 'X-Peer-Cache-Secret'
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.sha1(value.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hashing of keys onto peers, with RING_REPLICAS virtual points per peer"""
+
+    def __init__(self, peers, replicas=RING_REPLICAS):
+        points = sorted((_hash(f"{peer}#{i}"), peer) for peer in peers for i in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._peers = [peer for _, peer in points]
+
+    def owner(self, key):
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._peers[index]
+
+
+class PeerPicker:
+    """
+    Current peer set and ring. With a headless service the pod IPs are re-resolved in a
+    background thread every PEER_REFRESH_SECONDS, so lookups never wait on DNS.
+    """
+
+    def __init__(self, static_peers=PEERS, service=PEER_SERVICE, self_url=SELF_URL, secret=PEER_SECRET):
+        if (static_peers or service) and not secret:
+            logger.warning("PEER_CACHE_SECRET is not set; the peer cache is disabled")
+            static_peers, service = [], ''
+        self.self_url = self_url
+        self.service = service
+        self.peers = sorted(set(static_peers) | ({self_url} if self_url and static_peers else set()))
+        self.ring = HashRing(self.peers)
+        self._started_pid = None
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        addresses = {info[4][0] for info in socket.getaddrinfo(self.service, PEER_PORT, proto=socket.IPPROTO_TCP)}
+        peers = sorted({f"http://{address}:{PEER_PORT}" for address in addresses} | ({self.self_url} if self.self_url else set()))
+        if peers != self.peers:
+            logger.info(f"Peer cache ring: {len(peers)} peers")
+            self.peers = peers
+            self.ring = HashRing(peers)
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self._resolve()
+            except Exception as e:
+                logger.warning(f"Could not resolve peer cache service {self.service}: {e}")
+            time.sleep(PEER_REFRESH_SECONDS)
+
+    def start(self):
+        with self._lock:
+            if not self.service or self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        threading.Thread(target=self._refresh_loop, name="peer-resolver", daemon=True).start()
+
+    def owner(self, key):
+        """Base URL of the peer owning `key`, or None when this replica owns it"""
+        self.start()
+        owner = self.ring.owner(key)
+        if owner is None or owner == self.self_url:
+            return None
+        return owner
+
+
+class LRUCache:
+    """Size-bounded, TTL-expiring LRU map"""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
+
+class Group:
+    """
+    A named cache whose keys are spread over the replicas (groupcache style).
+
+    Every key has one owning replica on the hash ring. A replica that misses locally asks
+    the owner, which loads the value once however many replicas ask at the same time
+    (single flight), keeps it in its main cache and returns it. Values fetched from peers
+    are also kept in a small "hot" cache. When the owner cannot be reached the value is
+    loaded locally. Keys must be strings carrying everything `loader(key)` needs, and
+    values must be JSON-serialisable; a None value means the load failed and is not cached.
+    """
+
+    def __init__(self, name, loader, ttl_seconds, max_entries, fetch_timeout=FETCH_TIMEOUT_SECONDS):
+        self.name = name
+        self.loader = loader
+        self.main = LRUCache(max_entries, ttl_seconds)
+        self.hot = LRUCache(max(1, max_entries // 8), ttl_seconds)
+        self.fetch_timeout = fetch_timeout
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "peer_hits": 0, "loads": 0, "peer_errors": 0}
+
+    @property
+    def enabled(self):
+        return self.main.ttl > 0 and self.main.max_entries > 0
+
+    def get(self, key, load=None):
+        """
+        Cached value for `key`, fetched from its owner or loaded. `load()` can replace the
+        group's loader for local loads, e.g. to reuse work the caller has already done.
+        """
+        if not self.enabled:
+            return load() if load else self.loader(key)
+
+        value = self.main.get(key)
+        if value is None:
+            value = self.hot.get(key)
+        if value is not None:
+            self.stats["hits"] += 1
+            return value
+
+        owner = picker.owner(key)
+        if owner is not None:
+            value = self._fetch(owner, key)
+            if value is not None:
+                self.stats["peer_hits"] += 1
+                self.hot.put(key, value)
+                return value
+
+        return self._load(key, load)
+
+    def serve(self, key):
+        """Value for a peer's request: this replica is (or was told it is) the owner"""
+        value = self.main.get(key)
+        if value is not None:
+            self.stats["hits"] += 1
+            return value
+        return self._load(key, None)
+
+    def _load(self, key, load):
+        """Load `key` once for all concurrent callers in this process"""
+        with self._lock:
+            call = self._flights.get(key)
+            leader = call is None
+            if leader:
+                call = self._flights[key] = _Call()
+        if not leader:
+            deadline = request_deadline.get_current()
+            call.done.wait(deadline.remaining() if deadline is not None else None)
+            return call.value
+
+        try:
+            self.stats["loads"] += 1
+            call.value = load() if load else self.loader(key)
+            if call.value is not None:
+                self.main.put(key, call.value)
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            call.done.set()
+        return call.value
+
+    def _fetch(self, owner, key):
+        timeout = self.fetch_timeout
+        headers = {'Content-Type': 'application/json', PEER_SECRET_HEADER: PEER_SECRET}
+        deadline = request_deadline.get_current()
+        if deadline is not None:
+            timeout = min(timeout, deadline.remaining())
+            if timeout <= 0:
+                return None
+            # The owner loads under the same remaining budget
+            headers[request_deadline.DEADLINE_HEADER] = f"{deadline.remaining():.3f}"
+        try:
+            response = requests.post(f"{owner}{PEER_PATH}/{self.name}", data=json.dumps({"key": key}),
+                                     headers=headers, timeout=(0.5, timeout))
+            if response.status_code == 200:
+                return response.json().get("value")
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"Peer cache fetch of {self.name} from {owner} failed: {e}")
+        self.stats["peer_errors"] += 1
+        return None
+
+
+def other_peers():
+    """Base URLs of the other replicas (none when the peer cache is disabled)"""
+    picker.start()
+    return [peer for peer in picker.peers if peer != picker.self_url]
+
+
+def post(peer, path, body=None, timeout=FETCH_TIMEOUT_SECONDS):
+    """POST `body` to `path` on a peer's port with the shared secret; the JSON answer, or None"""
+    try:
+        response = requests.post(f"{peer}{path}", json=body, headers={PEER_SECRET_HEADER: PEER_SECRET},
+                                 timeout=(0.5, timeout))
+        return response.json()
+    except (requests.RequestException, ValueError) as e:
+        logger.warning(f"Peer request {path} to {peer} failed: {e}")
+        return None
+
+
+def is_peer_request(environ, headers):
+    """Whether a request reached the peer port and carries the shared secret"""
+    return bool(PEER_SECRET) and str(environ.get('SERVER_PORT')) == str(PEER_PORT) and \
+        hmac.compare_digest(headers.get(PEER_SECRET_HEADER, ''), PEER_SECRET)
+
+
+picker = PeerPicker()
+groups = {}
+
+
+def new_group(name, loader, ttl_seconds, max_entries, fetch_timeout=FETCH_TIMEOUT_SECONDS):
+    groups[name] = Group(name, loader, ttl_seconds, max_entries, fetch_timeout)
+    return groups[name]
+
+
+def key_of(**fields):
+    """Stable string key for a set of JSON-serialisable fields"""
+    return json.dumps(fields, sort_keys=True, separators=(',', ':'))
@@ -0,0 +1,335 @@
+import os
+import re
+import json
+import time
+import fcntl
+import logging
+import tempfile
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Keep answers to pinned and popular questions computed ahead of the requests asking them
+PREWARM_ENABLED = os.environ.get('PREWARM_ENABLED', 'false').lower() == 'true'
+
+# Questions always kept warm, e.g. the example prompts of the UI
+PREWARM_QUERIES_FILE = os.environ.get(
+    'PREWARM_QUERIES_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prewarm_queries.json')
+)
+
+# Most-asked questions kept warm besides the pinned ones: up to PREWARM_POPULAR_QUERIES of
+# the PREWARM_TRACKED_QUERIES distinct questions seen, asked at least PREWARM_MIN_HITS times
+# within the last PREWARM_POPULARITY_WINDOW_SECONDS
+PREWARM_POPULAR_QUERIES = int(os.environ.get('PREWARM_POPULAR_QUERIES', '5'))
+PREWARM_MIN_HITS = int(os.environ.get('PREWARM_MIN_HITS', '3'))
+PREWARM_POPULARITY_WINDOW_SECONDS = float(os.environ.get('PREWARM_POPULARITY_WINDOW_SECONDS', '3600'))
+PREWARM_TRACKED_QUERIES = int(os.environ.get('PREWARM_TRACKED_QUERIES', '1000'))
+
+# Asks remembered per question; more only matter for ranking the very popular ones
+_MAX_COUNTED_HITS = 100
+
+# Answers are recomputed when the index watermark advances, at most every
+# PREWARM_MIN_INTERVAL_SECONDS, and every PREWARM_INTERVAL_SECONDS regardless
+PREWARM_INTERVAL_SECONDS = float(os.environ.get('PREWARM_INTERVAL_SECONDS', '300'))
+PREWARM_MIN_INTERVAL_SECONDS = float(os.environ.get('PREWARM_MIN_INTERVAL_SECONDS', '30'))
+
+# An answer computed before the newest logs were indexed is still served for this long
+# after it was computed, while its refresh runs
+PREWARM_MAX_STALENESS_SECONDS = float(os.environ.get('PREWARM_MAX_STALENESS_SECONDS', '120'))
+
+# Shared by the worker processes of a pod: one of them holds the refresher lock and
+# publishes the answers there, each publishes how often it was asked what, and the counts
+# other replicas send for the questions this one owns are kept there
+PREWARM_STATE_DIR = os.environ.get(
+    'PREWARM_STATE_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+_LOCK_FILE = "eks-rag-prewarm.lock"
+_ANSWERS_FILE = "eks-rag-prewarm-answers.json"
+_POPULARITY_PREFIX = "eks-rag-prewarm-popularity-"
+_PEER_POPULARITY_PREFIX = "eks-rag-prewarm-peer-popularity-"
+
+# Most-asked questions of the pod owned by other replicas, whose counts are sent to their
+# owners every refresh cycle
+_SHARED_QUERIES = 50
+
+
+def normalize(query):
+    return " ".join(query.split())
+
+
+def load_pinned(path):
+    """Pinned questions from `{"queries": [...]}`; none when the file cannot be read"""
+    try:
+        with open(path) as f:
+            queries = json.load(f).get("queries", [])
+    except (OSError, ValueError, AttributeError) as e:
+        logger.warning(f"Could not load pinned queries {path}: {e}")
+        return []
+    return [query for query in queries if isinstance(query, str) and query.strip()]
+
+
+class Popularity:
+    """How often each of at most `max_entries` questions was asked within the last `window` seconds"""
+
+    def __init__(self, window=PREWARM_POPULARITY_WINDOW_SECONDS, max_entries=PREWARM_TRACKED_QUERIES):
+        self.window = window
+        self.max_entries = max_entries
+        self._asks = {}
+        self._lock = threading.Lock()
+
+    def _count(self, asked_at, now):
+        cutoff = now - self.window
+        while asked_at and asked_at[0] < cutoff:
+            asked_at.popleft()
+        return len(asked_at)
+
+    def _rank(self, asked_at, now):
+        """(asks within the window, last asked)"""
+        count = self._count(asked_at, now)
+        return count, asked_at[-1] if count else 0
+
+    def record(self, query, now=None):
+        now = time.time() if now is None else now
+        key = normalize(query)
+        with self._lock:
+            entry = self._asks.get(key)
+            if entry is None:
+                if len(self._asks) >= self.max_entries:
+                    # Make room by forgetting the least recently popular question
+                    del self._asks[min(self._asks, key=lambda k: self._rank(self._asks[k][0], now))]
+                entry = self._asks[key] = (deque(maxlen=_MAX_COUNTED_HITS), query)
+            entry[0].append(now)
+
+    def snapshot(self, now=None):
+        """{question: asks within the window} of the questions asked at all"""
+        now = time.time() if now is None else now
+        with self._lock:
+            counts = {query: self._count(asked_at, now) for asked_at, query in self._asks.values()}
+        return {query: count for query, count in counts.items() if count}
+
+
+def top(snapshots, n, min_hits=PREWARM_MIN_HITS):
+    """Up to `n` most asked questions over several snapshots, each asked at least `min_hits` times"""
+    totals = {}
+    for snapshot in snapshots:
+        for query, count in snapshot.items():
+            totals[normalize(query)] = totals.get(normalize(query), 0) + count
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    return [query for query, count in ranked[:n] if count >= min_hits]
+
+
+class Prewarmer:
+    """
+    Refresh-ahead answers for pinned and popular questions.
+
+    One worker process per pod, the holder of a file lock, refreshes: it calls
+    `compute(query)` for each question this replica owns (`owns(query)`, e.g. its peer
+    cache keys), which warms the embedding and retrieval caches on the way and returns the
+    answer (with the index watermark it was computed at) or None. Refreshes run when the
+    index watermark advances and on a schedule, so the first request after new logs or a
+    restart does not pay for the whole pipeline. The answers are published to a file every
+    worker of the pod reads; answers owned by other replicas come from `fetch(query)`.
+    `lookup` serves an answer while it is current or within its staleness bound.
+
+    Popularity is counted where questions are asked, so the refresher passes the counts of
+    questions other replicas own to `share(counts)`, which delivers them to the owners'
+    `receive`; a question popular anywhere is kept warm by its owner.
+    """
+
+    def __init__(self, compute, index_watermark, pinned=(), popular=PREWARM_POPULAR_QUERIES,
+                 interval=PREWARM_INTERVAL_SECONDS, min_interval=PREWARM_MIN_INTERVAL_SECONDS,
+                 max_staleness=PREWARM_MAX_STALENESS_SECONDS, state_dir=PREWARM_STATE_DIR,
+                 owns=None, fetch=None, share=None):
+        self.compute = compute
+        self.index_watermark = index_watermark
+        self.pinned = list(dict.fromkeys(normalize(query) for query in pinned))
+        self.popular = popular
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_staleness = max_staleness
+        self.state_dir = state_dir
+        self.owns = owns or (lambda query: True)
+        self.fetch = fetch
+        self.share = share
+        self.popularity = Popularity()
+        self.stats = {"refreshes": 0, "computed": 0, "failed": 0, "hits": 0, "stale": 0, "refresher": False}
+        self._answers = {}
+        self._answers_mtime = None
+        self._lock_file = None
+        # Questions kept warm anywhere as of the last cycle; only those are fetched from peers
+        self._wanted = set(self.pinned)
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._started_pid = None
+        index_watermark.on_advance(self._on_advance)
+
+    def _on_advance(self, generation, value):
+        self._wake.set()
+
+    def _path(self, name):
+        return os.path.join(self.state_dir, name)
+
+    def start(self):
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            # A lock or answers inherited from a parent process belong to the parent
+            self._answers, self._answers_mtime, self._lock_file = {}, None, None
+            self.stats["refresher"] = False
+        self.index_watermark.start()
+        threading.Thread(target=self._run, name="prewarmer", daemon=True).start()
+        logger.info(f"Prewarmer started ({len(self.pinned)} pinned, up to {self.popular} popular queries)")
+
+    def record(self, query):
+        """Count a foreground request for `query` towards its popularity"""
+        self.popularity.record(query)
+
+    def local(self, query):
+        """Answer for `query` published in this pod, whatever its age, or None"""
+        path = self._path(_ANSWERS_FILE)
+        try:
+            mtime = os.stat(path).st_mtime
+            with self._lock:
+                if mtime != self._answers_mtime:
+                    with open(path) as f:
+                        self._answers, self._answers_mtime = json.load(f), mtime
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            return self._answers.get(normalize(query))
+
+    def lookup(self, query):
+        """Warm answer for `query`, or None when it is not kept warm or too stale"""
+        self.start()
+        entry = self.local(query)
+        key = normalize(query)
+        if entry is None and self.fetch is not None and key in self._wanted and not self.owns(key):
+            entry = self.fetch(key)
+        if entry is None:
+            return None
+        if entry["watermark"] != self.index_watermark.value and \
+                time.time() - entry["computed_at"] > self.max_staleness:
+            self.stats["stale"] += 1
+            return None
+        self.stats["hits"] += 1
+        return entry
+
+    def _refresher(self):
+        """Whether this process is (or now becomes) the pod's refresher; the lock is held until it exits"""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self._path(_LOCK_FILE), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        self.stats["refresher"] = True
+        logger.info(f"Worker {os.getpid()} refreshes the prewarmed answers of this pod")
+        return True
+
+    def _publish_popularity(self):
+        path = self._path(f"{_POPULARITY_PREFIX}{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self.popularity.snapshot(), f)
+        os.replace(f"{path}.tmp", path)
+
+    def _snapshots(self, prefix):
+        """Popularity snapshots published under `prefix`, dropping those not updated for a window"""
+        snapshots = []
+        now = time.time()
+        for name in os.listdir(self.state_dir):
+            if not (name.startswith(prefix) and name.endswith(".json")):
+                continue
+            path = self._path(name)
+            try:
+                if now - os.stat(path).st_mtime > self.popularity.window:
+                    os.remove(path)
+                    continue
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def receive(self, sender, counts):
+        """Keep the latest {question: asks} a replica sent for questions this one owns"""
+        path = self._path(f"{_PEER_POPULARITY_PREFIX}{re.sub(r'[^A-Za-z0-9.-]', '_', sender)}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(counts, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _share_popularity(self):
+        """Send the pod's counts of popular questions other replicas own to their owners"""
+        if self.share is None:
+            return
+        totals = {}
+        for snapshot in self._snapshots(_POPULARITY_PREFIX):
+            for query, count in snapshot.items():
+                totals[normalize(query)] = totals.get(normalize(query), 0) + count
+        ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+        counts = [(query, count) for query, count in ranked if not self.owns(query)][:_SHARED_QUERIES]
+        if counts:
+            self.share(dict(counts))
+
+    def wanted(self):
+        """Pinned questions, then the popular ones of the pod and those others sent, not already pinned"""
+        snapshots = self._snapshots(_POPULARITY_PREFIX) + self._snapshots(_PEER_POPULARITY_PREFIX)
+        return list(dict.fromkeys(self.pinned + top(snapshots, self.popular)))
+
+    def refresh(self, wanted=None):
+        """
+        Recompute the wanted questions this replica owns once and publish the answers;
+        those no longer wanted are dropped
+        """
+        started = time.monotonic()
+        targets = [query for query in (self.wanted() if wanted is None else wanted) if self.owns(query)]
+        previous = {query: self.local(query) for query in targets}
+        answers, computed = {}, 0
+        for query in targets:
+            try:
+                entry = self.compute(query)
+            except Exception as e:
+                logger.warning(f"Could not prewarm query '{query[:50]}': {e}")
+                entry = None
+            if entry is None:
+                self.stats["failed"] += 1
+                # The previous answer is served until it is too stale
+                if previous[query] is not None:
+                    answers[query] = previous[query]
+                continue
+            computed += 1
+            answers[query] = dict(entry, computed_at=time.time())
+        path = self._path(_ANSWERS_FILE)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(answers, f)
+        os.replace(f"{path}.tmp", path)
+        self.stats["refreshes"] += 1
+        self.stats["computed"] += computed
+        logger.info(f"Prewarmed {computed} of {len(targets)} queries in {time.monotonic() - started:.1f}s")
+
+    def _run(self):
+        if self.index_watermark.value is None:
+            # Compute against the first watermark reading rather than again right after it
+            self._wake.wait(self.min_interval)
+        while True:
+            last_refresh = time.monotonic()
+            self._wake.clear()
+            try:
+                self._publish_popularity()
+                wanted = self.wanted()
+                self._wanted = set(wanted)
+                if self._refresher():
+                    self._share_popularity()
+                    self.refresh(wanted)
+            except Exception as e:
+                logger.warning(f"Prewarm refresh failed: {e}")
+            # Workers that do not refresh still publish their popularity this often
+            self._wake.wait(self.interval if self._lock_file is not None else self.min_interval)
+            # New batches arrive every few seconds; coalesce them into one refresh
+            remaining = self.min_interval - (time.monotonic() - last_refresh)
+            if remaining > 0:
+                time.sleep(remaining)
@@ -0,0 +1,154 @@
+import os
+import mmap
+import time
+import fcntl
+import struct
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Bedrock embedding calls per second allowed for the whole pod (all gunicorn workers).
+# Bedrock quotas are per account and region, so this is roughly the quota divided by replicas.
+RATE_LIMIT_ENABLED = os.environ.get('BEDROCK_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+MAX_RATE = float(os.environ.get('BEDROCK_RATE_LIMIT', '20'))
+MIN_RATE = float(os.environ.get('BEDROCK_RATE_LIMIT_MIN', '1'))
+BURST = float(os.environ.get('BEDROCK_RATE_LIMIT_BURST', '10'))
+
+# AIMD: halve the rate on throttling (at most once per interval, so one storm seen by many
+# workers counts once) and add back this many calls/second for every second without throttling
+DECREASE_FACTOR = float(os.environ.get('BEDROCK_RATE_DECREASE_FACTOR', '0.5'))
+DECREASE_INTERVAL_SECONDS = float(os.environ.get('BEDROCK_RATE_DECREASE_INTERVAL_SECONDS', '1'))
+INCREASE_PER_SECOND = float(os.environ.get('BEDROCK_RATE_INCREASE_PER_SECOND', '1'))
+
+# Shared memory on Linux; the state only has to outlive workers, not the pod
+STATE_DIR = os.environ.get('RATE_LIMIT_STATE_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+
+# tokens, updated_at, rate, last_decrease_at, last_increase_at
+_STATE = struct.Struct('<ddddd')
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a call would have to queue longer than the caller can wait"""
+
+
+class SharedTokenBucket:
+    """
+    Token bucket whose state lives in a small memory-mapped file, so every worker
+    process of the pod draws from the same budget. Cross-process access is serialised
+    with flock (per open file, hence opened again in each process), and threads of one
+    process with a lock.
+
+    A caller that finds no token reserves the next one (the balance goes negative) and
+    sleeps until it is due, so waiting callers are served in arrival order at the bucket's
+    rate instead of failing or polling.
+    """
+
+    def __init__(self, name, max_rate=MAX_RATE, min_rate=MIN_RATE, burst=BURST):
+        self.name = name
+        self.path = os.path.join(STATE_DIR, f"eks-rag-ratelimit-{name}")
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self._thread_lock = threading.Lock()
+        self._pid = None
+        self._file = None
+        self._map = None
+
+    def _open(self):
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        file = os.fdopen(fd, 'r+b')
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size < _STATE.size:
+                now = time.monotonic()
+                file.truncate(_STATE.size)
+                file.seek(0)
+                file.write(_STATE.pack(self.burst, now, self.max_rate, 0.0, now))
+                file.flush()
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+        self._file = file
+        self._map = mmap.mmap(fd, _STATE.size)
+        self._pid = os.getpid()
+
+    @contextmanager
+    def _locked_state(self):
+        """Yield the current state as a dict; changes to it are written back"""
+        with self._thread_lock:
+            self._open()
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                tokens, updated_at, rate, last_decrease_at, last_increase_at = _STATE.unpack(self._map[:_STATE.size])
+                now = time.monotonic()
+                rate = min(self.max_rate, max(self.min_rate, rate))
+                state = {
+                    "now": now,
+                    # Refill for the time since the last update (monotonic time is system-wide)
+                    "tokens": min(self.burst, tokens + max(0.0, now - updated_at) * rate),
+                    "rate": rate,
+                    "last_decrease_at": last_decrease_at,
+                    "last_increase_at": last_increase_at,
+                }
+                yield state
+                self._map[:_STATE.size] = _STATE.pack(state["tokens"], now, state["rate"],
+                                                      state["last_decrease_at"], state["last_increase_at"])
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def acquire(self, timeout=None):
+        """
+        Take one token, sleeping until it is due. Raises RateLimitTimeout (without
+        taking a token) when that would be later than `timeout` seconds from now.
+        """
+        with self._locked_state() as state:
+            wait = 0.0 if state["tokens"] >= 1 else (1 - state["tokens"]) / state["rate"]
+            if timeout is not None and wait > timeout:
+                raise RateLimitTimeout(
+                    f"{self.name} rate limit ({state['rate']:.1f}/s) would queue the call for {wait:.1f}s")
+            state["tokens"] -= 1
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def on_throttle(self):
+        """Multiplicative decrease after the service throttled a call"""
+        with self._locked_state() as state:
+            if state["now"] - state["last_decrease_at"] < DECREASE_INTERVAL_SECONDS:
+                return
+            previous = state["rate"]
+            state["rate"] = max(self.min_rate, previous * DECREASE_FACTOR)
+            state["last_decrease_at"] = state["now"]
+            state["last_increase_at"] = state["now"]
+            # Drop saved-up tokens so the lower rate takes effect immediately
+            state["tokens"] = min(state["tokens"], 1.0)
+        logger.warning(f"{self.name} throttled: rate limit lowered from {previous:.1f}/s to {state['rate']:.1f}/s")
+
+    def on_success(self):
+        """Additive increase while calls go through"""
+        with self._locked_state() as state:
+            elapsed = min(1.0, state["now"] - state["last_increase_at"])
+            state["rate"] = min(self.max_rate, state["rate"] + INCREASE_PER_SECOND * elapsed)
+            state["last_increase_at"] = state["now"]
+
+    def stats(self):
+        with self._locked_state() as state:
+            return {"rate": round(state["rate"], 2), "tokens": round(state["tokens"], 2)}
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def bucket(name):
+    """Shared bucket for `name` (e.g. one per Bedrock region), or None when disabled"""
+    if not RATE_LIMIT_ENABLED:
+        return None
+    with _buckets_lock:
+        if name not in _buckets:
+            _buckets[name] = SharedTokenBucket(name)
+        return _buckets[name]
@@ -0,0 +1,140 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# How often the background checker refreshes each dependency's status
+CHECK_INTERVAL_SECONDS = float(os.environ.get('READINESS_CHECK_INTERVAL_SECONDS', '15'))
+
+# A cached status older than this counts as failed (e.g. the checker thread is stuck)
+STALE_AFTER_SECONDS = float(os.environ.get('READINESS_STALE_AFTER_SECONDS', str(3 * CHECK_INTERVAL_SECONDS)))
+
+# Failed checks in a row before a healthy dependency is reported unhealthy, so one slow
+# probe of one worker does not take the pod out of the service
+FAILURES_BEFORE_UNHEALTHY = int(os.environ.get('READINESS_FAILURES_BEFORE_UNHEALTHY', '2'))
+
+# Dependencies that must be healthy for the pod to receive traffic. vLLM is shared by
+# every replica, so by default it is only reported: failing readiness on it would take
+# all pods out of the service at once instead of returning errors for generation only.
+REQUIRED = [
+    name.strip()
+    for name in os.environ.get('READINESS_REQUIRED', 'opensearch,bedrock').split(',')
+    if name.strip()
+]
+
+
+class DependencyMonitor:
+    """
+    Cached health of the service's downstream dependencies.
+
+    Each registered check runs in a background thread every CHECK_INTERVAL_SECONDS, so
+    probes only read the cache and never call AWS or vLLM themselves. Successful calls
+    made while serving traffic are recorded too; a dependency that was used successfully
+    within the interval is not probed again; checks that cost money per call can be
+    registered with a longer interval, so they only run when traffic has not used the
+    dependency for that long. The pod becomes ready once every required dependency has
+    passed a check, which also leaves its connections warmed up.
+    """
+
+    def __init__(self, required=REQUIRED, interval=CHECK_INTERVAL_SECONDS, stale_after=STALE_AFTER_SECONDS):
+        self.required = list(required)
+        self.interval = interval
+        self.stale_after = stale_after
+        self._checks = {}
+        self._intervals = {}
+        self._status = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._started_pid = None
+
+    def register(self, name, check, interval=None):
+        """
+        `check()` returns None when healthy and raises (or returns an error string) otherwise.
+        It runs when the dependency has not been used successfully for `interval` seconds
+        (the monitor's interval by default).
+        """
+        self._checks[name] = check
+        self._intervals[name] = interval or self.interval
+
+    def record_success(self, name):
+        """Note a successful call made while serving a request"""
+        with self._lock:
+            self._status[name] = {"ok": True, "checked_at": time.time(), "source": "traffic"}
+            self._failures[name] = 0
+
+    def start(self):
+        """Start the checker in this process (idempotent, and safe to call again after a fork)"""
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            # Statuses inherited from a parent process say nothing about this one's connections
+            self._status = {}
+            self._failures = {}
+        threading.Thread(target=self._run, name="dependency-monitor", daemon=True).start()
+        logger.info(f"Dependency monitor started (required: {', '.join(self.required) or 'none'})")
+
+    def _run(self):
+        while True:
+            for name in self._checks:
+                if not self._recently_ok(name):
+                    self._check(name)
+            time.sleep(self.interval)
+
+    def _recently_ok(self, name):
+        with self._lock:
+            status = self._status.get(name)
+        return bool(status and status["ok"] and time.time() - status["checked_at"] < self._intervals[name])
+
+    def _check(self, name):
+        started = time.monotonic()
+        try:
+            error = self._checks[name]()
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        status = {
+            "ok": not error,
+            "checked_at": time.time(),
+            "latency_ms": round((time.monotonic() - started) * 1000),
+            "source": "probe"
+        }
+        if error:
+            status["error"] = error
+        with self._lock:
+            previous = self._status.get(name)
+            failures = self._failures[name] = self._failures.get(name, 0) + 1 if error else 0
+            if error and previous is not None and previous["ok"] and failures < FAILURES_BEFORE_UNHEALTHY:
+                # Still healthy until the next check confirms the failure
+                status["ok"] = True
+                status["consecutive_failures"] = failures
+            self._status[name] = status
+        if previous is None or previous["ok"] != status["ok"]:
+            log = logger.info if status["ok"] else logger.warning
+            log(f"Dependency {name} is {'healthy' if status['ok'] else 'unhealthy'}"
+                + (f": {error}" if error else ""))
+
+    def report(self):
+        """(ready, per-dependency status) from the cache; never calls a dependency"""
+        now = time.time()
+        with self._lock:
+            statuses = {name: dict(status) for name, status in self._status.items()}
+        dependencies = {}
+        ready = True
+        for name in self._checks:
+            status = statuses.get(name, {"ok": False, "error": "not checked yet"})
+            stale_after = self.stale_after + self._intervals[name] - self.interval
+            if status.get("checked_at") and now - status["checked_at"] > stale_after:
+                status["ok"] = False
+                status["error"] = "status is stale"
+            if "checked_at" in status:
+                status["age_seconds"] = round(now - status.pop("checked_at"), 1)
+            status["required"] = name in self.required
+            if status["required"] and not status["ok"]:
+                ready = False
+            dependencies[name] = status
+        return ready, dependencies
+
+
+monitor = DependencyMonitor()
@@ -0,0 +1,123 @@
+import os
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Curated remediation snippets per error_code, generated offline and versioned with the file
+KNOWLEDGE_FILE = os.environ.get(
+    'REMEDIATION_KNOWLEDGE_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'remediation_knowledge.json')
+)
+
+# Generate snippets on first sight for error codes missing from the file
+LAZY_GENERATION_ENABLED = os.environ.get('REMEDIATION_LAZY_GENERATION', 'true').lower() == 'true'
+LAZY_MAX_ENTRIES = int(os.environ.get('REMEDIATION_LAZY_MAX_ENTRIES', '200'))
+LAZY_MAX_TOKENS = int(os.environ.get('REMEDIATION_LAZY_MAX_TOKENS', '120'))
+
+INSTRUCTIONS = (
+    "A 'Remediation reference' section gives the canonical guidance for each error code. "
+    "Refer to it briefly instead of rewriting generic advice; spend your answer on what the incidents "
+    "have in common, which vehicles are most at risk and what to do first."
+)
+
+LAZY_PROMPT_INSTRUCTIONS = (
+    "Write the standard remediation guidance for this vehicle error code in at most two short sentences. "
+    "No preamble, no vehicle-specific details."
+)
+
+
+class RemediationKnowledge:
+    """
+    Remediation snippets keyed by error_code (and optionally vehicle_state).
+
+    Entries come from the versioned knowledge file. Codes missing from it are generated
+    once in the background through `generator(prompt, context)` and cached for the life of
+    the process, tagged with the file version so a new file invalidates them.
+    """
+
+    def __init__(self, path=KNOWLEDGE_FILE, generator=None):
+        self.version = "none"
+        self.entries = {}
+        self._generator = generator
+        self._generated = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1) if generator else None
+        self._load(path)
+
+    def _load(self, path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            self.version = data.get("version", "unversioned")
+            self.entries = data.get("entries", {})
+            logger.info(f"Loaded remediation knowledge v{self.version} with {len(self.entries)} error codes")
+        except Exception as e:
+            logger.error(f"Failed to load remediation knowledge from {path}: {e}")
+
+    def snippet(self, error_code, vehicle_state=None, message=None):
+        """
+        Canonical guidance for an error code, or None if none is available yet.
+        An unknown code with an example `message` is queued for lazy generation.
+        """
+        entry = self.entries.get(error_code)
+        if entry is None:
+            with self._lock:
+                generated = self._generated.get((self.version, error_code))
+            if generated is None:
+                self._schedule_generation(error_code, message)
+                return None
+            return generated
+
+        text = f"{entry['title']}: {entry['remediation']}"
+        state_note = entry.get("by_state", {}).get(vehicle_state)
+        if state_note:
+            text = f"{text} When {vehicle_state}: {state_note}"
+        return text
+
+    def reference(self, incidents):
+        """
+        Remediation reference section for the given (error_code, vehicle_state, message)
+        incidents, one line per distinct code/state pair. Empty string if nothing is known.
+        """
+        lines = []
+        seen = set()
+        for error_code, vehicle_state, message in incidents:
+            if (error_code, vehicle_state) in seen:
+                continue
+            seen.add((error_code, vehicle_state))
+            text = self.snippet(error_code, vehicle_state, message)
+            if text:
+                lines.append(f"- {error_code}: {text}")
+        if not lines:
+            return ""
+        return "Remediation reference:\n" + "\n".join(lines)
+
+    def _schedule_generation(self, error_code, message):
+        if not (LAZY_GENERATION_ENABLED and self._executor and message):
+            return
+        key = (self.version, error_code)
+        with self._lock:
+            if key in self._pending or len(self._generated) >= LAZY_MAX_ENTRIES:
+                return
+            self._pending.add(key)
+        self._executor.submit(self._generate, key, error_code, message)
+
+    def _generate(self, key, error_code, message):
+        try:
+            text = self._generator(
+                f"Remediation guidance for error code {error_code}",
+                f"Error code: {error_code}\nExample message: {message}",
+            )
+            if text:
+                with self._lock:
+                    self._generated[key] = text.strip()
+                logger.info(f"Generated remediation snippet for {error_code} (knowledge v{self.version})")
+        except Exception as e:
+            logger.warning(f"Failed to generate remediation snippet for {error_code}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
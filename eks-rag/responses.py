@@ -0,0 +1,72 @@
+import os
+import gzip
+import json
+import logging
+
+from flask import Response, request
+
+logger = logging.getLogger(__name__)
+
+# Optional: orjson for faster encoding, brotli for br compression (gzip is always available)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed; compressing them costs more than it saves
+COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '4'))
+
+
+def dumps(payload):
+    """Serialize to compact JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def _accepted_encodings():
+    """Content codings the client accepts (those with q=0 are refused)"""
+    accepted = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                pass
+        if coding and quality > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+
+def _compress(body):
+    """(body, content coding) for the best coding the client accepts, or (body, None)"""
+    if len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    accepted = _accepted_encodings()
+    if brotli is not None and 'br' in accepted:
+        return brotli.compress(body, quality=BROTLI_QUALITY), 'br'
+    if 'gzip' in accepted:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), 'gzip'
+    return body, None
+
+
+def json_response(payload):
+    """
+    JSON response, a drop-in for flask.jsonify: compact encoding, and gzip or br
+    compression when the client asks for it and the body is large enough to benefit
+    """
+    body, coding = _compress(dumps(payload))
+    response = Response(body, mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    if coding:
+        response.headers['Content-Encoding'] = coding
+    return response
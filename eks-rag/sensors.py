@@ -0,0 +1,291 @@
+import os
+import re
+import time
+import logging
+import threading
+
+import numpy as np
+
+import aggregation
+import hottier
+import tailer
+
+logger = logging.getLogger(__name__)
+
+# Sensor readings of recent logs kept in memory for exact threshold queries. A row costs
+# 40 bytes (timestamp, five float32 readings, four keyword codes), so the default
+# 200000 rows take about 8 MB per worker.
+SENSOR_STORE_ENABLED = os.environ.get('SENSOR_STORE_ENABLED', 'false').lower() == 'true'
+SENSOR_WINDOW_SECONDS = float(os.environ.get('SENSOR_WINDOW_HOURS', '24')) * 3600
+SENSOR_MAX_ROWS = int(os.environ.get('SENSOR_MAX_ROWS', '200000'))
+
+# Rows and groups returned by a scan
+SENSOR_TOP_N = int(os.environ.get('SENSOR_TOP_N', '10'))
+SENSOR_MAX_GROUPS = int(os.environ.get('SENSOR_MAX_GROUPS', '20'))
+
+FIELDS = aggregation.NUMERIC_FIELDS
+KEY_FIELDS = aggregation.GROUP_FIELDS
+
+OPERATORS = {
+    ">": np.greater, ">=": np.greater_equal,
+    "<": np.less, "<=": np.less_equal,
+    "=": np.equal
+}
+
+# Ways questions name each reading, longest first so "battery voltage" wins over "voltage"
+_FIELD_PHRASES = {
+    "engine_temp": r"engine\s+temp(?:erature)?s?|coolant\s+temp(?:erature)?s?",
+    "battery_voltage": r"battery\s+voltages?|voltages?",
+    "fuel_pressure": r"fuel\s+pressures?",
+    "speed": r"speeds?",
+    "battery_level": r"battery\s+(?:level|charge)s?|state\s+of\s+charge",
+}
+_COMPARATORS = {
+    "above": ">", "over": ">", "greater than": ">", "more than": ">", "higher than": ">",
+    "exceeding": ">", "exceeds": ">", "at least": ">=", ">=": ">=", ">": ">",
+    "below": "<", "under": "<", "less than": "<", "lower than": "<", "at most": "<=", "<=": "<=", "<": "<"
+}
+_COMPARATOR_PATTERN = "|".join(sorted((re.escape(c) for c in _COMPARATORS), key=len, reverse=True))
+_THRESHOLD_PATTERNS = {
+    field: re.compile(rf"\b(?:{phrase})\b(?:\W+\w+){{0,3}}?\W*({_COMPARATOR_PATTERN})\s*(-?\d+(?:\.\d+)?)")
+    for field, phrase in _FIELD_PHRASES.items()
+}
+# A bare "battery" threshold is told apart by its unit: volts or percent
+_BATTERY_PATTERN = re.compile(
+    rf"\bbattery\b(?:\W+\w+){{0,3}}?\W*({_COMPARATOR_PATTERN})\s*(-?\d+(?:\.\d+)?)\s*(v|volts?|%)(?!\w)")
+_BATTERY_UNITS = {"v": "battery_voltage", "volt": "battery_voltage", "volts": "battery_voltage", "%": "battery_level"}
+_WINDOW_PATTERN = re.compile(r'\b(?:last|past)\s+(?:(\d+)\s+)?(minute|hour|day|week)s?\b')
+_WINDOW_UNITS = {'minute': ('m', 60), 'hour': ('h', 3600), 'day': ('d', 86400), 'week': ('w', 7 * 86400)}
+_GROUP_PATTERN = re.compile(r'\b(?:by|per|each|which)\s+(vehicle|service|error code|error|state)s?\b')
+_GROUP_FIELDS = {'vehicle': 'vehicle_id', 'service': 'service', 'error code': 'error_code',
+                 'error': 'error_code', 'state': 'vehicle_state'}
+
+# Parts of a question that ask for more than the readings, e.g. "what immediate actions
+# should be taken?"
+_FOLLOW_ON_PATTERN = re.compile(
+    r'\b(?:why|should|actions?|recommend\w*|suggest\w*|explain\w*|caus\w*|diagnos\w*|communicat\w*|fix\w*)\b')
+
+
+def parse_predicates(text):
+    """Reading thresholds a question names, e.g. "battery below 11.5V", as [(field, op, value)]"""
+    text = text.lower()
+    predicates = []
+    for field, pattern in _THRESHOLD_PATTERNS.items():
+        for match in pattern.finditer(text):
+            predicate = (field, _COMPARATORS[match.group(1)], float(match.group(2)))
+            if predicate not in predicates:
+                predicates.append(predicate)
+    for match in _BATTERY_PATTERN.finditer(text):
+        predicate = (_BATTERY_UNITS[match.group(3)], _COMPARATORS[match.group(1)], float(match.group(2)))
+        if predicate not in predicates:
+            predicates.append(predicate)
+    return predicates
+
+
+def parse_query(text):
+    """
+    A threshold question, e.g. "engine temperature above 110°C in the last hour", as
+    {"since", "window", "predicates", "group_by"}, or None when the text has no reading
+    threshold or no time window.
+    """
+    text = text.lower()
+    predicates = parse_predicates(text)
+    window = _WINDOW_PATTERN.search(text)
+    if not predicates or not window:
+        return None
+    count = int(window.group(1) or 1)
+    unit, seconds = _WINDOW_UNITS[window.group(2)]
+    group = _GROUP_PATTERN.search(text)
+    return {
+        "since": count * seconds,
+        "window": f"now-{count}{unit}",
+        "predicates": predicates,
+        "group_by": _GROUP_FIELDS[group.group(1)] if group else "vehicle_id"
+    }
+
+
+def asks_more(text):
+    """
+    True when a threshold question also asks something the scan alone does not answer: a
+    sentence without a threshold or window, or a follow-on such as "why" or "what actions"
+    """
+    text = text.lower()
+    if _FOLLOW_ON_PATTERN.search(text):
+        return True
+    sentences = [part for part in re.split(r'[?.!;]+', text) if part.strip()]
+    return any(not parse_predicates(part) and not _WINDOW_PATTERN.search(part) for part in sentences)
+
+
+class SensorStore:
+    """
+    Columnar copy of the sensor readings of the last SENSOR_WINDOW_SECONDS, fed by the
+    index tailer.
+
+    Rows live in ring buffers of SENSOR_MAX_ROWS entries: a float64 timestamp column, a
+    float32 matrix of the readings (NaN when missing) and int32 dictionary codes of the
+    keyword fields, so memory is fixed when the store is created. When the ring is full the
+    oldest rows are overwritten and windows reaching back before them are no longer
+    answered here. Scans are vectorized: one boolean mask per predicate, then top-N and
+    group-by statistics over the matching rows.
+    """
+
+    def __init__(self, log_tailer, window_seconds=SENSOR_WINDOW_SECONDS, max_rows=SENSOR_MAX_ROWS):
+        self.tailer = log_tailer
+        self.window_seconds = window_seconds
+        self.max_rows = max_rows
+        self.timestamps = np.full(max_rows, -np.inf)
+        self.values = np.full((max_rows, len(FIELDS)), np.nan, dtype=np.float32)
+        self.keys = np.full((max_rows, len(KEY_FIELDS)), -1, dtype=np.int32)
+        self.dictionaries = [hottier.Dictionary() for _ in KEY_FIELDS]
+        self._position = 0
+        self._lock = threading.Lock()
+
+        # Newest row overwritten while still inside the window
+        self.evicted_through = -np.inf
+
+        fields = [f"sensor_readings.{field}" for field in FIELDS] + list(KEY_FIELDS)
+        log_tailer.subscribe(self.add, fields, window_seconds)
+
+    def covers(self, since, now=None):
+        """True when every reading since `since` (epoch seconds) is held"""
+        now = time.time() if now is None else now
+        return since >= now - self.window_seconds and since > self.evicted_through and self.tailer.covers(since)
+
+    def add(self, docs):
+        """Tailer listener: append a batch of documents to the ring"""
+        if not docs:
+            return
+        count = min(len(docs), self.max_rows)
+        timestamps = np.array([doc["timestamp"] for doc in docs[-count:]])
+        values = np.full((count, len(FIELDS)), np.nan, dtype=np.float32)
+        keys = np.empty((count, len(KEY_FIELDS)), dtype=np.int32)
+        for row, doc in enumerate(docs[-count:]):
+            source = doc["source"]
+            readings = source.get("sensor_readings") or {}
+            for col, field in enumerate(FIELDS):
+                value = readings.get(field)
+                if value is not None:
+                    values[row, col] = value
+            for col, field in enumerate(KEY_FIELDS):
+                keys[row, col] = self.dictionaries[col].encode(source.get(field))
+
+        slots = (self._position + np.arange(count)) % self.max_rows
+        cutoff = time.time() - self.window_seconds
+        with self._lock:
+            overwritten = self.timestamps[slots]
+            live = overwritten[overwritten >= cutoff]
+            if len(docs) > count:
+                live = np.append(live, [doc["timestamp"] for doc in docs[:-count]])
+            if live.size:
+                self.evicted_through = max(self.evicted_through, float(live.max()))
+            self.timestamps[slots] = timestamps
+            self.values[slots] = values
+            self.keys[slots] = keys
+            self._position = int((self._position + count) % self.max_rows)
+
+    def _decode(self, col, codes):
+        names = {code: value for value, code in self.dictionaries[col].codes.items()}
+        return [names.get(int(code), "N/A") for code in codes]
+
+    def scan(self, since, predicates, group_by="vehicle_id", order_by=None, n=SENSOR_TOP_N,
+             max_groups=SENSOR_MAX_GROUPS, until=None):
+        """
+        Rows since `since` (epoch seconds) matching every (field, op, value) predicate.
+
+        `field` is a reading or a keyword field ("=" only). Returns the number of rows
+        scanned and matched, the top `n` rows by `order_by` (by default the first reading
+        predicate, extreme end first) and per-group count and min/max/mean of that reading.
+        """
+        numeric = [p for p in predicates if p[0] in FIELDS]
+        order_by = order_by or (numeric[0][0] if numeric else FIELDS[0])
+        descending = not numeric or numeric[0][1] not in ("<", "<=")
+        order_col = FIELDS.index(order_by)
+        group_col = KEY_FIELDS.index(group_by)
+
+        with self._lock:
+            mask = self.timestamps >= since
+            if until is not None:
+                mask &= self.timestamps <= until
+            scanned = int(mask.sum())
+            for field, op, value in predicates:
+                if field in FIELDS:
+                    mask &= OPERATORS[op](self.values[:, FIELDS.index(field)], value)
+                else:
+                    col = KEY_FIELDS.index(field)
+                    mask &= self.keys[:, col] == self.dictionaries[col].codes.get(value, -2)
+            rows = np.flatnonzero(mask)
+            timestamps = self.timestamps[rows]
+            values = self.values[rows]
+            keys = self.keys[rows]
+
+        result = {"scanned": scanned, "matched": int(rows.size), "order_by": order_by, "top": [], "groups": []}
+        if rows.size == 0:
+            return result
+
+        ordering = values[:, order_col] if descending else -values[:, order_col]
+        ordering = np.where(np.isnan(ordering), -np.inf, ordering)
+        top = np.argsort(-ordering, kind='stable')[:n]
+        decoded = [self._decode(col, keys[top, col]) for col in range(len(KEY_FIELDS))]
+        for i, row in enumerate(top):
+            entry = {"timestamp": tailer.iso(float(timestamps[row]))}
+            entry.update({field: decoded[col][i] for col, field in enumerate(KEY_FIELDS)})
+            entry.update({field: round(float(values[row, col]), 2)
+                          for col, field in enumerate(FIELDS) if not np.isnan(values[row, col])})
+            result["top"].append(entry)
+
+        codes, inverse, counts = np.unique(keys[:, group_col], return_inverse=True, return_counts=True)
+        column = values[:, order_col].astype(np.float64)
+        present = ~np.isnan(column)
+        sums = np.bincount(inverse, weights=np.where(present, column, 0.0), minlength=len(codes))
+        n_present = np.bincount(inverse, weights=present, minlength=len(codes))
+        mins = np.full(len(codes), np.inf)
+        maxs = np.full(len(codes), -np.inf)
+        np.fmin.at(mins, inverse, column)
+        np.fmax.at(maxs, inverse, column)
+        extreme = maxs if descending else -mins
+        order = np.lexsort((-counts, -extreme))[:max_groups]
+        names = self._decode(group_col, codes[order])
+        for name, g in zip(names, order):
+            group = {"key": name, "count": int(counts[g])}
+            if n_present[g] > 0:
+                group[order_by] = {"min": round(float(mins[g]), 2), "max": round(float(maxs[g]), 2),
+                                   "mean": round(float(sums[g] / n_present[g]), 2)}
+            result["groups"].append(group)
+        result["other_groups"] = max(0, len(codes) - max_groups)
+        return result
+
+    def answer(self, parsed, now=None):
+        """Scan for a parsed question; None when its window is not held in memory"""
+        now = time.time() if now is None else now
+        since = now - parsed["since"]
+        if not self.covers(since, now):
+            return None
+        result = self.scan(since, parsed["predicates"], group_by=parsed["group_by"])
+        result["window"] = parsed["window"]
+        result["predicates"] = [{"field": f, "op": op, "value": v} for f, op, v in parsed["predicates"]]
+        result["group_by"] = parsed["group_by"]
+        return result
+
+    def stats(self):
+        return {"rows": int(np.isfinite(self.timestamps).sum()), "capacity": self.max_rows,
+                "watermark": self.tailer.watermark}
+
+
+def format_answer(result):
+    """Plain-text answer for a scan result, e.g. for the llm_response field"""
+    condition = " and ".join(f"{p['field']} {p['op']} {p['value']:g}" for p in result["predicates"])
+    order_by = result["order_by"]
+    lines = [f"{result['matched']} of {result['scanned']} readings since {result['window']} "
+             f"had {condition}, across {len(result['groups']) + result.get('other_groups', 0)} "
+             f"{result['group_by']} values."]
+    if result["groups"]:
+        lines.append(f"By {result['group_by']}:")
+        for group in result["groups"]:
+            stats = group.get(order_by)
+            detail = f", {order_by} {stats['min']}-{stats['max']} (mean {stats['mean']})" if stats else ""
+            lines.append(f"- {group['key']}: {group['count']} readings{detail}")
+    if result["top"]:
+        first = result["top"][0]
+        lines.append(f"Most extreme: {first.get('vehicle_id')} with {order_by} {first.get(order_by)} "
+                     f"at {first['timestamp']} ({first.get('error_code')}).")
+    return "\n".join(lines)
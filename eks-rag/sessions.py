@@ -0,0 +1,295 @@
+import os
+import re
+import json
+import time
+import tempfile
+import threading
+from datetime import datetime
+
+import peercache
+import sensors
+import standing
+import tailer
+
+# Conversations are kept by the replica owning their ID on the peer cache ring, one file
+# each in SESSION_DIR, shared by the workers of its pod; other replicas read and write them
+# there over the peer port. Up to SESSION_MAX_SESSIONS per pod, dropped after
+# SESSION_TTL_SECONDS without a turn.
+SESSION_DIR = os.environ.get('SESSION_DIR', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'eks-rag-sessions'))
+SESSION_TTL_SECONDS = float(os.environ.get('SESSION_TTL_SECONDS', '1800'))
+SESSION_MAX_SESSIONS = int(os.environ.get('SESSION_MAX_SESSIONS', '1000'))
+
+# Path of the peer endpoint serving the conversations this replica owns
+PEER_PATH = '/sessions'
+
+# Expired and surplus conversations are swept at most this often per worker
+_SWEEP_SECONDS = 60
+
+# Documents retrieved (and put in the context) when a conversation starts a retrieval;
+# follow-ups narrow this set in memory
+SESSION_CANDIDATES = int(os.environ.get('SESSION_CANDIDATES', '10'))
+
+# Follow-up turns kept in the prompt after the opening turn; older ones are dropped
+SESSION_MAX_TURNS = int(os.environ.get('SESSION_MAX_TURNS', '6'))
+
+# Static so that every turn of every conversation shares it as a prompt prefix; the current
+# time goes into the user messages instead
+SYSTEM_MESSAGE = (
+    "You are a helpful assistant for a vehicle fleet's error logs. The first message holds "
+    "the logs retrieved for this conversation, numbered from 1; follow-up questions refer "
+    "to them. Use the current time given with each question to interpret time ranges."
+)
+
+# Follow-ups either point back at the previous answer ("those", "them") or open with a
+# connective and add a filter ("and only while MOVING"); anything else retrieves anew.
+# Comparators ("above 110") and generic words ("same", "they") do not count as references.
+_REFERENCE_PATTERN = re.compile(r'\b(?:those|these|them|previous)\b', re.IGNORECASE)
+_CONNECTIVE_PATTERN = re.compile(r'^\s*(?:and|also|what about|how about|only|just)\b', re.IGNORECASE)
+# "what about VIN-1001" switches to other documents of the conversation; other follow-ups
+# narrow the documents the previous turn matched
+_SWITCH_PATTERN = re.compile(r'^\s*(?:what|how) about\b', re.IGNORECASE)
+_VEHICLE_PATTERN = re.compile(r'\bVIN-\d+\b', re.IGNORECASE)
+
+
+def is_valid_session_id(session_id):
+    return isinstance(session_id, str) and bool(re.match(r'^[A-Za-z0-9_.:-]{1,128}$', session_id))
+
+
+def is_follow_up(query, date_filter=None):
+    """Whether a question refers back to earlier answers of its conversation"""
+    return parse_refinement(query, date_filter) is not None
+
+
+def parse_refinement(query, date_filter=None, now=None):
+    """
+    Filters of a follow-up that can be checked against the conversation's documents, or
+    None when the question asks something new or needs fields the documents do not carry
+    (locations). `date_filter` is the follow-up's own parsed time window.
+    """
+    reference = _REFERENCE_PATTERN.search(query) is not None
+    if not reference and not _CONNECTIVE_PATTERN.search(query):
+        return None
+    filters = standing.parse_filters(query)
+    if filters.pop("geo") is not None:
+        return None
+    vehicles = sorted({match.upper() for match in _VEHICLE_PATTERN.findall(query)})
+    if vehicles:
+        filters["terms"]["vehicle_id"] = vehicles
+    filters["start"] = None
+    if date_filter:
+        filters["start"] = tailer.resolve_time(date_filter.get("gte", date_filter.get("gt")), now)
+    if not reference and not (filters["predicates"] or filters["terms"] or filters["start"]):
+        return None
+    filters["narrow"] = not _SWITCH_PATTERN.search(query)
+    return filters
+
+
+def _matches(doc, filters):
+    readings = doc.get("sensor_readings") or {}
+    for predicate in filters["predicates"]:
+        value = readings.get(predicate["field"])
+        if not isinstance(value, (int, float)) or not sensors.OPERATORS[predicate["op"]](value, predicate["value"]):
+            return False
+    for field, allowed in filters["terms"].items():
+        if doc.get(field) not in allowed:
+            return False
+    if filters["start"] is not None:
+        timestamp = tailer.parse_timestamp(doc.get("timestamp"))
+        if timestamp is None or timestamp < filters["start"]:
+            return False
+    return True
+
+
+def _now_note():
+    return f"Current time (UTC): {datetime.utcnow().isoformat(timespec='seconds')}Z"
+
+
+class Session:
+    """
+    One conversation: the documents of its last retrieval and the chat messages since.
+
+    Each turn's prompt is the previous turn's messages plus the new question, re-sent
+    unchanged, so vLLM's prefix cache only has to process the new tokens. Prompts are built
+    without touching the session; `record` adds a turn once it has been answered, and the
+    store keeps it (see `SessionStore.put`).
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.candidates = []
+        # Start (epoch seconds) of the time window the candidates were retrieved for, None for all time
+        self.window_start = None
+        # Numbers of the documents the last follow-up matched, None for all
+        self.focus = None
+        self.messages = []
+        self.turns = 0
+        self._lock = threading.Lock()
+
+    def opening(self, context, question, instructions=None):
+        """Prompt starting a new retrieval; earlier turns are carried over as a transcript"""
+        parts = [f"Context:\n{context}"]
+        if instructions:
+            parts.append(instructions)
+        transcript = self.transcript()
+        if transcript:
+            parts.append(f"Earlier in this conversation:\n{transcript}")
+        parts.append(f"{_now_note()}\n\nQuery: {question}")
+        return [{"role": "system", "content": SYSTEM_MESSAGE},
+                {"role": "user", "content": "\n\n".join(parts)}]
+
+    def covers(self, filters):
+        """Whether a follow-up's time window lies within the one the candidates were retrieved for"""
+        with self._lock:
+            window_start = self.window_start
+        return filters["start"] is None or window_start is None or filters["start"] >= window_start
+
+    def refine(self, filters):
+        """(number, document) of the conversation's documents matching a follow-up's filters"""
+        with self._lock:
+            candidates = list(self.candidates)
+            focus = self.focus if filters["narrow"] else None
+        return [(number, doc) for number, doc in enumerate(candidates, 1)
+                if (focus is None or number in focus) and _matches(doc, filters)]
+
+    def follow_up(self, question, matching):
+        """Prompt for a follow-up, naming the context logs it narrows down to"""
+        numbers = ", ".join(f"#{number}" for number, _ in matching)
+        with self._lock:
+            messages = list(self.messages)
+        # The oldest follow-ups go first; the system message and the opening turn stay
+        while len(messages) > 3 + 2 * (SESSION_MAX_TURNS - 1):
+            del messages[3:5]
+        messages.append({"role": "user", "content": f"{_now_note()}\nLogs {numbers} of the context match.\n\nQuery: {question}"})
+        return messages
+
+    def record(self, messages, answer, candidates=None, matching=None, window_start=None):
+        """
+        Store an answered turn: `candidates` (retrieved for the window from `window_start`)
+        when it retrieved anew, otherwise the follow-up's `matching` documents, which the
+        next follow-up narrows down further
+        """
+        with self._lock:
+            self.messages = messages + [{"role": "assistant", "content": answer}]
+            if candidates is not None:
+                self.candidates = candidates
+                self.window_start = window_start
+                self.focus = None
+            elif matching:
+                self.focus = {number for number, _ in matching}
+            self.turns += 1
+            return self.turns
+
+    def state(self):
+        """JSON-serialisable copy of the conversation, for the session store"""
+        with self._lock:
+            return {"session_id": self.session_id, "candidates": self.candidates,
+                    "window_start": self.window_start,
+                    "focus": sorted(self.focus) if self.focus is not None else None,
+                    "messages": self.messages, "turns": self.turns}
+
+    @classmethod
+    def from_state(cls, state):
+        session = cls(state["session_id"])
+        session.candidates = state["candidates"]
+        session.window_start = state["window_start"]
+        session.focus = set(state["focus"]) if state["focus"] is not None else None
+        session.messages = state["messages"]
+        session.turns = state["turns"]
+        return session
+
+    def transcript(self, max_chars=1500):
+        """Questions and answers so far as plain text, the most recent last"""
+        with self._lock:
+            messages = self.messages[1:]
+        lines = []
+        for message in messages:
+            if message["role"] == "user":
+                lines.append(f"Q: {message['content'].rsplit('Query: ', 1)[-1].strip()}")
+            else:
+                lines.append(f"A: {message['content'].strip()}")
+        return "\n".join(lines)[-max_chars:]
+
+
+class SessionStore:
+    """
+    Conversations of the pod, one JSON file each in `directory`, shared by its workers.
+    `get` and `put` go to the replica owning a conversation's ID on the peer cache ring,
+    and fall back to this pod's files when it cannot be reached.
+    """
+
+    def __init__(self, directory=SESSION_DIR, max_sessions=SESSION_MAX_SESSIONS, ttl_seconds=SESSION_TTL_SECONDS):
+        self.directory = directory
+        self.max_sessions = max_sessions
+        self.ttl = ttl_seconds
+        self._swept_at = 0.0
+
+    def _path(self, session_id):
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    def load(self, session_id):
+        """State of a conversation kept in this pod, or None when unknown or expired; each access extends its lifetime"""
+        path = self._path(session_id)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.ttl:
+                os.remove(path)
+                return None
+            with open(path) as f:
+                state = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return state
+
+    def save(self, state):
+        """Keep a conversation's state in this pod"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(state["session_id"])
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(state, f)
+        os.replace(temporary, path)
+        self._sweep()
+
+    def _sweep(self):
+        """Drop expired conversations, then the least recently used beyond max_sessions"""
+        now = time.time()
+        if now - self._swept_at < _SWEEP_SECONDS:
+            return
+        self._swept_at = now
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except OSError:
+                continue
+        entries.sort(reverse=True)
+        for position, (mtime, path) in enumerate(entries):
+            if position >= self.max_sessions or now - mtime > self.ttl:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def get(self, session_id):
+        """(conversation, whether it was known): a new one for an unknown or expired ID"""
+        owner = peercache.picker.owner(f"session:{session_id}")
+        answer = peercache.post(owner, f"{PEER_PATH}/{session_id}", {"op": "get"}) if owner is not None else None
+        if answer is not None and "state" in answer:
+            state = answer["state"]
+        else:
+            state = self.load(session_id)
+        if state is None:
+            return Session(session_id), False
+        return Session.from_state(state), True
+
+    def put(self, session):
+        """Keep a conversation after a turn, with the replica owning it"""
+        state = session.state()
+        owner = peercache.picker.owner(f"session:{session.session_id}")
+        if owner is not None:
+            answer = peercache.post(owner, f"{PEER_PATH}/{session.session_id}", {"op": "put", "state": state})
+            if answer is not None and answer.get("stored"):
+                return
+        self.save(state)
@@ -0,0 +1,115 @@
+import os
+import re
+import time
+import uuid
+
+import geo
+import sensors
+import tailer
+
+# Registered standing queries and the matches the Kinesis consumer records for them. Both
+# indices live next to the logs in the collection but outside the INDEX_NAME-* pattern.
+STANDING_QUERIES_INDEX = os.environ.get('STANDING_QUERIES_INDEX', 'standing-queries')
+STANDING_MATCHES_INDEX = os.environ.get('STANDING_MATCHES_INDEX', 'standing-matches')
+
+# Minimum L2 score (1 / (1 + d²)) of a log's message against the query for a match. Cohere
+# embeddings have unit length, so 0.5 means a cosine similarity of at least 0.5.
+STANDING_MIN_SCORE = float(os.environ.get('STANDING_MIN_SCORE', '0.5'))
+STANDING_MAX_QUERIES = int(os.environ.get('STANDING_MAX_QUERIES', '1000'))
+
+# Matches returned per read; pollers page through more with the returned watermark
+STANDING_MATCHES_LIMIT = int(os.environ.get('STANDING_MATCHES_LIMIT', '50'))
+
+VEHICLE_STATES = ("MOVING", "IDLE", "STOPPED", "CHARGING", "MAINTENANCE")
+_STATE_PATTERN = re.compile(rf"\b(?:while|when|whilst|in state)\s+(?:in\s+)?({'|'.join(VEHICLE_STATES)})\b", re.IGNORECASE)
+_ERROR_CODE_PATTERN = re.compile(r'\b[A-Z]+_\d{3}\b')
+
+QUERIES_MAPPING = {
+    "mappings": {
+        "properties": {
+            "query_id": {"type": "keyword"},
+            "query": {"type": "text"},
+            "created_at": {"type": "date"},
+            "active": {"type": "boolean"},
+            "min_score": {"type": "float"},
+            # Read back by the consumer, never searched
+            "embedding": {"type": "float", "index": False},
+            "predicates": {"type": "object", "enabled": False},
+            "terms": {"type": "object", "enabled": False},
+            "geo": {"type": "object", "enabled": False}
+        }
+    }
+}
+
+MATCHES_MAPPING = {
+    "mappings": {
+        "properties": {
+            "query_id": {"type": "keyword"},
+            "matched_at": {"type": "date"},
+            "timestamp": {"type": "date"},
+            "score": {"type": "float"},
+            "log": {"type": "object", "enabled": False}
+        }
+    }
+}
+
+
+def parse_filters(text):
+    """
+    Structured part of an alert-style question, e.g. "battery below 11.5V while MOVING":
+    reading thresholds, keyword terms (vehicle state, error codes) and a geo filter clause
+    """
+    terms = {}
+    states = sorted({match.upper() for match in _STATE_PATTERN.findall(text)})
+    if states:
+        terms["vehicle_state"] = states
+    error_codes = sorted(set(_ERROR_CODE_PATTERN.findall(text)))
+    if error_codes:
+        terms["error_code"] = error_codes
+    return {
+        "predicates": [{"field": field, "op": op, "value": value}
+                       for field, op, value in sensors.parse_predicates(text)],
+        "terms": terms,
+        "geo": geo.parse_query(text)
+    }
+
+
+def new_query(text, embedding, min_score=None):
+    """Document of a standing query"""
+    document = {
+        "query_id": uuid.uuid4().hex,
+        "query": text,
+        "created_at": tailer.iso(time.time()),
+        "active": True,
+        "min_score": STANDING_MIN_SCORE if min_score is None else float(min_score),
+        "embedding": embedding
+    }
+    document.update(parse_filters(text))
+    return document
+
+
+def list_query():
+    return {
+        "size": STANDING_MAX_QUERIES,
+        "_source": {"excludes": ["embedding"]},
+        "sort": [{"created_at": {"order": "desc"}}],
+        "query": {"term": {"active": True}}
+    }
+
+
+def matches_query(query_id, since=None, after_id=None, limit=STANDING_MATCHES_LIMIT):
+    """
+    Matches of a standing query in the order they were recorded, oldest first. Reading
+    continues after `since` (epoch seconds of the last match delivered) and, as matches of
+    one batch share their matched_at, after its ID `after_id`.
+    """
+    body = {
+        "size": limit,
+        "sort": [{"matched_at": {"order": "asc"}}, {"_id": {"order": "asc"}}],
+        "query": {"bool": {"filter": [{"term": {"query_id": query_id}}]}}
+    }
+    if since is not None and after_id is not None:
+        body["search_after"] = [int(round(since * 1000)), after_id]
+    elif since is not None:
+        body["query"]["bool"]["filter"].append({"range": {"matched_at": {"gt": tailer.iso(since)}}})
+    return body
@@ -0,0 +1,181 @@
+import os
+import re
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# How often new documents are fetched, and how many per page / pages per poll
+TAIL_POLL_SECONDS = float(os.environ.get('TAIL_POLL_SECONDS', '5'))
+TAIL_BATCH_SIZE = int(os.environ.get('TAIL_BATCH_SIZE', '500'))
+TAIL_MAX_PAGES = int(os.environ.get('TAIL_MAX_PAGES', '20'))
+
+# Logs can become searchable this long after their own timestamp (batching, ingestion and
+# index refresh, out-of-order producers), so each poll fetches again from this far before
+# the newest timestamp seen
+TAIL_LAG_SECONDS = float(os.environ.get('TAIL_LAG_SECONDS', '60'))
+
+# In-memory copies are only trusted while the tail has succeeded this recently
+TAIL_STALE_SECONDS = float(os.environ.get('TAIL_STALE_SECONDS', str(max(30.0, 3 * TAIL_POLL_SECONDS))))
+
+_DATE_MATH_PATTERN = re.compile(r'^now(?:-(\d+)([smhdwM]))?$')
+_UNIT_SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400, 'M': 30 * 86400}
+
+
+def parse_timestamp(value):
+    """Epoch seconds of an ISO-8601 timestamp (naive timestamps are UTC), or None"""
+    if not isinstance(value, str):
+        return None
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def resolve_time(value, now=None):
+    """
+    Epoch seconds of a range bound: "now", "now-N<unit>" (months as 30 days) or an ISO
+    timestamp. None for anything else, e.g. date math with rounding.
+    """
+    match = _DATE_MATH_PATTERN.match(value) if isinstance(value, str) else None
+    if match:
+        now = time.time() if now is None else now
+        return now - int(match.group(1)) * _UNIT_SECONDS[match.group(2)] if match.group(1) else now
+    return parse_timestamp(value)
+
+
+def iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat(timespec='microseconds').replace('+00:00', 'Z')
+
+
+class IndexTailer:
+    """
+    Incremental copy of the most recent documents of the index.
+
+    The first poll backfills the longest window any subscriber asked for; later polls fetch
+    documents from `lag` seconds before the newest timestamp seen so far (the watermark),
+    sorted by timestamp and paged with search_after, so logs that become searchable late
+    are still fetched. Documents fetched again are dropped by ID. Subscribers receive
+    batches of {"id", "timestamp" (epoch seconds), "source"}, not necessarily in timestamp
+    order, and keep their own bounded copies.
+    """
+
+    def __init__(self, search, interval=TAIL_POLL_SECONDS, batch_size=TAIL_BATCH_SIZE, lag=TAIL_LAG_SECONDS):
+        """`search(body)` runs a search on the index and returns the raw response"""
+        self.search = search
+        self.interval = interval
+        self.batch_size = batch_size
+        self.lag = lag
+        self.watermark = None
+        self.covered_from = None
+        self.last_success = None
+        self._watermark_epoch = None
+        self._backfilled_at = None
+        # Documents delivered within the lag margin, by ID, with their timestamps
+        self._delivered = {}
+        # (since, search_after) of a poll that stopped after TAIL_MAX_PAGES pages
+        self._resume = None
+        self._subscribers = []
+        self._fields = set()
+        self._window_seconds = 0.0
+        self._lock = threading.Lock()
+        self._started_pid = None
+
+    def subscribe(self, listener, fields, window_seconds):
+        """Deliver documents of the last `window_seconds` with `fields` of their source to `listener(docs)`"""
+        self._subscribers.append(listener)
+        self._fields.update(fields)
+        self._fields.add('timestamp')
+        self._window_seconds = max(self._window_seconds, window_seconds)
+
+    def start(self):
+        with self._lock:
+            if not self._subscribers or self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        threading.Thread(target=self._run, name="index-tailer", daemon=True).start()
+
+    def covers(self, since):
+        """
+        True when every document indexed since `since` (epoch seconds) has been delivered.
+        Not before a poll has run a lag margin after the backfill: until then, documents of
+        the backfilled window may still have been on their way into the index.
+        """
+        self.start()
+        if self.last_success is None or time.time() - self.last_success > TAIL_STALE_SECONDS:
+            return False
+        if self._backfilled_at is None or self.last_success < self._backfilled_at + self.lag:
+            return False
+        return since >= self.covered_from
+
+    def _run(self):
+        while True:
+            more = False
+            try:
+                more = self.poll()
+            except Exception as e:
+                logger.warning(f"Could not tail new documents: {e}")
+            if not more:
+                time.sleep(self.interval)
+
+    def _query(self, since, search_after):
+        body = {
+            "size": self.batch_size,
+            "_source": sorted(self._fields),
+            "sort": [{"timestamp": {"order": "asc"}}],
+            "query": {"range": {"timestamp": {"gte": since}}}
+        }
+        if search_after is not None:
+            body["search_after"] = search_after
+        return body
+
+    def poll(self):
+        """Fetch up to TAIL_MAX_PAGES pages of new documents; True if more are waiting"""
+        started = time.time()
+        if self._resume is not None:
+            since, search_after = self._resume
+        elif self._watermark_epoch is not None:
+            since, search_after = iso(self._watermark_epoch - self.lag), None
+        else:
+            since, search_after = iso(started - self._window_seconds), None
+        for _ in range(TAIL_MAX_PAGES):
+            response = self.search(self._query(since, search_after))
+            hits = response.get('hits', {}).get('hits', [])
+            docs = []
+            for hit in hits:
+                source = hit.get('_source', {})
+                raw = source.get('timestamp')
+                epoch = parse_timestamp(raw)
+                if epoch is None or hit.get('_id') in self._delivered:
+                    continue
+                self._delivered[hit.get('_id')] = epoch
+                if self._watermark_epoch is None or epoch > self._watermark_epoch:
+                    self.watermark, self._watermark_epoch = raw, epoch
+                docs.append({"id": hit.get('_id'), "timestamp": epoch, "source": source})
+            if docs:
+                for listener in self._subscribers:
+                    listener(docs)
+            if len(hits) < self.batch_size:
+                break
+            search_after = hits[-1].get('sort')
+        else:
+            # Still catching up: the next poll carries on from here, and copies are not
+            # current until a poll reaches the end
+            self._resume = (since, search_after)
+            return True
+        self._resume = None
+        if self._watermark_epoch is not None:
+            # IDs older than the margin are not fetched again
+            cutoff = self._watermark_epoch - self.lag
+            self._delivered = {doc_id: epoch for doc_id, epoch in self._delivered.items() if epoch >= cutoff}
+        if self.covered_from is None:
+            self.covered_from = started - self._window_seconds
+            self._backfilled_at = time.time()
+            logger.info(f"Tailing documents since {iso(self.covered_from)}")
+        self.last_success = started
+        return False
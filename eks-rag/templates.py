@@ -0,0 +1,124 @@
+import os
+import time
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# "knn" searches every document's embedding; "templates" ranks the distinct message
+# templates first and then fetches the newest logs of the best ones with a term query.
+# Only exact when each error_code always carries the same message, as the producers emit.
+SEARCH_STRATEGY = os.environ.get('SEARCH_STRATEGY', 'knn').lower()
+
+# How often the template registry is re-read from the index, and its maximum size
+TEMPLATE_REFRESH_SECONDS = float(os.environ.get('TEMPLATE_REFRESH_SECONDS', '300'))
+TEMPLATE_MAX_TEMPLATES = int(os.environ.get('TEMPLATE_MAX_TEMPLATES', '500'))
+
+# Term queries (one per template, best first) made to fill k results
+TEMPLATE_MAX_QUERIES = int(os.environ.get('TEMPLATE_MAX_QUERIES', '5'))
+
+TEMPLATE_FIELD = "error_code"
+VECTOR_FIELD = "message_embedding"
+
+# One sample document (message and embedding) per template
+REGISTRY_QUERY = {
+    "size": 0,
+    "aggs": {
+        "templates": {
+            "terms": {"field": TEMPLATE_FIELD, "size": TEMPLATE_MAX_TEMPLATES},
+            "aggs": {"sample": {"top_hits": {"size": 1, "_source": ["message", VECTOR_FIELD]}}}
+        }
+    }
+}
+REGISTRY_FILTER_PATH = "aggregations.templates.buckets.key,aggregations.templates.buckets.sample.hits.hits._source"
+
+
+class TemplateRegistry:
+    """
+    Distinct message templates of the index with their embeddings, refreshed in the
+    background. Ranking a query against a dozen templates replaces an ANN search over
+    millions of near-identical document vectors.
+    """
+
+    def __init__(self, search, interval=TEMPLATE_REFRESH_SECONDS):
+        """`search(body, filter_path)` runs a search on the logs index and returns the raw response"""
+        self._search = search
+        self.interval = interval
+        self.keys = []
+        self.messages = []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.squared_norms = np.zeros(0, dtype=np.float32)
+        self.updated_at = None
+        self._lock = threading.Lock()
+        self._started_pid = None
+
+    def start(self):
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        threading.Thread(target=self._run, name="template-registry", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Could not refresh message templates: {e}")
+            time.sleep(self.interval)
+
+    def refresh(self):
+        response = self._search(REGISTRY_QUERY, REGISTRY_FILTER_PATH)
+        keys, messages, vectors = [], [], []
+        for bucket in response.get('aggregations', {}).get('templates', {}).get('buckets', []):
+            hits = bucket.get('sample', {}).get('hits', {}).get('hits', [])
+            source = hits[0].get('_source', {}) if hits else {}
+            if source.get(VECTOR_FIELD):
+                keys.append(bucket['key'])
+                messages.append(source.get('message'))
+                vectors.append(source[VECTOR_FIELD])
+        if not keys:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            self.keys, self.messages, self.vectors = keys, messages, matrix
+            self.squared_norms = np.einsum('ij,ij->i', matrix, matrix)
+            self.updated_at = time.time()
+        logger.info(f"Template registry: {len(keys)} message templates")
+
+    def rank(self, embedding):
+        """[(template key, L2 score)] best first, or None while the registry is empty"""
+        self.start()
+        with self._lock:
+            keys, vectors, squared_norms = self.keys, self.vectors, self.squared_norms
+        if not keys:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        distances = np.maximum(squared_norms - 2 * (vectors @ query) + float(query @ query), 0)
+        order = np.argsort(distances, kind='stable')
+        return [(keys[i], float(1 / (1 + distances[i]))) for i in order]
+
+    def search(self, embedding, k, filter_clauses, source_fields):
+        """
+        Two-stage search: rank the templates, then fetch the newest matching logs of the best
+        template, the next one, and so on until k are found (at most TEMPLATE_MAX_QUERIES
+        queries). Returns [(score, source)] or None when the registry is not loaded yet.
+        """
+        ranked = self.rank(embedding)
+        if ranked is None:
+            return None
+        results = []
+        for key, score in ranked[:TEMPLATE_MAX_QUERIES]:
+            body = {
+                "size": k - len(results),
+                "_source": source_fields,
+                "sort": [{"timestamp": {"order": "desc"}}],
+                "query": {"bool": {"filter": [{"term": {TEMPLATE_FIELD: key}}] + list(filter_clauses)}}
+            }
+            response = self._search(body, "hits.hits._source")
+            results += [(score, hit["_source"]) for hit in response.get('hits', {}).get('hits', [])]
+            if len(results) >= k:
+                break
+        return results
@@ -84,6 +84,8 @@ module "kubernetes" {
   vllm_service_port        = var.vllm_port
   vllm_namespace           = var.vllm_namespace
   replicas                 = var.replicas
+  opensearch_endpoint      = module.opensearch.collection_endpoint
+  index_partitioning       = var.index_partitioning
 
   depends_on = [
     module.iam,
@@ -140,8 +142,11 @@ module "lambda_consumer" {
   opensearch_endpoint       = module.opensearch.collection_endpoint
   opensearch_collection_arn = module.opensearch.collection_arn
   index_name                = "error-logs-mock"
+  index_partitioning        = var.index_partitioning
+  index_retention_days      = var.index_retention_days
   aws4auth_layer_arn        = module.lambda_layers.aws4auth_layer_arn
   opensearch_layer_arn      = module.lambda_layers.opensearch_layer_arn
+  numpy_layer_arn           = var.numpy_layer_arn
   aws_region                = var.aws_region
   account_id                = local.account_id
 
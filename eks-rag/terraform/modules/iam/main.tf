@@ -17,7 +17,8 @@ resource "aws_iam_policy" "bedrock_policy" {
         Action = [
           "bedrock:InvokeModel"
         ]
-        Resource = "arn:aws:bedrock:${var.aws_region}::foundation-model/cohere.embed-english-v3"
+        # Any region, so the service can fail over to the regions listed in BEDROCK_ENDPOINTS
+        Resource = "arn:aws:bedrock:*::foundation-model/cohere.embed-english-v3"
       }
     ]
   })
@@ -6,6 +6,23 @@ resource "kubernetes_service_account_v1" "eks_rag_sa" {
   }
 }
 
+# Shared secret the replicas send with peer cache requests
+resource "random_password" "peer_cache_secret" {
+  length  = 32
+  special = false
+}
+
+resource "kubernetes_secret_v1" "peer_cache" {
+  metadata {
+    name      = "eks-rag-peer-cache"
+    namespace = var.namespace
+  }
+
+  data = {
+    secret = random_password.peer_cache_secret.result
+  }
+}
+
 # Deployment
 resource "kubernetes_deployment_v1" "eks_rag" {
   metadata {
@@ -44,6 +61,12 @@ resource "kubernetes_deployment_v1" "eks_rag" {
             container_port = 5000
           }
 
+          # Peer cache port, reachable only from the other RAG pods (see the network policies)
+          port {
+            name           = "peer-cache"
+            container_port = 5001
+          }
+
           env {
             name  = "VLLM_HOST"
             value = var.vllm_service_host
@@ -54,6 +77,46 @@ resource "kubernetes_deployment_v1" "eks_rag" {
             value = tostring(var.vllm_service_port)
           }
 
+          env {
+            name  = "OPENSEARCH_ENDPOINT"
+            value = var.opensearch_endpoint
+          }
+
+          env {
+            name  = "INDEX_PARTITIONING"
+            value = var.index_partitioning
+          }
+
+          # Peer cache: replicas find each other through the headless service below
+          env {
+            name  = "PEER_CACHE_SERVICE"
+            value = "eks-rag-peers.${var.namespace}.svc.cluster.local"
+          }
+
+          env {
+            name  = "PEER_CACHE_PORT"
+            value = "5001"
+          }
+
+          env {
+            name = "PEER_CACHE_SECRET"
+            value_from {
+              secret_key_ref {
+                name = kubernetes_secret_v1.peer_cache.metadata[0].name
+                key  = "secret"
+              }
+            }
+          }
+
+          env {
+            name = "POD_IP"
+            value_from {
+              field_ref {
+                field_path = "status.podIP"
+              }
+            }
+          }
+
           resources {
             requests = {
               cpu    = "100m"
@@ -65,14 +128,17 @@ resource "kubernetes_deployment_v1" "eks_rag" {
             }
           }
 
+          # /ready only reads the status cached by the in-process dependency monitor,
+          # so it can be probed often and starts passing as soon as warm-up completes
           readiness_probe {
             http_get {
-              path = "/health"
+              path = "/ready"
               port = 5000
             }
-            initial_delay_seconds = 30
-            timeout_seconds       = 10
-            period_seconds        = 15
+            initial_delay_seconds = 5
+            timeout_seconds       = 2
+            period_seconds        = 5
+            failure_threshold     = 3
           }
 
           liveness_probe {
@@ -116,6 +182,73 @@ resource "kubernetes_service_v1" "eks_rag_service" {
   depends_on = [kubernetes_deployment_v1.eks_rag]
 }
 
+# Headless service listing the ready RAG pods, used by the peer cache to find its peers
+resource "kubernetes_service_v1" "eks_rag_peers" {
+  metadata {
+    name      = "eks-rag-peers"
+    namespace = var.namespace
+  }
+
+  spec {
+    selector = {
+      app = "eks-rag"
+    }
+
+    cluster_ip = "None"
+
+    port {
+      protocol    = "TCP"
+      port        = 5001
+      target_port = 5001
+    }
+  }
+
+  depends_on = [kubernetes_deployment_v1.eks_rag]
+}
+
+# Network Policy - Only the other RAG pods may reach the peer cache port
+resource "kubernetes_network_policy_v1" "restrict_peer_cache" {
+  metadata {
+    name      = "restrict-peer-cache"
+    namespace = var.namespace
+  }
+
+  spec {
+    pod_selector {
+      match_labels = {
+        app = "eks-rag"
+      }
+    }
+
+    policy_types = ["Ingress"]
+
+    # The API port stays open to the UI and the probes
+    ingress {
+      ports {
+        protocol = "TCP"
+        port     = "5000"
+      }
+    }
+
+    ingress {
+      from {
+        pod_selector {
+          match_labels = {
+            app = "eks-rag"
+          }
+        }
+      }
+
+      ports {
+        protocol = "TCP"
+        port     = "5001"
+      }
+    }
+  }
+
+  depends_on = [kubernetes_deployment_v1.eks_rag]
+}
+
 # Network Policy - Allow egress to vLLM namespace
 resource "kubernetes_network_policy_v1" "allow_vllm_access" {
   metadata {
@@ -147,6 +280,22 @@ resource "kubernetes_network_policy_v1" "allow_vllm_access" {
       }
     }
 
+    # Allow peer cache requests to the other RAG pods
+    egress {
+      to {
+        pod_selector {
+          match_labels = {
+            app = "eks-rag"
+          }
+        }
+      }
+
+      ports {
+        protocol = "TCP"
+        port     = "5001"
+      }
+    }
+
     # Allow DNS resolution
     egress {
       to {
@@ -23,6 +23,18 @@ variable "vllm_service_port" {
   type        = number
 }
 
+variable "opensearch_endpoint" {
+  description = "OpenSearch Serverless collection endpoint (skips endpoint discovery at startup when set)"
+  type        = string
+  default     = ""
+}
+
+variable "index_partitioning" {
+  description = "Time partitioning of the logs index (none, daily or hourly); must match the consumer"
+  type        = string
+  default     = "none"
+}
+
 variable "vllm_namespace" {
   description = "vLLM namespace for network policy"
   type        = string
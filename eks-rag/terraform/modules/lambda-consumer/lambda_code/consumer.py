@@ -1,19 +1,59 @@
 import json
 import base64
+import math
 import os
+import time
+from datetime import datetime, timedelta, timezone
 import boto3
 from opensearchpy import OpenSearch, RequestsHttpConnection
+from opensearchpy.exceptions import NotFoundError, RequestError
 from requests_aws4auth import AWS4Auth
 
+# NumPy comes from the layer numpy_layer_arn; without it standing queries are not evaluated
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # Configuration from environment variables
 OPENSEARCH_ENDPOINT = os.environ['OPENSEARCH_ENDPOINT']
 INDEX_NAME = os.environ.get('INDEX_NAME', 'error-logs-mock')
 # AWS_REGION is automatically provided by Lambda runtime
 AWS_REGION = os.environ.get('AWS_REGION', 'us-west-2')
 
+# "none" writes every log to INDEX_NAME. "daily" / "hourly" write it to INDEX_NAME-YYYY.MM.DD(.HH)
+# by its timestamp; the RAG service must use the same setting to route its searches.
+INDEX_PARTITIONING = os.environ.get('INDEX_PARTITIONING', 'none').lower()
+PARTITION_FORMATS = {
+    'daily': ('%Y.%m.%d', timedelta(days=1)),
+    'hourly': ('%Y.%m.%d.%H', timedelta(hours=1))
+}
+
+# Partitions entirely older than this many days are deleted as a whole (0 keeps everything)
+INDEX_RETENTION_DAYS = float(os.environ.get('INDEX_RETENTION_DAYS', '0'))
+RETENTION_CHECK_SECONDS = 3600
+
+# Standing queries registered through the RAG service, scored against every batch, and
+# the index their matches are recorded in
+STANDING_QUERIES_INDEX = os.environ.get('STANDING_QUERIES_INDEX', 'standing-queries')
+STANDING_MATCHES_INDEX = os.environ.get('STANDING_MATCHES_INDEX', 'standing-matches')
+STANDING_REFRESH_SECONDS = 60
+STANDING_MAX_QUERIES = 1000
+SENSOR_FIELDS = ('engine_temp', 'battery_voltage', 'fuel_pressure', 'speed', 'battery_level')
+COMPARISONS = {'>': 'greater', '>=': 'greater_equal', '<': 'less', '<=': 'less_equal', '=': 'equal'}
+EARTH_RADIUS_KM = 6371.0088
+DISTANCE_UNITS_KM = {'km': 1.0, 'mi': 1.609344, 'm': 0.001}
+
 # Initialize clients
 bedrock = boto3.client('bedrock-runtime', region_name=AWS_REGION)
 
+# Kept across invocations of a warm Lambda container
+known_partitions = set()
+partition_body = None
+last_retention_check = 0.0
+standing_queries = None
+standing_loaded_at = 0.0
+
 def get_opensearch_client():
     """Initialize OpenSearch client with IAM authentication"""
     credentials = boto3.Session().get_credentials()
@@ -55,6 +95,171 @@ def generate_embedding(text):
         print(f"Error generating embedding: {e}")
         return None
 
+def add_geo_point(log):
+    """Copy location.latitude/longitude into location.point, the geo_point used by spatial filters"""
+    location = log.get('location')
+    if isinstance(location, dict) and location.get('latitude') is not None and location.get('longitude') is not None:
+        location['point'] = {"lat": location['latitude'], "lon": location['longitude']}
+
+def index_for(log):
+    """Index a log is written to: its time partition, or INDEX_NAME without partitioning"""
+    if INDEX_PARTITIONING not in PARTITION_FORMATS:
+        return INDEX_NAME
+    suffix_format, _ = PARTITION_FORMATS[INDEX_PARTITIONING]
+    try:
+        moment = datetime.fromisoformat(log['timestamp'].replace('Z', '+00:00'))
+    except (KeyError, AttributeError, ValueError):
+        moment = datetime.now(timezone.utc)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return f"{INDEX_NAME}-{moment.astimezone(timezone.utc).strftime(suffix_format)}"
+
+def ensure_partition(client, index):
+    """Create a partition on first use, with the mappings of INDEX_NAME (created by create_index.py)"""
+    global partition_body
+
+    if index == INDEX_NAME or index in known_partitions:
+        return
+    if not client.indices.exists(index=index):
+        if partition_body is None:
+            template = client.indices.get(index=INDEX_NAME)[INDEX_NAME]
+            partition_body = {"mappings": template['mappings'], "settings": {"index": {"knn": True}}}
+        try:
+            client.indices.create(index=index, body=partition_body)
+            print(f"📁 Created partition {index}")
+        except RequestError as e:
+            # Another consumer instance created it first
+            if e.error != 'resource_already_exists_exception':
+                raise
+    known_partitions.add(index)
+
+def drop_expired_partitions(client):
+    """Delete whole partitions older than INDEX_RETENTION_DAYS (at most once an hour per container)"""
+    global last_retention_check
+
+    if INDEX_PARTITIONING not in PARTITION_FORMATS or INDEX_RETENTION_DAYS <= 0:
+        return
+    if time.time() - last_retention_check < RETENTION_CHECK_SECONDS:
+        return
+    last_retention_check = time.time()
+
+    suffix_format, length = PARTITION_FORMATS[INDEX_PARTITIONING]
+    cutoff = datetime.now(timezone.utc) - timedelta(days=INDEX_RETENTION_DAYS)
+    for entry in client.cat.indices(index=f"{INDEX_NAME}-*", format='json'):
+        name = entry['index']
+        try:
+            start = datetime.strptime(name[len(INDEX_NAME) + 1:], suffix_format).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        if start + length <= cutoff:
+            client.indices.delete(index=name)
+            known_partitions.discard(name)
+            print(f"🗑️ Dropped expired partition {name}")
+
+def load_standing_queries(client):
+    """Registered standing queries with their embeddings stacked into a matrix (re-read every minute)"""
+    global standing_queries, standing_loaded_at
+
+    if time.time() - standing_loaded_at < STANDING_REFRESH_SECONDS:
+        return standing_queries
+    standing_loaded_at = time.time()
+    try:
+        response = client.search(index=STANDING_QUERIES_INDEX,
+                                 body={"size": STANDING_MAX_QUERIES, "query": {"term": {"active": True}}})
+    except NotFoundError:
+        # No query was ever registered
+        standing_queries = None
+        return None
+    queries = [hit['_source'] for hit in response['hits']['hits'] if hit['_source'].get('embedding')]
+    if not queries:
+        standing_queries = None
+        return None
+    vectors = np.asarray([query['embedding'] for query in queries], dtype=np.float32)
+    standing_queries = {
+        "queries": queries,
+        "vectors": vectors,
+        "squared_norms": np.einsum('ij,ij->i', vectors, vectors),
+        "min_scores": np.asarray([query['min_score'] for query in queries], dtype=np.float32)
+    }
+    print(f"🔔 Loaded {len(queries)} standing queries")
+    return standing_queries
+
+def geo_mask(clause, latitudes, longitudes):
+    """Rows inside a geo_distance / geo_bounding_box clause (as registered by the service)"""
+    if 'geo_bounding_box' in clause:
+        box, = clause['geo_bounding_box'].values()
+        return ((latitudes <= box['top_left']['lat']) & (latitudes >= box['bottom_right']['lat']) &
+                (longitudes >= box['top_left']['lon']) & (longitudes <= box['bottom_right']['lon']))
+    params = dict(clause['geo_distance'])
+    distance = params.pop('distance')
+    center, = params.values()
+    number = distance.rstrip('abcdefghijklmnopqrstuvwxyz')
+    limit_km = float(number) * DISTANCE_UNITS_KM[distance[len(number):] or 'm']
+    lat1, lon1 = math.radians(center['lat']), math.radians(center['lon'])
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a)) <= limit_km
+
+def match_standing_queries(client, logs):
+    """
+    Score a batch of indexed logs against every standing query with one matrix multiply
+    (L2 scores, 1 / (1 + d²), as OpenSearch computes them), apply each query's structured
+    filters as masks and record the matches. Returns the number of matches.
+    """
+    if not logs:
+        return 0
+    if np is None:
+        print("❌ NumPy is not available (numpy_layer_arn layer missing): standing queries are not evaluated")
+        return 0
+    standing = load_standing_queries(client)
+    if not standing:
+        return 0
+
+    embeddings = np.asarray([log['message_embedding'] for log in logs], dtype=np.float32)
+    distances = (np.einsum('ij,ij->i', embeddings, embeddings)[:, None] - 2 * (embeddings @ standing['vectors'].T)
+                 + standing['squared_norms'][None, :])
+    scores = 1 / (1 + np.maximum(distances, 0))
+    candidates = scores >= standing['min_scores'][None, :]
+    if not candidates.any():
+        return 0
+
+    readings = np.asarray([[(log.get('sensor_readings') or {}).get(field, math.nan) for field in SENSOR_FIELDS]
+                           for log in logs], dtype=np.float64)
+    locations = [log.get('location') or {} for log in logs]
+    latitudes = np.asarray([location.get('latitude', math.nan) for location in locations], dtype=np.float64)
+    longitudes = np.asarray([location.get('longitude', math.nan) for location in locations], dtype=np.float64)
+    keywords = {}
+
+    matched_at = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+    actions = []
+    for column, query in enumerate(standing['queries']):
+        mask = candidates[:, column].copy()
+        if not mask.any():
+            continue
+        for predicate in query.get('predicates') or []:
+            values = readings[:, SENSOR_FIELDS.index(predicate['field'])]
+            mask &= getattr(np, COMPARISONS[predicate['op']])(values, predicate['value'])
+        for field, allowed in (query.get('terms') or {}).items():
+            if field not in keywords:
+                keywords[field] = np.asarray([str(log.get(field)) for log in logs])
+            mask &= np.isin(keywords[field], allowed)
+        if query.get('geo'):
+            mask &= geo_mask(query['geo'], latitudes, longitudes)
+        for row in np.flatnonzero(mask):
+            log = logs[row]
+            actions.append({"index": {"_index": STANDING_MATCHES_INDEX}})
+            actions.append({
+                "query_id": query['query_id'],
+                "matched_at": matched_at,
+                "timestamp": log.get('timestamp'),
+                "score": float(scores[row, column]),
+                "log": {key: value for key, value in log.items() if key != 'message_embedding'}
+            })
+
+    if actions:
+        client.bulk(body=actions)
+    return len(actions) // 2
+
 def lambda_handler(event, context):
     """
     Lambda handler triggered by Kinesis
@@ -65,9 +270,15 @@ def lambda_handler(event, context):
 
     os_client = get_opensearch_client()
 
+    try:
+        drop_expired_partitions(os_client)
+    except Exception as e:
+        print(f"❌ Error dropping expired partitions: {e}")
+
     total_processed = 0
     total_indexed = 0
     total_failed = 0
+    indexed_logs = []
 
     # Process Kinesis records
     for record in event['Records']:
@@ -83,14 +294,18 @@ def lambda_handler(event, context):
 
             if embedding:
                 log['message_embedding'] = embedding
+                add_geo_point(log)
 
-                # Index to OpenSearch
+                # Index to OpenSearch (into the log's time partition when partitioning is on)
                 try:
+                    index = index_for(log)
+                    ensure_partition(os_client, index)
                     response = os_client.index(
-                        index=INDEX_NAME,
+                        index=index,
                         body=log
                     )
                     total_indexed += 1
+                    indexed_logs.append(log)
 
                     if total_indexed % 10 == 0:
                         print(f"✅ Indexed {total_indexed} documents...")
@@ -106,6 +321,15 @@ def lambda_handler(event, context):
             total_failed += 1
             print(f"❌ Error processing record: {e}")
 
+    # Alert-style questions are answered once per batch instead of by clients polling
+    total_matches = 0
+    try:
+        total_matches = match_standing_queries(os_client, indexed_logs)
+        if total_matches:
+            print(f"🔔 Recorded {total_matches} standing query matches")
+    except Exception as e:
+        print(f"❌ Error evaluating standing queries: {e}")
+
     print(f"\n📊 Completed: {total_processed} processed, {total_indexed} indexed, {total_failed} failed")
 
     return {
@@ -113,6 +337,7 @@ def lambda_handler(event, context):
         'body': json.dumps({
             'processed': total_processed,
             'indexed': total_indexed,
-            'failed': total_failed
+            'failed': total_failed,
+            'standing_matches': total_matches
         })
     }
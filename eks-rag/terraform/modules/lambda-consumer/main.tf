@@ -20,13 +20,16 @@ resource "aws_lambda_function" "consumer" {
 
   layers = [
     var.aws4auth_layer_arn,
-    var.opensearch_layer_arn
+    var.opensearch_layer_arn,
+    var.numpy_layer_arn
   ]
 
   environment {
     variables = {
-      OPENSEARCH_ENDPOINT = var.opensearch_endpoint
-      INDEX_NAME          = var.index_name
+      OPENSEARCH_ENDPOINT  = var.opensearch_endpoint
+      INDEX_NAME           = var.index_name
+      INDEX_PARTITIONING   = var.index_partitioning
+      INDEX_RETENTION_DAYS = tostring(var.index_retention_days)
     }
   }
 
@@ -19,6 +19,23 @@ variable "index_name" {
   default     = "error-logs-mock"
 }
 
+variable "index_partitioning" {
+  description = "Time partitioning of the logs index: none, daily or hourly"
+  type        = string
+  default     = "none"
+}
+
+variable "index_retention_days" {
+  description = "Delete log partitions older than this many days (0 keeps everything)"
+  type        = number
+  default     = 0
+}
+
+variable "numpy_layer_arn" {
+  description = "ARN of a Lambda layer providing NumPy, needed to evaluate standing queries"
+  type        = string
+}
+
 variable "aws4auth_layer_arn" {
   description = "ARN of the AWS4Auth Lambda layer"
   type        = string
@@ -74,7 +74,8 @@ resource "null_resource" "create_index" {
               "location": {
                 "properties": {
                   "latitude": {"type": "float"},
-                  "longitude": {"type": "float"}
+                  "longitude": {"type": "float"},
+                  "point": {"type": "geo_point"}
                 }
               },
               "sensor_readings": {
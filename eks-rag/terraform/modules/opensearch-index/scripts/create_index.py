@@ -75,7 +75,8 @@ def create_index_mapping(client, index_name):
                 "location": {
                     "properties": {
                         "latitude": {"type": "float"},
-                        "longitude": {"type": "float"}
+                        "longitude": {"type": "float"},
+                        "point": {"type": "geo_point"}
                     }
                 },
                 "sensor_readings": {
@@ -121,6 +122,16 @@ def create_index_mapping(client, index_name):
     client.indices.create(index=index_name, body=mapping)
     print(f"✅ Created index '{index_name}' with knn_vector mapping")
 
+def add_geo_point_mapping(client, index_name, mappings):
+    """Add location.point (geo_point) to an index created before it existed; new fields can be added in place"""
+    location = mappings['properties'].get('location', {}).get('properties', {})
+    if 'point' in location:
+        return
+    client.indices.put_mapping(index=index_name, body={
+        "properties": {"location": {"properties": {"point": {"type": "geo_point"}}}}
+    })
+    print(f"✅ Added location.point geo_point mapping to '{index_name}' (only logs indexed from now on have it)")
+
 def wait_for_collection_active(collection_id, region, max_wait_minutes=15):
     """Wait for OpenSearch collection to be ACTIVE using AWS CLI"""
     print(f"⏳ Waiting for collection '{collection_id}' to be ACTIVE...")
@@ -204,6 +215,7 @@ def main():
                 embedding_type = mapping[index_name]['mappings']['properties']['message_embedding']['type']
                 if embedding_type == 'knn_vector':
                     print(f"✅ Index has correct knn_vector mapping")
+                    add_geo_point_mapping(client, index_name, mapping[index_name]['mappings'])
                     sys.exit(0)
                 else:
                     print(f"❌ ERROR: message_embedding field exists but is type '{embedding_type}', not 'knn_vector'")
@@ -175,7 +175,7 @@ fi
 if kubectl get pods -l app=eks-rag -o jsonpath='{.items[*].status.containerStatuses[*].ready}' 2>/dev/null | grep -q "false"; then
     echo -e "${YELLOW}⚠ Pods are not Ready${NC}"
     ISSUE_COUNT=$((ISSUE_COUNT+1))
-    echo "  → Check readiness probe: /health endpoint"
+    echo "  → Check readiness probe: /ready endpoint (curl it to see which dependency is failing)"
     echo "  → Check pod logs for startup errors"
 fi
 
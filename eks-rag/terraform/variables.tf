@@ -70,6 +70,33 @@ variable "docker_build_context" {
   default     = ".."
 }
 
+variable "index_partitioning" {
+  description = "Time partitioning of the logs index: none, daily or hourly (INDEX_NAME-YYYY.MM.DD[.HH])"
+  type        = string
+  default     = "none"
+
+  validation {
+    condition     = contains(["none", "daily", "hourly"], var.index_partitioning)
+    error_message = "index_partitioning must be none, daily or hourly."
+  }
+}
+
+variable "index_retention_days" {
+  description = "Delete log partitions older than this many days (0 keeps everything; needs index_partitioning)"
+  type        = number
+  default     = 0
+}
+
+variable "numpy_layer_arn" {
+  description = "Lambda layer providing NumPy for the consumer (e.g. the AWS SDK for pandas layer of the region), which evaluates standing queries with it"
+  type        = string
+
+  validation {
+    condition     = length(var.numpy_layer_arn) > 0
+    error_message = "numpy_layer_arn is required: standing queries registered with the RAG service are never evaluated without NumPy in the consumer."
+  }
+}
+
 variable "opensearch_scripts_path" {
   description = "Path to opensearch-setup scripts (relative to terraform directory)"
   type        = string
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Bedrock runtime, OpenSearch and vLLM endpoints, with injectable
+latency and errors, for exercising failover, hedging and the serving modes without AWS.
+
+Run one process per endpoint and point the service at them, e.g.:
+
+    python standin_endpoints.py --port 8101 --latency-ms 40
+    python standin_endpoints.py --port 8102 --latency-ms 120
+    BEDROCK_ENDPOINTS="us-west-2=http://127.0.0.1:8101,us-east-1=http://127.0.0.1:8102" \\
+    OPENSEARCH_ENDPOINTS="http://127.0.0.1:8101,http://127.0.0.1:8102" ...
+
+Latency and errors can be changed while running:
+
+    curl -X POST localhost:8101/_standin -d '{"latency_ms": 2000, "error_rate": 0.5}'
+    curl localhost:8101/_standin
+"""
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_DIMENSIONS = 1024
+
+SAMPLE_LOGS = [
+    {"timestamp": "2025-01-15T10:30:00Z", "service": "vehicle-telemetry", "error_code": "SENSOR_001",
+     "message": "Engine temperature sensor reading above threshold: 115C", "vehicle_id": "VIN-1001",
+     "vehicle_state": "MOVING", "sensor_readings": {"engine_temp": 115.0}, "diagnostic_info": {}},
+    {"timestamp": "2025-01-15T10:25:00Z", "service": "vehicle-telemetry", "error_code": "SENSOR_002",
+     "message": "Battery voltage below threshold: 11.2V", "vehicle_id": "VIN-1002",
+     "vehicle_state": "IDLE", "sensor_readings": {"battery_voltage": 11.2}, "diagnostic_info": {}},
+    {"timestamp": "2025-01-15T10:20:00Z", "service": "connectivity", "error_code": "CONN_001",
+     "message": "Telematics gateway offline for 35 minutes", "vehicle_id": "VIN-1003",
+     "vehicle_state": "STOPPED", "sensor_readings": {}, "diagnostic_info": {}},
+]
+
+
+class StandinConfig:
+    def __init__(self, name, latency_ms, jitter_ms, error_rate, error_status, tokens=20, token_ms=0.0):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.tokens = tokens
+        self.token_ms = token_ms
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def update(self, changes):
+        with self.lock:
+            for key in ("latency_ms", "jitter_ms", "error_rate", "error_status", "tokens", "token_ms"):
+                if key in changes:
+                    setattr(self, key, type(getattr(self, key))(changes[key]))
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "name": self.name,
+                "latency_ms": self.latency_ms,
+                "jitter_ms": self.jitter_ms,
+                "error_rate": self.error_rate,
+                "error_status": self.error_status,
+                "tokens": self.tokens,
+                "token_ms": self.token_ms,
+                "requests": self.requests,
+                "errors": self.errors
+            }
+
+
+def fake_embedding(text):
+    """Deterministic unit-length pseudo-embedding of `text`"""
+    rng = random.Random(hashlib.sha256(text.encode()).digest())
+    vector = [rng.gauss(0, 1) for _ in range(EMBEDDING_DIMENSIONS)]
+    norm = sum(v * v for v in vector) ** 0.5
+    return [v / norm for v in vector]
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    config = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw or b"{}")
+        except ValueError:
+            return {}
+
+    def _inject(self):
+        """Apply the configured latency; True when this request should fail"""
+        config = self.config
+        with config.lock:
+            config.requests += 1
+            delay = config.latency_ms + random.uniform(0, config.jitter_ms)
+            fail = random.random() < config.error_rate
+            if fail:
+                config.errors += 1
+        time.sleep(delay / 1000)
+        if fail:
+            self._send(self.config.error_status, {"message": f"Injected error from {config.name}"})
+        return fail
+
+    def _stream_completion(self):
+        """vLLM-style streamed chat completion of `tokens` chunks, `token_ms` apart"""
+        with self.config.lock:
+            tokens, token_ms = self.config.tokens, self.config.token_ms
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for i in range(tokens):
+            time.sleep(token_ms / 1000)
+            chunk = {"choices": [{"index": 0, "delta": {"content": f"token{i} "}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def do_GET(self):
+        if self.path == "/_standin":
+            return self._send(200, self.config.snapshot())
+        if self._inject():
+            return
+        if self.path == "/health":
+            return self._send(200, {})
+        self._send(200, {})
+
+    def do_HEAD(self):
+        if self._inject():
+            return
+        # Index existence check
+        self._send(200)
+
+    def do_POST(self):
+        body = self._read_json()
+        if self.path == "/_standin":
+            self.config.update(body)
+            return self._send(200, self.config.snapshot())
+        if self._inject():
+            return
+        if self.path.startswith("/model/") and self.path.endswith("/invoke"):
+            texts = body.get("texts") or [""]
+            return self._send(200, {"id": self.config.name, "texts": texts,
+                                    "embeddings": [fake_embedding(text) for text in texts]})
+        if self.path == "/v1/chat/completions":
+            return self._stream_completion()
+        if self.path.split("?")[0].endswith("/_search"):
+            size = int(body.get("size", 5))
+            hits = [
+                {"_index": "stand-in", "_id": str(i), "_score": 1.0 / (i + 1), "_source": SAMPLE_LOGS[i % len(SAMPLE_LOGS)]}
+                for i in range(min(size, 50))
+            ]
+            return self._send(200, {"took": 1, "timed_out": False,
+                                    "hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": hits}})
+        self._send(404, {"message": f"Stand-in does not implement {self.path}"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--name", default=None, help="Name reported in responses (default: port)")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--tokens", type=int, default=20, help="Chunks of a streamed chat completion")
+    parser.add_argument("--token-ms", type=float, default=0.0, help="Delay before each chunk")
+    args = parser.parse_args()
+
+    StandinHandler.config = StandinConfig(args.name or f"standin-{args.port}", args.latency_ms,
+                                          args.jitter_ms, args.error_rate, args.error_status,
+                                          args.tokens, args.token_ms)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StandinHandler)
+    print(f"Stand-in endpoint listening on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geo
+
+
+def test_place_named_after_a_region_wins_over_the_region():
+    place = geo.places["colorado springs"]
+    assert geo.parse_query("vehicles in Colorado Springs") == geo.distance_filter(
+        place["lat"], place["lon"], place.get("radius_km", geo.GEO_DEFAULT_RADIUS_KM))
+
+
+def test_region_alone_is_its_bounding_box():
+    region = geo.regions["colorado"]
+    assert geo.parse_query("vehicles in Colorado") == geo.box_filter(region["top_left"], region["bottom_right"])
@@ -1,108 +1,137 @@
 import os
 import requests
-from flask import Flask, jsonify, request
-import boto3
+from flask import Flask, Response, request, stream_with_context
 import json
 import time
 import re
-import logging
+import hashlib
+import threading
 from datetime import datetime
-from botocore.config import Config
+from urllib.parse import urlparse
+import numpy as np
+from botocore.exceptions import ClientError, ReadTimeoutError, ConnectionClosedError
+from botocore.exceptions import ConnectionError as BotocoreConnectionError
 from opensearchpy import OpenSearch, RequestsHttpConnection
+from opensearchpy.exceptions import ConnectionError as OpenSearchConnectionError, TransportError
 from requests_aws4auth import AWS4Auth
 
+import admission
+import aggregation
+import archive
+import cancellation
+import clients
+import deadline as request_deadline
+import delta
+import failover
+import geo
+import hedging
+import hottier
+import logs
+import mapreduce
+import partitions
+import peercache
+import prewarm
+import ratelimit
+import readiness
+import remediation
+import responses
+import sensors
+import sessions
+import standing
+import tailer
+import templates
+import watermark
+
 app = Flask(__name__)
-logging.basicConfig(level=logging.INFO)
+logs.configure()
 logger = app.logger
 
-# Configure boto3 with timeouts and retries
-boto3_config = Config(
-    connect_timeout=5,
-    read_timeout=30,
-    retries={'max_attempts': 2}
-)
+# Bedrock endpoints in order of preference: "region" or "region=endpoint_url" entries.
+# Calls fail over between them (see failover.py); boto3 clients are shared per process.
+BEDROCK_ENDPOINTS = os.environ.get('BEDROCK_ENDPOINTS', os.environ.get('AWS_REGION', 'us-west-2'))
+BEDROCK_CONNECT_TIMEOUT = 5
+BEDROCK_READ_TIMEOUT = 30
+BEDROCK_MAX_ATTEMPTS = 2
+
+# Each readiness check of Bedrock is a billed embedding call, so it only runs when no
+# request has embedded successfully for this long
+BEDROCK_READINESS_IDLE_SECONDS = float(os.environ.get('BEDROCK_READINESS_IDLE_SECONDS', '600'))
+
+# Answer modes accepted by /submit_query, and those that can answer only what is new
+# since a client watermark ("since")
+ANSWER_MODES = ("top_k", "aggregate", "map_reduce", "sensor")
+DELTA_MODES = ("top_k", "aggregate")
+
+# Peer cache (see peercache.py): entries per worker and freshness of each group. Retrieval
+# results and answers go stale as logs arrive, so they are kept briefly; answers are only
+# cached when ANSWER_CACHE_TTL_SECONDS is set.
+EMBEDDING_CACHE_TTL_SECONDS = float(os.environ.get('EMBEDDING_CACHE_TTL_SECONDS', '3600'))
+EMBEDDING_CACHE_ENTRIES = int(os.environ.get('EMBEDDING_CACHE_ENTRIES', '256'))
+RETRIEVAL_CACHE_TTL_SECONDS = float(os.environ.get('RETRIEVAL_CACHE_TTL_SECONDS', '15'))
+RETRIEVAL_CACHE_ENTRIES = int(os.environ.get('RETRIEVAL_CACHE_ENTRIES', '256'))
+SEARCH_CACHE_ENTRIES = int(os.environ.get('SEARCH_CACHE_ENTRIES', '512'))
+EMBEDDING_FINGERPRINT_LEVELS = int(os.environ.get('EMBEDDING_FINGERPRINT_LEVELS', '64'))
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get('ANSWER_CACHE_TTL_SECONDS', '0'))
+ANSWER_CACHE_ENTRIES = int(os.environ.get('ANSWER_CACHE_ENTRIES', '128'))
+
+# Times a throttled embedding call is queued again behind the shared rate limiter
+BEDROCK_THROTTLE_RETRIES = int(os.environ.get('BEDROCK_THROTTLE_RETRIES', '3'))
+
+# Searches ask OpenSearch to return only the response fields the service reads (filter_path)
+SEARCH_FILTER_PATH_ENABLED = os.environ.get('SEARCH_FILTER_PATH_ENABLED', 'true').lower() == 'true'
 
-# Custom connection class that refreshes AWS credentials before each request
+# Below this many seconds of embedding budget, Bedrock calls are made without retries
+BEDROCK_RETRY_MIN_BUDGET = float(os.environ.get('BEDROCK_RETRY_MIN_BUDGET_SECONDS', '10'))
+
+# Generation limits: the token cap is lowered when the remaining budget cannot cover it
+VLLM_MAX_TOKENS = int(os.environ.get('VLLM_MAX_TOKENS', '1024'))
+VLLM_MIN_TOKENS = int(os.environ.get('VLLM_MIN_TOKENS', '64'))
+VLLM_TOKENS_PER_SECOND = float(os.environ.get('VLLM_TOKENS_PER_SECOND', '25'))
+
+# Custom connection class that signs each request with refreshable AWS credentials
 class RefreshingAWS4AuthConnection(RequestsHttpConnection):
     def __init__(self, region, service="aoss", **kwargs):
         self.region = region
         self.service = service
         super().__init__(**kwargs)
+        # botocore refreshes these credentials in place before they expire, so the auth
+        # object is set once instead of building a new boto3 session for every request
+        self.session.auth = AWS4Auth(
+            region=self.region,
+            service=self.service,
+            refreshable_credentials=clients.credentials()
+        )
     
     def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
-        # Get fresh credentials for each request
-        credentials = boto3.Session().get_credentials()
-        auth = AWS4Auth(
-            credentials.access_key,
-            credentials.secret_key,
-            self.region,
-            self.service,
-            session_token=credentials.token
-        )
-        
-        # Update session auth with fresh credentials
-        self.session.auth = auth
-        
+        # Do not start (or retry) a search for a request that has been cancelled
+        cancellation.check_current()
+
+        # Respect the request deadline: never start an attempt without budget and
+        # never wait longer than the remaining time. DeadlineExceeded is not a
+        # TransportError, so the transport does not retry it.
+        deadline = request_deadline.get_current()
+        if deadline is not None:
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                raise request_deadline.DeadlineExceeded("OpenSearch budget exhausted before attempt")
+            timeout = min(timeout, remaining) if timeout else remaining
+
         # Proceed with the request
         return super().perform_request(method, url, params, body, timeout, ignore, headers)
 
-# Initialize Bedrock client
-bedrock_runtime = None
-try:
-    bedrock_runtime = boto3.client(
-        service_name='bedrock-runtime',
-        region_name='us-west-2',
-        config=boto3_config
-    )
-    logger.info("Bedrock client initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize Bedrock client: {e}")
-
-# Initialize OpenSearch client
-opensearch_client = None
-try:
-    # Get collection endpoint
-    os_serverless = boto3.client('opensearchserverless')
-    collections = os_serverless.list_collections(
-        collectionFilters={'name': 'error-logs-mock'}
-    )['collectionSummaries']
-    
-    if collections:
-        collection_id = collections[0]['id']
-        logger.info(f"Found collection ID: {collection_id}")
-        collection_details = os_serverless.batch_get_collection(ids=[collection_id])
-
-        if not collection_details.get('collectionDetails'):
-            raise Exception(f"No collection details returned for ID: {collection_id}")
+# OpenSearch endpoints from configuration, in order of preference (comma-separated; plain
+# "http://" URLs are not signed, for local stand-ins). When unset the collection endpoint
+# is discovered in the background.
+OPENSEARCH_ENDPOINTS = os.environ.get('OPENSEARCH_ENDPOINTS', os.environ.get('OPENSEARCH_ENDPOINT', ''))
+OPENSEARCH_REGION = os.environ.get('AWS_REGION', 'us-west-2')
+COLLECTION_NAME = os.environ.get('COLLECTION_NAME', 'error-logs-mock')
 
-        collection = collection_details['collectionDetails'][0]
-        logger.info(f"Collection status: {collection.get('status')}, Type: {collection.get('type')}")
+# vLLM OpenAI-compatible server (full Kubernetes DNS name of the service)
+VLLM_HOST = os.environ.get('VLLM_HOST', 'vllm-llama3-inf2-serve-svc.vllm.svc.cluster.local')
+VLLM_PORT = os.environ.get('VLLM_PORT', '8000')
 
-        if 'collectionEndpoint' not in collection:
-            raise Exception(f"Collection endpoint not available. Status: {collection.get('status')}, Collection: {collection}")
-
-        endpoint = collection['collectionEndpoint']
-        endpoint = endpoint.replace('https://', '')
-        logger.info(f"Using OpenSearch endpoint: {endpoint}")
-        
-        # Create OpenSearch client with the custom connection class
-        # No need to create AWS4Auth here as it's handled by the connection class
-        opensearch_client = OpenSearch(
-            hosts=[{'host': endpoint, 'port': 443}],
-            use_ssl=True,
-            verify_certs=True,
-            timeout=30,
-            retry_on_timeout=True,
-            max_retries=3,
-            connection_class=lambda **kwargs: RefreshingAWS4AuthConnection(
-                region='us-west-2', 
-                service='aoss',
-                **kwargs
-            )
-        )
-        logger.info("OpenSearch client initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize OpenSearch client: {e}")
+opensearch_endpoints = None
+_opensearch_lock = threading.Lock()
 
 def parse_temporal_filter(query_text):
     """
@@ -151,84 +180,338 @@ def parse_temporal_filter(query_text):
         return None
 
 
-def generate_embedding(text):
-    """Generate embeddings using Bedrock"""
+def _parse_bedrock_endpoints(raw):
+    """[(name, (region, endpoint_url))] from "us-west-2,us-east-1=http://localhost:8101" """
+    endpoints = []
+    for item in raw.split(','):
+        region, _, endpoint_url = item.strip().partition('=')
+        if region:
+            endpoints.append((item.strip(), (region, endpoint_url or None)))
+    return endpoints
+
+bedrock_endpoints = failover.EndpointSet('bedrock', _parse_bedrock_endpoints(BEDROCK_ENDPOINTS))
+
+def _bedrock_fails_over(exc):
+    """
+    Throttling, 5xx and connection errors move to the next region; request errors do not,
+    nor does the local rate limiter running out of budget, which says nothing about the region
+    """
+    if isinstance(exc, ratelimit.RateLimitTimeout):
+        return False
+    if isinstance(exc, ClientError):
+        status = exc.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        code = exc.response.get('Error', {}).get('Code', '')
+        return status >= 500 or status == 429 or code in ('ThrottlingException', 'ModelNotReadyException')
+    return True
+
+def _bedrock_retries(deadline):
+    """Retries an embedding call can afford within the request's embedding budget"""
+    if deadline is not None and deadline.stage_budget('embedding') < BEDROCK_RETRY_MIN_BUDGET:
+        return 0
+    return BEDROCK_MAX_ATTEMPTS
+
+def _bedrock_client_for(deadline, region, endpoint_url=None):
+    """
+    Bedrock client of this process for a region whose read timeout and retries fit the
+    embedding budget of the current request (rounded up to a timeout tier within the
+    request's remaining budget, see clients.py)
+    """
+    if deadline is None:
+        read_timeout, max_attempts = BEDROCK_READ_TIMEOUT, BEDROCK_MAX_ATTEMPTS
+    else:
+        budget = deadline.stage_budget('embedding')
+        if budget <= 0:
+            raise request_deadline.DeadlineExceeded("No budget left for embedding")
+        # Rounded up, so a call that times out has used up the stage budget (see stage_expired)
+        read_timeout = clients.timeout_tier(min(budget, BEDROCK_READ_TIMEOUT), limit=deadline.remaining())
+        max_attempts = _bedrock_retries(deadline)
+    if ratelimit.RATE_LIMIT_ENABLED:
+        # botocore cannot leave out throttling alone, so _embed_at retries instead: throttled
+        # calls are re-queued through the shared rate limiter rather than retried by every
+        # worker on its own, which is what turns throttling into a storm
+        max_attempts = 0
+    return clients.get_client('bedrock-runtime', region_name=region,
+                              connect_timeout=BEDROCK_CONNECT_TIMEOUT,
+                              read_timeout=read_timeout, max_attempts=max_attempts,
+                              endpoint_url=endpoint_url)
+
+def _is_throttling(exc):
+    return isinstance(exc, ClientError) and exc.response.get('Error', {}).get('Code') == 'ThrottlingException'
+
+def _is_retryable(exc):
+    """Errors botocore would retry besides throttling: 5xx, connection errors and read timeouts"""
+    if isinstance(exc, ClientError):
+        status = exc.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return status >= 500 or exc.response.get('Error', {}).get('Code') == 'ModelNotReadyException'
+    return isinstance(exc, (BotocoreConnectionError, ReadTimeoutError, ConnectionClosedError))
+
+def _embed_at(endpoint, text):
+    """
+    One Bedrock embedding call against `endpoint` (region, endpoint_url); raises on failure.
+
+    Calls wait for a token from the region's rate limiter, shared by all workers of the pod.
+    A throttled call lowers the shared rate and queues again, up to BEDROCK_THROTTLE_RETRIES
+    times, after which the throttling error is left to fail over to the next region. Other
+    retryable errors queue again as many times as botocore would have retried them.
+    """
+    limiter = ratelimit.bucket(f"bedrock-{endpoint[0]}")
+    throttled = failed = 0
+    while True:
+        deadline = request_deadline.get_current()
+        if limiter is not None:
+            try:
+                limiter.acquire(timeout=deadline.stage_budget('embedding') if deadline is not None else None)
+            except ratelimit.RateLimitTimeout:
+                # No token is due before the stage budget runs out, so the budget is as good
+                # as spent: answer 504 like a timed-out call
+                if deadline is not None:
+                    deadline.exhaust('embedding')
+                raise
+            cancellation.check_current()
+        client = _bedrock_client_for(deadline, *endpoint)
+        try:
+            with admission.stage_slot('embedding'):
+                response = client.invoke_model(
+                    modelId="cohere.embed-english-v3",
+                    contentType="application/json",
+                    accept="application/json",
+                    body=json.dumps({
+                        "texts": [text],
+                        "input_type": "search_query"
+                    })
+                )
+        except (ClientError, BotocoreConnectionError, ReadTimeoutError, ConnectionClosedError) as e:
+            if deadline is not None and deadline.stage_expired('embedding'):
+                # Timed out with the stage budget spent: nothing left to retry with
+                raise
+            if limiter is None:
+                raise
+            if _is_throttling(e):
+                limiter.on_throttle()
+                throttled += 1
+                if throttled > BEDROCK_THROTTLE_RETRIES:
+                    raise
+                continue
+            failed += 1
+            if not _is_retryable(e) or failed > _bedrock_retries(deadline):
+                raise
+            logger.warning(f"Bedrock call in {endpoint[0]} failed, retrying: {e}")
+            continue
+        if limiter is not None:
+            limiter.on_success()
+        return json.loads(response['body'].read())['embeddings'][0]
+
+def _invoke_embedding(text):
+    """Embedding from the best Bedrock region, failing over to the others"""
+    return bedrock_endpoints.call(lambda endpoint: _embed_at(endpoint, text), fails_over=_bedrock_fails_over)
+
+def _generate_embedding(text):
+    """Generate embeddings using Bedrock (hedged when HEDGING_ENABLED is set)"""
     try:
-        response = bedrock_runtime.invoke_model(
-            modelId="cohere.embed-english-v3",
-            contentType="application/json",
-            accept="application/json",
-            body=json.dumps({
-                "texts": [text],
-                "input_type": "search_query"
-            })
-        )
-        embedding = json.loads(response['body'].read())['embeddings'][0]
-        logger.info(f"Generated embedding with dimension: {len(embedding)}")
-        logger.info(f"Generated embedding type: {type(embedding)}")
-        logger.info(f"First few values of embedding: {embedding[:5]}")
+        cancellation.check_current()
+        embedding = hedging.call('bedrock', _invoke_embedding, text)
+        readiness.monitor.record_success('bedrock')
+        logs.event(logger, 'embedding', "Generated embedding", dimension=len(embedding))
         return embedding
     except Exception as e:
         logger.error(f"Error generating embedding: {e}")
         return None
 
-def ensure_opensearch_client():
+# Query embeddings are deterministic, so they are cached for long across all replicas
+embedding_cache = peercache.new_group(
+    'embeddings', _generate_embedding,
+    ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS, max_entries=EMBEDDING_CACHE_ENTRIES, fetch_timeout=1.0)
+
+def generate_embedding(text):
+    """
+    Embedding of `text`, from the peer cache or Bedrock; None on failure. Check
+    `deadline.stage_expired('embedding')` to tell a spent budget from other failures.
+    """
+    deadline = request_deadline.get_current()
+    if deadline is not None:
+        deadline.begin('embedding')
+    return embedding_cache.get(text)
+
+def _opensearch_host(endpoint):
+    """(host, port, use_ssl, signing region) of an endpoint given as host or URL"""
+    parsed = urlparse(endpoint if '://' in endpoint else f"https://{endpoint}")
+    use_ssl = parsed.scheme == 'https'
+    match = re.search(r'\.([a-z]{2}(?:-[a-z]+)+-\d)\.aoss\.amazonaws\.com$', parsed.hostname)
+    region = match.group(1) if match else OPENSEARCH_REGION
+    return parsed.hostname, parsed.port or (443 if use_ssl else 80), use_ssl, region
+
+def _build_opensearch_client(endpoint, max_retries=3):
+    """OpenSearch client for an endpoint; no connection is opened until the first request"""
+    host, port, use_ssl, region = _opensearch_host(endpoint)
+    if use_ssl:
+        connection_class = lambda **kwargs: RefreshingAWS4AuthConnection(region=region, service='aoss', **kwargs)
+    else:
+        connection_class = RequestsHttpConnection
+    return OpenSearch(
+        hosts=[{'host': host, 'port': port}],
+        use_ssl=use_ssl,
+        verify_certs=use_ssl,
+        timeout=30,
+        retry_on_timeout=True,
+        max_retries=max_retries,
+        connection_class=connection_class
+    )
+
+def _opensearch_fails_over(exc):
+    """Connection errors, timeouts, 429 and 5xx move to the next endpoint; 4xx do not"""
+    if isinstance(exc, OpenSearchConnectionError):
+        return True
+    if isinstance(exc, TransportError):
+        status = exc.status_code
+        return not isinstance(status, int) or status >= 500 or status == 429
+    return True
+
+def discover_opensearch_endpoint():
+    """
+    Look up the collection endpoint through the OpenSearch Serverless control plane.
+    Only used when OPENSEARCH_ENDPOINT is not configured; raises if the collection is
+    missing or still provisioning.
+    """
+    os_serverless = clients.get_client('opensearchserverless', region_name=OPENSEARCH_REGION)
+    collections = os_serverless.list_collections(
+        collectionFilters={'name': COLLECTION_NAME}
+    )['collectionSummaries']
+
+    if not collections:
+        raise Exception(f"Collection '{COLLECTION_NAME}' not found")
+
+    collection_id = collections[0]['id']
+    logger.info(f"Found collection ID: {collection_id}")
+    collection_details = os_serverless.batch_get_collection(ids=[collection_id])
+
+    if not collection_details.get('collectionDetails'):
+        raise Exception(f"No collection details returned for ID: {collection_id}")
+
+    collection = collection_details['collectionDetails'][0]
+    logger.info(f"Collection status: {collection.get('status')}, Type: {collection.get('type')}")
+
+    if 'collectionEndpoint' not in collection:
+        raise Exception(f"Collection endpoint not available yet. Status: {collection.get('status')}. Collection is still provisioning.")
+
+    return collection['collectionEndpoint'].replace('https://', '')
+
+def ensure_opensearch_endpoints(discover=False):
+    """
+    OpenSearch endpoint set (clients with failover), or None while no endpoint is known.
+
+    With OPENSEARCH_ENDPOINTS configured the clients are built without any network call.
+    Otherwise the endpoint is discovered by the dependency monitor (`discover=True`),
+    so request threads never block on the AWS control plane.
+    """
+    global opensearch_endpoints
+
+    if opensearch_endpoints is not None:
+        return opensearch_endpoints
+    if not OPENSEARCH_ENDPOINTS and not discover:
+        return None
+
+    with _opensearch_lock:
+        if opensearch_endpoints is None:
+            configured = [e.strip().rstrip('/') for e in OPENSEARCH_ENDPOINTS.split(',') if e.strip()]
+            endpoints = configured or [discover_opensearch_endpoint()]
+            logger.info(f"Using OpenSearch endpoints: {', '.join(endpoints)}")
+            # With standby endpoints, fail over instead of retrying a struggling one
+            max_retries = 3 if len(endpoints) == 1 else 1
+            opensearch_endpoints = failover.EndpointSet(
+                'opensearch', [(endpoint, _build_opensearch_client(endpoint, max_retries)) for endpoint in endpoints])
+    return opensearch_endpoints
+
+def _run_search(client, body, index=None, filter_path=None):
     """
-    Lazy initialization of OpenSearch client with retry logic.
-    Handles case where collection is still CREATING at pod startup.
+    Run a search bounded (including transport retries) by the search stage budget.
+    `filter_path` trims the response to the listed fields, e.g. "hits.hits._source".
+    Without an explicit `index` the search goes to the partitions of the query's time window.
     """
-    global opensearch_client
+    params = {"filter_path": filter_path} if filter_path and SEARCH_FILTER_PATH_ENABLED else {}
+    if index is None:
+        index = partitions.index_for(body)
+    if partitions.partitioned():
+        # Partitions of the window that received no logs were never created
+        params["ignore_unavailable"] = "true"
+    with admission.stage_slot('search'):
+        deadline = request_deadline.get_current()
+        if deadline is None:
+            response = client.search(index=index, body=body, params=params)
+        else:
+            with request_deadline.activate(deadline.for_stage('search')):
+                response = client.search(index=index, body=body, params=params)
+    readiness.monitor.record_success('opensearch')
+    return response
 
-    if opensearch_client is not None:
-        return opensearch_client
+def _search(endpoints, body, index=None, filter_path=None):
+    """Search on the best OpenSearch endpoint, failing over to the others"""
+    return endpoints.call(lambda client: _run_search(client, body, index, filter_path),
+                          fails_over=_opensearch_fails_over)
 
-    try:
-        logger.info("Attempting to initialize OpenSearch client...")
-        os_serverless = boto3.client('opensearchserverless', region_name='us-west-2')
-        collections = os_serverless.list_collections(
-            collectionFilters={'name': 'error-logs-mock'}
-        )['collectionSummaries']
-
-        if not collections:
-            raise Exception("Collection 'error-logs-mock' not found")
-
-        collection_id = collections[0]['id']
-        logger.info(f"Found collection ID: {collection_id}")
-        collection_details = os_serverless.batch_get_collection(ids=[collection_id])
-
-        if not collection_details.get('collectionDetails'):
-            raise Exception(f"No collection details returned for ID: {collection_id}")
-
-        collection = collection_details['collectionDetails'][0]
-        logger.info(f"Collection status: {collection.get('status')}, Type: {collection.get('type')}")
-
-        if 'collectionEndpoint' not in collection:
-            raise Exception(f"Collection endpoint not available yet. Status: {collection.get('status')}. Collection is still provisioning, will retry on next request.")
-
-        endpoint = collection['collectionEndpoint']
-        endpoint = endpoint.replace('https://', '')
-        logger.info(f"Using OpenSearch endpoint: {endpoint}")
-
-        opensearch_client = OpenSearch(
-            hosts=[{'host': endpoint, 'port': 443}],
-            use_ssl=True,
-            verify_certs=True,
-            timeout=30,
-            retry_on_timeout=True,
-            max_retries=3,
-            connection_class=lambda **kwargs: RefreshingAWS4AuthConnection(
-                region='us-west-2',
-                service='aoss',
-                **kwargs
-            )
-        )
-        logger.info("OpenSearch client initialized successfully")
-        return opensearch_client
-    except Exception as e:
-        logger.warning(f"OpenSearch client initialization attempt failed: {e}")
+def _poll_watermark():
+    endpoints = ensure_opensearch_endpoints()
+    if endpoints is None:
         return None
+    response = _search(endpoints, watermark.WATERMARK_QUERY, filter_path="aggregations.latest.value")
+    return response.get('aggregations', {}).get('latest', {}).get('value')
+
+index_watermark = watermark.IndexWatermark(_poll_watermark)
+
+def _index_search(body, filter_path=None):
+    """Search on the logs index for background components (tailer, template registry)"""
+    endpoints = ensure_opensearch_endpoints()
+    if endpoints is None:
+        raise Exception("OpenSearch client not available. Collection may still be provisioning.")
+    return _search(endpoints, body, filter_path=filter_path)
+
+# Newest documents, copied incrementally into in-memory stores (only polled when one subscribes)
+log_tailer = tailer.IndexTailer(
+    lambda body: _index_search(body, filter_path="hits.hits._id,hits.hits._source,hits.hits.sort"))
+hot_tier = hottier.HotTier(log_tailer) if hottier.HOT_TIER_ENABLED else None
+sensor_store = sensors.SensorStore(log_tailer) if sensors.SENSOR_STORE_ENABLED else None
+
+# Logs exported out of the live index, scanned for the older part of long windows
+archive_tier = archive.ArchiveTier() if archive.ARCHIVE_DIR else None
+
+# Distinct message templates for two-stage searches (SEARCH_STRATEGY=templates)
+template_registry = templates.TemplateRegistry(_index_search) if templates.SEARCH_STRATEGY == 'templates' else None
+
+# kNN results per (embedding fingerprint, filters, k); emptied whenever new logs are indexed
+search_cache = peercache.LRUCache(SEARCH_CACHE_ENTRIES, RETRIEVAL_CACHE_TTL_SECONDS)
+index_watermark.on_advance(lambda generation, value: search_cache.clear())
+
+def _search_cache_key(embedding, k, date_filter, filters):
+    """
+    Cache key of a kNN search: the embedding quantized to EMBEDDING_FINGERPRINT_LEVELS steps
+    per unit (so float noise between identical queries does not matter), the normalized
+    filters, k and the index watermark generation
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vector)) or 1.0
+    quantized = np.round(vector / norm * EMBEDDING_FINGERPRINT_LEVELS).astype(np.int16)
+    fingerprint = hashlib.sha1(quantized.tobytes()).hexdigest()
+    return peercache.key_of(fingerprint=fingerprint, k=k, date_filter=date_filter,
+                            filters=filters or [], generation=index_watermark.current())
+
+def _search_result(score, source):
+    return {
+        "score": score,
+        "timestamp": source.get("timestamp", "N/A"),
+        "message": source["message"],
+        "service": source["service"],
+        "error_code": source["error_code"],
+        "vehicle_id": source.get("vehicle_id", "N/A"),
+        "vehicle_state": source.get("vehicle_state", "N/A"),
+        "sensor_readings": source.get("sensor_readings", {}),
+        "diagnostic_info": source.get("diagnostic_info", {})
+    }
+
+def _merge_results(live, archived, k):
+    """k best of live and archived results, newest first among equal scores"""
+    merged = sorted(live + archived, key=lambda result: result["timestamp"], reverse=True)
+    return sorted(merged, key=lambda result: result["score"], reverse=True)[:k]
 
-def vector_search(embedding, k=5, date_filter=None):
+def vector_search(embedding, k=5, date_filter=None, filters=None):
     """
     Search for similar vectors in OpenSearch with optional date filtering.
 
@@ -236,15 +519,43 @@ def vector_search(embedding, k=5, date_filter=None):
         embedding: Vector embedding for semantic search
         k: Number of results to return
         date_filter: Optional dict with OpenSearch range query (e.g., {"gte": "now-1d"})
+        filters: Optional list of additional OpenSearch filter clauses
 
     Returns:
         list: Search results
     """
     try:
-        # Ensure OpenSearch client is initialized (lazy init with retry)
-        client = ensure_opensearch_client()
-        if client is None:
+        # None until the endpoint has been resolved (see ensure_opensearch_endpoints)
+        endpoints = ensure_opensearch_endpoints()
+        if endpoints is None:
             raise Exception("OpenSearch client not available. Collection may still be provisioning.")
+
+        # Windows held entirely by the hot tier are answered from memory
+        if hot_tier is not None:
+            results = hot_tier.search(embedding, k, date_filter, filters)
+            if results is not None:
+                logs.event(logger, 'search', "Vector search served from hot tier", k=k, results=len(results))
+                return results
+
+        cache_key = _search_cache_key(embedding, k, date_filter, filters)
+        cached = search_cache.get(cache_key)
+        if cached is not None:
+            logs.event(logger, 'search', "Vector search served from cache", k=k)
+            return cached
+
+        # The part of a long window older than the live index is scanned from the archive
+        archived = []
+        split = archive_tier.split(date_filter, filters) if archive_tier is not None else None
+        if split is not None:
+            start, until, terms, date_filter = split
+            archived = [_search_result(score, source)
+                        for score, source in archive_tier.search(embedding, k, start, until, terms)]
+            logs.event(logger, 'search', "Archive scanned", k=k, results=len(archived),
+                       until=tailer.iso(until), live_date_filter=date_filter)
+            if date_filter is None:
+                search_cache.put(cache_key, archived)
+                return archived
+
         # Base query structure
         base_source = [
             "timestamp",
@@ -257,31 +568,37 @@ def vector_search(embedding, k=5, date_filter=None):
             "diagnostic_info"
         ]
 
-        # Build query based on whether date filter is provided
+        filter_clauses = list(filters or [])
         if date_filter:
-            # Query with date filter using bool + knn + range filter
+            filter_clauses.insert(0, {"range": {"timestamp": date_filter}})
+
+        # Templated logs: rank the few distinct messages, then fetch the newest logs of the best
+        if template_registry is not None:
+            ranked = template_registry.search(embedding, k, filter_clauses, base_source)
+            if ranked is not None:
+                results = [_search_result(score, source) for score, source in ranked]
+                logs.event(logger, 'search', "Vector search served by message templates", k=k, results=len(results))
+                results = _merge_results(results, archived, k)
+                search_cache.put(cache_key, results)
+                return results
+
+        # Build query based on whether filters are provided
+        if filter_clauses:
+            # Filters inside the knn clause are applied before the nearest neighbors are
+            # chosen (efficient filtering), so narrow windows and regions still return k hits
             search_query = {
                 "size": k,
                 "_source": base_source,
                 "query": {
-                    "bool": {
-                        "must": {
-                            "knn": {
-                                "message_embedding": {
-                                    "vector": embedding,
-                                    "k": k
-                                }
-                            }
-                        },
-                        "filter": {
-                            "range": {
-                                "timestamp": date_filter
-                            }
+                    "knn": {
+                        "message_embedding": {
+                            "vector": embedding,
+                            "k": k,
+                            "filter": {"bool": {"filter": filter_clauses}}
                         }
                     }
                 }
             }
-            logger.info(f"Using date filter: {date_filter}")
         else:
             # Query without date filter (semantic search only)
             search_query = {
@@ -296,29 +613,19 @@ def vector_search(embedding, k=5, date_filter=None):
                     }
                 }
             }
-            logger.info("No date filter applied, using semantic search only")
 
-        logger.info(f"Executing vector search with query: {json.dumps(search_query, indent=2)}")
+        # The query is built into the record only when it is written, with the embedding redacted
+        logs.event(logger, 'search', "Executing vector search", k=k, filters=filter_clauses,
+                   query=lambda: search_query)
 
-        response = client.search(
-            index='error-logs-mock',
-            body=search_query
-        )
-        
-        results = []
-        for hit in response['hits']['hits']:
-            results.append({
-                "score": hit["_score"],
-                "timestamp": hit["_source"].get("timestamp", "N/A"),
-                "message": hit["_source"]["message"],
-                "service": hit["_source"]["service"],
-                "error_code": hit["_source"]["error_code"],
-                "vehicle_id": hit["_source"].get("vehicle_id", "N/A"),
-                "vehicle_state": hit["_source"].get("vehicle_state", "N/A"),
-                "sensor_readings": hit["_source"].get("sensor_readings", {}),
-                "diagnostic_info": hit["_source"].get("diagnostic_info", {})
-            })
+        response = hedging.call('opensearch', _search, endpoints, search_query,
+                                filter_path="hits.hits._score,hits.hits._source")
+
+        # With filter_path an empty result has no "hits" key at all
+        results = [_search_result(hit["_score"], hit["_source"]) for hit in response.get('hits', {}).get('hits', [])]
+        results = _merge_results(results, archived, k)
         
+        search_cache.put(cache_key, results)
         return results
     except Exception as e:
         logger.error(f"Error in vector search: {e}")
@@ -326,110 +633,1140 @@ def vector_search(embedding, k=5, date_filter=None):
 
         
         
-def query_vllm(prompt, context):
-    """Query the vLLM model"""
+def spatial_filters(query):
+    """Geo filter clauses for the places, radii or boxes a question names (see geo.py)"""
+    clause = geo.parse_query(query)
+    return [clause] if clause else []
+
+def _load_retrieval(key):
+    """Retrieval for a peer: the key carries the query, so the embedding comes from its cache"""
+    fields = json.loads(key)
+    embedding = generate_embedding(fields["query"])
+    if embedding is None:
+        return None
+    return vector_search(embedding, k=fields["k"], date_filter=fields["date_filter"],
+                         filters=spatial_filters(fields["query"]))
+
+retrieval_cache = peercache.new_group(
+    'retrieval', _load_retrieval,
+    ttl_seconds=RETRIEVAL_CACHE_TTL_SECONDS, max_entries=RETRIEVAL_CACHE_ENTRIES)
+
+def retrieve(query, embedding, date_filter=None, k=5):
+    """Top-k documents for a query, from the peer cache or a vector search; None on failure"""
+    key = peercache.key_of(query=query, date_filter=date_filter, k=k, watermark=index_watermark.value)
+    return retrieval_cache.get(key, load=lambda: vector_search(embedding, k=k, date_filter=date_filter,
+                                                               filters=spatial_filters(query)))
+
+def aggregate_search(embedding, date_filter=None, group_by="error_code", filters=None):
+    """
+    Summarize a large candidate set instead of returning individual documents.
+
+    Args:
+        embedding: Query embedding, used to select candidates when there is no time window
+        date_filter: Optional dict with OpenSearch range query (e.g., {"gte": "now-1d"})
+        group_by: Keyword field to group statistics by
+        filters: Optional list of additional OpenSearch filter clauses (e.g. spatial)
+
+    Returns:
+        dict: Per-group statistics (see aggregation.summarize) or None on failure
+    """
+    try:
+        endpoints = ensure_opensearch_endpoints()
+        if endpoints is None:
+            raise Exception("OpenSearch client not available. Collection may still be provisioning.")
+
+        if date_filter:
+            # Aggregations over the whole window, however many logs it holds
+            search_query = aggregation.build_window_query(date_filter, group_by, filters=filters)
+            logs.event(logger, 'search', "Executing aggregate search", group_by=group_by, date_filter=date_filter)
+            response = _search(endpoints, search_query, filter_path="hits.total,aggregations")
+            summary = aggregation.summarize_aggregations(response, group_by)
+        else:
+            search_query = aggregation.build_candidate_query(embedding, group_by, filters=filters)
+            logs.event(logger, 'search', "Executing aggregate search", group_by=group_by,
+                       size=search_query['size'])
+            response = _search(endpoints, search_query, filter_path="hits.hits._source")
+            summary = aggregation.summarize(response.get('hits', {}).get('hits', []), group_by)
+        logs.event(logger, 'search', "Summarized aggregate search", total_hits=summary['total_hits'],
+                   groups=len(summary['groups']))
+        return summary
+    except Exception as e:
+        logger.error(f"Error in aggregate search: {e}")
+        return None
+
+def _generation_limits(deadline):
+    """
+    Read timeout and max_tokens for a vLLM call given the request deadline.
+    Near the deadline max_tokens is lowered so generation can finish in time.
+    """
+    if deadline is None:
+        return None, VLLM_MAX_TOKENS
+    budget = deadline.stage_budget('generation')
+    max_tokens = min(VLLM_MAX_TOKENS, int(budget * VLLM_TOKENS_PER_SECOND))
+    if max_tokens < VLLM_MIN_TOKENS:
+        raise request_deadline.DeadlineExceeded(f"Only {budget:.1f}s left for generation")
+    return budget, max_tokens
+
+def _read_vllm_stream(response):
+    """
+    Assemble a streamed chat completion.
+
+    The stream is abandoned as soon as the request is cancelled or its deadline
+    passes; closing the connection makes vLLM abort the generation and free its
+    batch slot instead of finishing an answer nobody reads.
+    """
+    token = cancellation.get_current()
+    deadline = request_deadline.get_current()
+    parts = []
+    try:
+        for line in response.iter_lines():
+            if token is not None:
+                token.check()
+            if deadline is not None and deadline.expired():
+                raise request_deadline.DeadlineExceeded("Generation budget exhausted")
+            if not line:
+                continue
+            decoded_line = line.decode('utf-8')
+            if not decoded_line.startswith("data: "):
+                continue
+            payload = decoded_line[6:]
+            if payload == "[DONE]":
+                break
+            chunk = json.loads(payload)
+            if chunk.get('choices'):
+                parts.append(chunk['choices'][0].get('delta', {}).get('content') or "")
+    finally:
+        response.close()
+    return "".join(parts)
+
+def query_vllm(prompt, context, instructions=None, max_tokens=None):
+    """
+    Query the vLLM model
+
+    Args:
+        prompt: User question
+        context: Retrieved context for the question
+        instructions: Optional extra system instructions (e.g. for map/reduce steps)
+        max_tokens: Optional completion cap, further lowered near the request deadline
+    """
+    # Get current UTC time for temporal context
+    current_time = datetime.utcnow().isoformat() + "Z"
+    system_message = f"You are a helpful assistant. Current date and time (UTC): {current_time}. Use this to calculate relative time ranges like 'last day', 'last week', etc."
+    if instructions:
+        system_message = f"{system_message}\n\n{instructions}"
+    return chat_vllm([
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": f"Context: {context}\n\nQuery: {prompt}"}
+    ], max_tokens=max_tokens)
+
+def chat_vllm(messages, max_tokens=None):
+    """Stream a chat completion for `messages` from vLLM; None on failure"""
     try:
-        # Use the full Kubernetes DNS name for the service
-        vllm_host = os.environ.get('VLLM_HOST', 'vllm-llama3-inf2-serve-svc.vllm.svc.cluster.local')
-        vllm_port = os.environ.get('VLLM_PORT', '8000')
-        vllm_url = f"http://{vllm_host}:{vllm_port}/v1/chat/completions"
+        read_timeout, budget_tokens = _generation_limits(request_deadline.get_current())
+        max_tokens = min(max_tokens, budget_tokens) if max_tokens else budget_tokens
 
-        # Get current UTC time for temporal context
-        current_time = datetime.utcnow().isoformat() + "Z"
-        system_message = f"You are a helpful assistant. Current date and time (UTC): {current_time}. Use this to calculate relative time ranges like 'last day', 'last week', etc."
+        vllm_url = f"http://{VLLM_HOST}:{VLLM_PORT}/v1/chat/completions"
 
         headers = {'Content-Type': 'application/json'}
         data = {
             "model": "NousResearch/Meta-Llama-3-8B-Instruct",
-            "messages": [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": f"Context: {context}\n\nQuery: {prompt}"}
-            ]
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "stream": True
         }
         
-        response = requests.post(vllm_url, headers=headers, json=data)
-        response.raise_for_status()
-        
-        result = response.json()
-        logger.info(f"vLLM response: {json.dumps(result, indent=2)}")  
-        return result['choices'][0]['message']['content']
+        with admission.stage_slot('generation'):
+            response = requests.post(vllm_url, headers=headers, json=data, stream=True, timeout=(5, read_timeout))
+            response.raise_for_status()
+            
+            content = _read_vllm_stream(response)
+        readiness.monitor.record_success('vllm')
+        logs.event(logger, 'generation', "vLLM response", chars=len(content), content=content)
+        return content
     except Exception as e:
         logger.error(f"Error querying vLLM: {e}")
         logger.error(f"Error details: {str(e)}") 
         return None
 
 
+def _generate_remediation(prompt, context):
+    """Generator for remediation snippets missing from the knowledge file (runs in the background)"""
+    with request_deadline.activate(request_deadline.Deadline(request_deadline.DEFAULT_TIMEOUT_SECONDS)):
+        return query_vllm(prompt, context, instructions=remediation.LAZY_PROMPT_INSTRUCTIONS,
+                          max_tokens=remediation.LAZY_MAX_TOKENS)
+
+remediation_knowledge = remediation.RemediationKnowledge(generator=_generate_remediation)
+
+def with_remediation(context, incidents):
+    """
+    Append canonical remediation snippets for the incidents' error codes to the context.
+    Returns (context, instructions) where instructions is None when nothing was added.
+    """
+    reference = remediation_knowledge.reference(incidents)
+    if not reference:
+        return context, None
+    return f"{context}\n\n{reference}", remediation.INSTRUCTIONS
+
+def doc_incidents(docs):
+    """(error_code, vehicle_state, message) of each document, for the remediation reference"""
+    return [(doc['error_code'], doc['vehicle_state'], doc['message']) for doc in docs]
+
+
+def format_context(similar_docs):
+    """Prepare context for LLM with detailed information for each document"""
+    context_entries = []
+    for doc in similar_docs:
+        context_entry = (
+            f"Timestamp: {doc['timestamp']}\n"
+            f"Error: {doc['message']}\n"
+            f"Service: {doc['service']}\n"
+            f"Error Code: {doc['error_code']}\n"
+            f"Vehicle: {doc['vehicle_id']} (State: {doc['vehicle_state']})\n"
+            f"Sensor Readings: {json.dumps(doc['sensor_readings'], indent=2)}\n"
+            f"Diagnostic Info: {json.dumps(doc['diagnostic_info'], indent=2)}\n"
+            "---"
+        )
+        context_entries.append(context_entry)
+
+    return "\n".join(context_entries)
+
+
+def map_reduce_slices(date_filter, partition):
+    """Slices of the query window for a map-reduce answer, or None on failure"""
+    if partition != 'service':
+        return mapreduce.time_slices(date_filter)
+    try:
+        endpoints = ensure_opensearch_endpoints()
+        if endpoints is None:
+            raise Exception("OpenSearch client not available. Collection may still be provisioning.")
+        response = _search(endpoints, mapreduce.services_query(date_filter),
+                           filter_path="aggregations.services.buckets.key")
+        services = [bucket['key'] for bucket in response.get('aggregations', {}).get('services', {}).get('buckets', [])]
+        return mapreduce.service_slices(services, date_filter)
+    except Exception as e:
+        logger.error(f"Error listing services for map-reduce: {e}")
+        return None
+
+def map_reduce_events(query, embedding, date_filter, partition):
+    """
+    Answer a query over a long window by summarizing slices concurrently, then combining them.
+    Yields progress events (see mapreduce.run).
+    """
+    slices = map_reduce_slices(date_filter, partition)
+    spatial = spatial_filters(query)
+    if slices is None:
+        yield {"stage": "error", "error": "Failed to partition the query window"}
+        return
+    if not slices:
+        yield {"stage": "done", "llm_response": "No logs were found in the requested window.", "slices": 0, "failed_slices": 0}
+        return
+
+    # The map phase gets a fixed share of what is left so the reduce step always has time
+    deadline = request_deadline.get_current()
+    map_deadline = request_deadline.Deadline(deadline.remaining() * mapreduce.MAP_PHASE_SHARE) if deadline else None
+
+    def map_slice(slice_):
+        with request_deadline.activate(map_deadline):
+            docs = vector_search(embedding, k=mapreduce.MAPREDUCE_DOCS_PER_SLICE,
+                                 filters=slice_['filters'] + spatial)
+            if docs is None:
+                return None
+            if not docs:
+                return ""
+            context, reference_instructions = with_remediation(
+                f"Slice: {slice_['label']}\n{format_context(docs)}", doc_incidents(docs))
+            instructions = mapreduce.MAP_INSTRUCTIONS
+            if reference_instructions:
+                instructions = f"{instructions} {reference_instructions}"
+            return query_vllm(query, context, instructions=instructions,
+                              max_tokens=mapreduce.MAPREDUCE_MAP_MAX_TOKENS)
+
+    def reduce_partials(partials):
+        context = mapreduce.format_partials(slices, partials)
+        if not context:
+            return "No relevant logs were found in the requested window."
+        return query_vllm(query, context, instructions=mapreduce.REDUCE_INSTRUCTIONS)
+
+    logger.info(f"Running map-reduce over {len(slices)} {partition} slices")
+    yield from mapreduce.run(slices, map_slice, reduce_partials)
+
+def _wants_event_stream():
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def _stream_map_reduce(deadline, request_id, ticket, start_time):
+    """Stream map-reduce progress as server-sent events, ending with the answer"""
+    data = request.get_json(silent=True) or {}
+    if 'query' not in data:
+        ticket.release()
+        return responses.json_response({"error": "Missing query parameter"}), 400
+    query = data['query']
+    partition = data.get('partition', 'time')
+    if partition not in mapreduce.PARTITIONS:
+        ticket.release()
+        return responses.json_response({"error": f"Unknown partition '{partition}', expected one of {list(mapreduce.PARTITIONS)}"}), 400
+    date_filter = parse_temporal_filter(query)
+    environ = request.environ
+
+    def events():
+        with request_deadline.activate(deadline), cancellation.track(request_id, environ) as token:
+            embedding = generate_embedding(query)
+            if embedding is None:
+                yield _sse({"stage": "error", "error": "Failed to generate embedding", "request_id": request_id})
+                return
+            for event in map_reduce_events(query, embedding, date_filter, partition):
+                if token.cancelled():
+                    return
+                event["request_id"] = request_id
+                if event["stage"] == "done":
+                    event["processing_time"] = time.time() - start_time
+                yield _sse(event)
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream',
+                        headers={cancellation.REQUEST_ID_HEADER: request_id})
+    # The admission slot is held until the stream is fully sent (or abandoned)
+    response.call_on_close(ticket.release)
+    return response
+
+def _sse(event):
+    return f"data: {json.dumps(event)}\n\n"
+
+
+admission_controller = admission.AdmissionController()
+
+
 @app.route('/submit_query', methods=['POST'])
 def submit_query():
     start_time = time.time()
     logger.info("Received submit_query request")
-    
+    deadline = request_deadline.Deadline.from_headers(request.headers)
+    request_id = cancellation.new_request_id(request.headers)
+
+    # Wait for an in-flight slot, or shed the request if it would wait past its SLO
+    client_id = request.headers.get(admission.CLIENT_HEADER) or request.remote_addr or "anonymous"
+    priority = admission.request_priority(request.headers)
+    try:
+        ticket = admission_controller.admit(client_id, priority, timeout=deadline.remaining())
+    except admission.AdmissionRejected as e:
+        logger.warning(f"Shedding {priority} request from {client_id}: {e}")
+        response = responses.json_response({"error": str(e), "retry_after": e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+
+    if _wants_event_stream() and (request.get_json(silent=True) or {}).get('mode') == 'map_reduce':
+        return _stream_map_reduce(deadline, request_id, ticket, start_time)
+
+    try:
+        with request_deadline.activate(deadline), cancellation.track(request_id, request.environ) as token:
+            response, status = _handle_submit_query(deadline, token, start_time)
+    finally:
+        ticket.release()
+    response.headers[cancellation.REQUEST_ID_HEADER] = request_id
+    return response, status
+
+def _deadline_error(deadline, stage):
+    """504 response when a stage failed because the request budget ran out"""
+    logger.warning(f"Request deadline of {deadline.timeout:.1f}s exceeded during {stage}")
+    return responses.json_response({"error": f"Request deadline exceeded during {stage}"}), 504
+
+def _cancelled_error(token, stage):
+    """499 (client closed request) response when a stage stopped because of cancellation"""
+    logger.info(f"Request {token.request_id} stopped during {stage}: {token.reason}")
+    return responses.json_response({"error": f"Request cancelled during {stage}", "request_id": token.request_id}), 499
+
+def _handle_submit_query(deadline, token, start_time):
     try:
         # Get query
         data = request.json
         if not data or 'query' not in data:
-            return jsonify({"error": "Missing query parameter"}), 400
+            return responses.json_response({"error": "Missing query parameter"}), 400
 
         query = data['query']
-        logger.info(f"Processing query: {query[:50]}...")
+        logs.event(logger, 'request', "Processing query", query=query[:50])
+
+        explicit_mode = data.get('mode')
+        mode = explicit_mode or 'top_k'
+        if mode not in ANSWER_MODES:
+            return responses.json_response({"error": f"Unknown mode '{mode}', expected one of {list(ANSWER_MODES)}"}), 400
+        group_by = data.get('group_by', 'error_code')
+        if mode == 'aggregate' and group_by not in aggregation.GROUP_FIELDS:
+            return responses.json_response({"error": f"Unknown group_by '{group_by}', expected one of {aggregation.GROUP_FIELDS}"}), 400
+        partition = data.get('partition', 'time')
+        if mode == 'map_reduce' and partition not in mapreduce.PARTITIONS:
+            return responses.json_response({"error": f"Unknown partition '{partition}', expected one of {list(mapreduce.PARTITIONS)}"}), 400
+        since, seen = None, []
+        if data.get('since') is not None:
+            if mode not in DELTA_MODES:
+                return responses.json_response({"error": f"'since' is only supported in modes {list(DELTA_MODES)}"}), 400
+            try:
+                since = delta.parse_since(data['since'])
+                seen = delta.parse_seen(data.get('seen'))
+            except ValueError as e:
+                return responses.json_response({"error": str(e)}), 400
+        session = None
+        if data.get('session_id') is not None:
+            if mode != 'top_k' or since is not None:
+                return responses.json_response({"error": "'session_id' is only supported in mode top_k without 'since'"}), 400
+            if not sessions.is_valid_session_id(data['session_id']):
+                return responses.json_response({"error": "Invalid session_id"}), 400
+            session, known = session_store.get(data['session_id'])
+            if not known and sessions.is_follow_up(query, parse_temporal_filter(query)):
+                # Answering it without the earlier documents would answer a different question
+                return responses.json_response({
+                    "error": "Unknown or expired session_id: ask without referring to earlier answers to start over",
+                    "session_id": data['session_id']
+                }), 404
+
+        # Threshold questions over recent readings are answered exactly from the sensor store
+        # (unless they narrow down the documents of an ongoing conversation)
+        if mode == 'sensor' or (explicit_mode is None and since is None and sensor_store is not None
+                                and (session is None or not session.candidates)):
+            response = _sensor_response(query, mode == 'sensor', token, start_time)
+            if response is not None:
+                return response
 
         # Parse for temporal expressions
         date_filter = parse_temporal_filter(query)
-        if date_filter:
-            logger.info(f"Detected temporal filter: {date_filter}")
-        else:
-            logger.info("No temporal filter detected, using semantic search only")
+        logs.event(logger, 'request', "Parsed query", mode=mode, date_filter=date_filter,
+                   spatial_filters=lambda: spatial_filters(query))
 
-        # Generate embeddings
-        embedding = generate_embedding(query)
-        if embedding is None:
-            return jsonify({"error": "Failed to generate embedding"}), 500
-
-        # Perform vector search with optional date filter
-        similar_docs = vector_search(embedding, date_filter=date_filter)
-        if similar_docs is None:
-            return jsonify({"error": "Failed to perform vector search"}), 500
-
-        # Prepare context for LLM with more detailed information
-        context_entries = []
-        for doc in similar_docs:
-            context_entry = (
-                f"Timestamp: {doc['timestamp']}\n"
-                f"Error: {doc['message']}\n"
-                f"Service: {doc['service']}\n"
-                f"Error Code: {doc['error_code']}\n"
-                f"Vehicle: {doc['vehicle_id']} (State: {doc['vehicle_state']})\n"
-                f"Sensor Readings: {json.dumps(doc['sensor_readings'], indent=2)}\n"
-                f"Diagnostic Info: {json.dumps(doc['diagnostic_info'], indent=2)}\n"
-                "---"
-            )
-            context_entries.append(context_entry)
-        
-        context = "\n".join(context_entries)
+        if session is not None:
+            return _session_response(query, session, date_filter, deadline, token, start_time)
+
+        # Dashboards polling with the watermark of their previous answer only pay for new logs
+        if since is not None:
+            return _delta_response(query, mode, date_filter, since, seen, group_by, bool(data.get('delta_answer')),
+                                   deadline, token, start_time)
+
+        if mode == 'top_k':
+            warm = _warm_answer(query)
+            if warm is not None:
+                return _prewarmed_response(query, warm, token, start_time)
+
+        # Generate embeddings (an aggregate over a time window selects by filter alone)
+        embedding = None
+        if mode != 'aggregate' or not date_filter:
+            embedding = generate_embedding(query)
+            if embedding is None:
+                if token.cancelled():
+                    return _cancelled_error(token, "embedding")
+                if deadline.stage_expired('embedding'):
+                    return _deadline_error(deadline, "embedding")
+                return responses.json_response({"error": "Failed to generate embedding"}), 500
+
+        if mode == 'map_reduce':
+            return _map_reduce_response(query, embedding, date_filter, partition, deadline, token, start_time)
+
+        if mode == 'top_k':
+            return _top_k_response(query, embedding, date_filter, deadline, token, start_time)
+
+        # Summarize the whole candidate set instead of sampling the top few documents
+        summary = aggregate_search(embedding, date_filter=date_filter, group_by=group_by,
+                                   filters=spatial_filters(query))
+        if summary is None:
+            if token.cancelled():
+                return _cancelled_error(token, "search")
+            if deadline.expired():
+                return _deadline_error(deadline, "search")
+            return responses.json_response({"error": "Failed to perform aggregate search"}), 500
+        context = aggregation.format_summary(summary)
+        if group_by == 'error_code':
+            context, instructions = with_remediation(
+                context, [(group['key'], None, None) for group in summary['groups']])
+        else:
+            instructions = None
 
         # Query vLLM
-        llm_response = query_vllm(query, context)
+        if token.cancelled():
+            return _cancelled_error(token, "generation")
+        llm_response = query_vllm(query, context, instructions=instructions)
         if llm_response is None:
-            return jsonify({"error": "Failed to get response from vLLM"}), 500
+            return _generation_error(deadline, token)
 
-        # Prepare the response
-        response = {
+        return responses.json_response({
+            "request_id": token.request_id,
             "query": query,
             "llm_response": llm_response,
-            "similar_documents": similar_docs[:3],  # Include top 3 similar documents
-            "processing_time": time.time() - start_time
-        }
-
-        return jsonify(response), 200
+            "similar_documents": [],
+            "remediation_version": remediation_knowledge.version,
+            "processing_time": time.time() - start_time,
+            "mode": mode,
+            "aggregate_summary": summary,
+            "watermark": delta.watermark_iso(index_watermark.value)
+        }), 200
 
     except Exception as e:
         logger.error(f"Error processing query: {e}")
-        return jsonify({"error": str(e)}), 500
+        return responses.json_response({"error": str(e)}), 500
+
+
+def _sensor_response(query, required, token, start_time):
+    """
+    Exact answer from the sensor store, or None to continue with retrieval. With `required`
+    (mode "sensor") a question the store cannot answer is an error instead. When the
+    question asks more than the readings (e.g. which actions to take), the scan result is
+    the context of a generated answer.
+    """
+    parsed = sensors.parse_query(query)
+    if parsed is None:
+        if not required:
+            return None
+        return responses.json_response({"error": "Sensor mode needs a reading threshold and a time window, "
+                                                 "e.g. 'engine temperature above 110 in the last hour'"}), 400
+    result = sensor_store.answer(parsed) if sensor_store is not None else None
+    if result is None:
+        if not required:
+            return None
+        return responses.json_response({"error": f"Sensor store does not hold {parsed['window']} of readings"}), 503
+
+    logs.event(logger, 'request', "Answered from sensor store", matched=result["matched"], scanned=result["scanned"])
+    answer = sensors.format_answer(result)
+    if result["matched"] and sensors.asks_more(query) and not token.cancelled():
+        incidents = [(row.get('error_code'), row.get('vehicle_state'), '') for row in result["top"]]
+        context, instructions = with_remediation(
+            f"Exact scan of the sensor readings:\n{answer}\n\nMost extreme readings:\n"
+            f"{json.dumps(result['top'], indent=2)}", incidents)
+        # The exact figures still answer the question when generation fails
+        answer = query_vllm(query, context, instructions=instructions) or answer
+    return responses.json_response({
+        "request_id": token.request_id,
+        "query": query,
+        "mode": "sensor",
+        "llm_response": answer,
+        "similar_documents": [],
+        "sensor_result": result,
+        "processing_time": time.time() - start_time
+    }), 200
+
+
+def _latest_after(new_filter, filters):
+    """Newest timestamp (epoch ms) of the logs a poll searches, None when there are none"""
+    endpoints = ensure_opensearch_endpoints()
+    if endpoints is None:
+        raise Exception("OpenSearch client not available. Collection may still be provisioning.")
+    response = _search(endpoints, delta.change_query(new_filter, filters), filter_path="aggregations.latest.value")
+    return response.get('aggregations', {}).get('latest', {}).get('value')
+
+def _seen_after(watermark, filters):
+    """IDs of the logs within the lag margin before a new watermark, for the client to send back"""
+    endpoints = ensure_opensearch_endpoints()
+    if endpoints is None:
+        raise Exception("OpenSearch client not available. Collection may still be provisioning.")
+    response = _search(endpoints, delta.seen_query(watermark, filters), filter_path="hits.hits._id")
+    return [hit['_id'] for hit in response.get('hits', {}).get('hits', [])]
+
+
+def _delta_response(query, mode, date_filter, since, seen, group_by, generate, deadline, token, start_time):
+    """
+    Answer from only the logs the client has not received: those after its watermark, plus
+    late ones from the lag margin before it that are not in its `seen` IDs. The change check
+    uses the question's own window and filters; without new logs "no change" is returned
+    without an embedding, search or generation. With `generate` the new logs get an
+    incremental answer.
+    """
+    new_filter = delta.narrow(date_filter, since)
+    scope = spatial_filters(query)
+    filters = scope + delta.exclude_seen(seen)
+    try:
+        latest = _latest_after(new_filter, filters)
+    except Exception as e:
+        logger.error(f"Error checking for new logs: {e}")
+        return responses.json_response({"error": "Failed to check for new logs"}), 500
+
+    result = {"request_id": token.request_id, "query": query, "mode": mode, "since": tailer.iso(since),
+              "changed": latest is not None, "similar_documents": [], "llm_response": None}
+    if latest is None:
+        logs.event(logger, 'request', "Delta query without new logs", since=result["since"])
+        result.update(watermark=result["since"], seen=seen, processing_time=time.time() - start_time)
+        return responses.json_response(result), 200
+
+    if mode == 'top_k':
+        embedding = generate_embedding(query)
+        if embedding is None:
+            if token.cancelled():
+                return _cancelled_error(token, "embedding")
+            if deadline.stage_expired('embedding'):
+                return _deadline_error(deadline, "embedding")
+            return responses.json_response({"error": "Failed to generate embedding"}), 500
+        # Not shared through the retrieval cache: the seen exclusion is the client's own
+        docs = vector_search(embedding, k=5, date_filter=new_filter, filters=filters)
+        summary = None
+    else:
+        summary = aggregate_search(None, date_filter=new_filter, group_by=group_by, filters=filters)
+        docs = summary
+    if docs is None:
+        if token.cancelled():
+            return _cancelled_error(token, "search")
+        if deadline.expired():
+            return _deadline_error(deadline, "search")
+        return responses.json_response({"error": "Failed to perform vector search"}), 500
+    new_documents = len(docs) if summary is None else summary['total_hits']
+    logs.event(logger, 'request', "Delta query", since=result["since"], date_filter=new_filter,
+               new_documents=new_documents)
+
+    if summary is None:
+        result["similar_documents"] = docs
+        context, instructions = with_remediation(format_context(docs), doc_incidents(docs))
+    else:
+        result["aggregate_summary"] = summary
+        context, instructions = aggregation.format_summary(summary), None
+    if generate and new_documents:
+        if token.cancelled():
+            return _cancelled_error(token, "generation")
+        instructions = f"{delta.INSTRUCTIONS} {instructions}" if instructions else delta.INSTRUCTIONS
+        result["llm_response"] = query_vllm(query, context, instructions=instructions)
+        if result["llm_response"] is None:
+            return _generation_error(deadline, token)
+
+    # Late logs can move `latest` before the client watermark, which never goes back
+    watermark = max(latest, since * 1000)
+    try:
+        result["seen"] = _seen_after(watermark, scope)
+    except Exception as e:
+        # The next poll then repeats the logs of the lag margin instead of losing any
+        logger.warning(f"Could not list the logs seen by this poll: {e}")
+        result["seen"] = []
+    result.update(watermark=delta.watermark_iso(watermark), processing_time=time.time() - start_time)
+    return responses.json_response(result), 200
+
+
+def _generation_error(deadline, token):
+    if token.cancelled():
+        return _cancelled_error(token, "generation")
+    if deadline.stage_budget('generation') * VLLM_TOKENS_PER_SECOND < VLLM_MIN_TOKENS:
+        return _deadline_error(deadline, "generation")
+    return responses.json_response({"error": "Failed to get response from vLLM"}), 500
+
+
+class StageFailed(Exception):
+    """A pipeline stage produced no result; `stage` names it for the error response"""
+
+    def __init__(self, stage):
+        super().__init__(f"{stage} failed")
+        self.stage = stage
+
+
+def _answer_top_k(query, embedding, date_filter):
+    """Retrieve the top documents and generate the answer; raises StageFailed"""
+    similar_docs = retrieve(query, embedding, date_filter)
+    if similar_docs is None:
+        raise StageFailed("search")
+    context, instructions = with_remediation(format_context(similar_docs), doc_incidents(similar_docs))
+
+    token = cancellation.get_current()
+    if token is not None and token.cancelled():
+        raise StageFailed("generation")
+    llm_response = query_vllm(query, context, instructions=instructions)
+    if llm_response is None:
+        raise StageFailed("generation")
+    return {"llm_response": llm_response, "similar_documents": similar_docs[:3]}
+
+
+def _load_answer(key):
+    """Answer for a peer: the key carries the query and time window"""
+    fields = json.loads(key)
+    embedding = generate_embedding(fields["query"])
+    if embedding is None:
+        return None
+    try:
+        return _answer_top_k(fields["query"], embedding, fields["date_filter"])
+    except StageFailed:
+        return None
+
+
+answer_cache = peercache.new_group(
+    'answers', _load_answer,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS, max_entries=ANSWER_CACHE_ENTRIES,
+    fetch_timeout=request_deadline.DEFAULT_TIMEOUT_SECONDS)
+
+
+def _top_k_response(query, embedding, date_filter, deadline, token, start_time):
+    """Answer from the top few similar documents (cached across replicas when enabled)"""
+    key = peercache.key_of(query=query, date_filter=date_filter, watermark=index_watermark.value)
+    stage = "generation"
+    try:
+        answer = answer_cache.get(key, load=lambda: _answer_top_k(query, embedding, date_filter))
+    except StageFailed as e:
+        stage, answer = e.stage, None
+
+    if answer is None:
+        if stage == "search":
+            if token.cancelled():
+                return _cancelled_error(token, "search")
+            if deadline.expired():
+                return _deadline_error(deadline, "search")
+            return responses.json_response({"error": "Failed to perform vector search"}), 500
+        return _generation_error(deadline, token)
+
+    return responses.json_response({
+        "request_id": token.request_id,
+        "query": query,
+        "llm_response": answer["llm_response"],
+        "similar_documents": answer["similar_documents"],  # Top 3 similar documents
+        "remediation_version": remediation_knowledge.version,
+        "processing_time": time.time() - start_time,
+        "watermark": delta.watermark_iso(index_watermark.value)
+    }), 200
+
+
+def _prewarm(query):
+    """
+    Recompute a question's embedding, retrieval and top-k answer in the background (the
+    prewarmer's `compute`); None when it failed, was shed or the sensor store answers the
+    question. Refreshes are admitted as batch work, behind interactive requests.
+    """
+    deadline = request_deadline.Deadline(request_deadline.DEFAULT_TIMEOUT_SECONDS)
+    try:
+        ticket = admission_controller.admit('prewarm', 'batch', timeout=deadline.remaining())
+    except admission.AdmissionRejected as e:
+        logger.info(f"Prewarm refresh of '{query[:50]}' shed: {e}")
+        return None
+    try:
+        with request_deadline.activate(deadline):
+            return _compute_warm_answer(query)
+    finally:
+        ticket.release()
+
+def _compute_warm_answer(query):
+    """Embedding, retrieval and top-k answer of a question with the watermark it was computed at"""
+    value = index_watermark.value
+    embedding = generate_embedding(query)
+    if embedding is None:
+        return None
+    parsed = sensors.parse_query(query)
+    if sensor_store is not None and parsed is not None and sensor_store.answer(parsed) is not None:
+        return None
+    date_filter = parse_temporal_filter(query)
+    documents = retrieve(query, embedding, date_filter)
+    if documents is None:
+        return None
+    key = peercache.key_of(query=query, date_filter=date_filter, watermark=value)
+    try:
+        answer = answer_cache.get(key, load=lambda: _answer_top_k(query, embedding, date_filter))
+    except StageFailed:
+        return None
+    if answer is None:
+        return None
+    return dict(answer, documents=documents, watermark=value)
+
+
+def _owns_warm_answer(query):
+    """Whether this replica keeps `query` warm: the owner of its key on the peer cache ring"""
+    return peercache.picker.owner(peercache.key_of(prewarm=query)) is None
+
+def _fetch_warm_answer(query):
+    """Warm answer kept by the replica owning `query`, or None"""
+    return prewarmed_cache.get(peercache.key_of(prewarm=query))
+
+def _share_popularity(counts):
+    """Send {question: asks} to the replicas owning the questions, which keep them warm"""
+    by_owner = {}
+    for query, count in counts.items():
+        owner = peercache.picker.owner(peercache.key_of(prewarm=query))
+        if owner is not None:
+            by_owner.setdefault(owner, {})[query] = count
+    for owner, owned in by_owner.items():
+        peercache.post(owner, '/prewarm/popularity', {"counts": owned})
+
+prewarmer = prewarm.Prewarmer(_prewarm, index_watermark, pinned=prewarm.load_pinned(prewarm.PREWARM_QUERIES_FILE),
+                              owns=_owns_warm_answer, fetch=_fetch_warm_answer, share=_share_popularity) \
+    if prewarm.PREWARM_ENABLED else None
+
+# Serves the answers this replica keeps warm to the others; never computes one
+prewarmed_cache = peercache.new_group(
+    'prewarmed', lambda key: prewarmer.local(json.loads(key)["prewarm"]) if prewarmer is not None else None,
+    ttl_seconds=prewarm.PREWARM_MIN_INTERVAL_SECONDS, max_entries=64, fetch_timeout=0.5)
+
+
+def _warm_answer(query):
+    """Prewarmed answer to a standalone top-k question (counted towards its popularity), or None"""
+    if prewarmer is None:
+        return None
+    prewarmer.record(query)
+    return prewarmer.lookup(query)
+
+
+def _prewarmed_response(query, warm, token, start_time):
+    logs.event(logger, 'request', "Answered from prewarmed answers", watermark=warm["watermark"])
+    return responses.json_response({
+        "request_id": token.request_id,
+        "query": query,
+        "llm_response": warm["llm_response"],
+        "similar_documents": warm["similar_documents"],
+        "remediation_version": remediation_knowledge.version,
+        "processing_time": time.time() - start_time,
+        "watermark": delta.watermark_iso(warm["watermark"]),
+        "prewarmed": True
+    }), 200
+
+
+session_store = sessions.SessionStore()
+
+
+def _session_response(query, session, date_filter, deadline, token, start_time):
+    """
+    Answer a turn of a conversation. Follow-ups narrow the documents retrieved earlier in
+    memory; other questions retrieve a new set that later follow-ups refer to.
+    """
+    refinement = sessions.parse_refinement(query, date_filter) if session.candidates else None
+    if refinement is not None and not session.covers(refinement):
+        # A wider window than the candidates were retrieved for needs a new retrieval
+        refinement = None
+    candidates, matching, llm_response = None, None, None
+    warm = _warm_answer(query) if refinement is None else None
+    prewarmed = warm is not None and not session.messages
+    if refinement is not None:
+        matching = session.refine(refinement)
+        documents = [doc for _, doc in matching]
+        messages = session.follow_up(query, matching)
+    elif prewarmed:
+        # A conversation opening with a prewarmed question starts from its documents
+        candidates = documents = warm["documents"]
+        context, instructions = with_remediation(format_context(candidates), doc_incidents(candidates))
+        messages = session.opening(context, query, instructions)
+        llm_response = warm["llm_response"]
+    else:
+        embedding = generate_embedding(query)
+        if embedding is None:
+            if token.cancelled():
+                return _cancelled_error(token, "embedding")
+            if deadline.stage_expired('embedding'):
+                return _deadline_error(deadline, "embedding")
+            return responses.json_response({"error": "Failed to generate embedding"}), 500
+        candidates = retrieve(query, embedding, date_filter, k=sessions.SESSION_CANDIDATES)
+        if candidates is None:
+            if token.cancelled():
+                return _cancelled_error(token, "search")
+            if deadline.expired():
+                return _deadline_error(deadline, "search")
+            return responses.json_response({"error": "Failed to perform vector search"}), 500
+        documents = candidates
+        context, instructions = with_remediation(format_context(candidates), doc_incidents(candidates))
+        messages = session.opening(context, query, instructions)
+
+    if refinement is not None and not documents:
+        # Nothing to ask the model about
+        llm_response = (f"None of the {len(session.candidates)} logs in this conversation match. "
+                        "Ask without referring to them to search all logs.")
+    elif llm_response is None:
+        if token.cancelled():
+            return _cancelled_error(token, "generation")
+        llm_response = chat_vllm(messages)
+        if llm_response is None:
+            return _generation_error(deadline, token)
+    window_start = tailer.resolve_time(date_filter.get("gte", date_filter.get("gt"))) if date_filter else None
+    turn = session.record(messages, llm_response, candidates, matching, window_start)
+    session_store.put(session)
+    logs.event(logger, 'session', "Answered conversation turn", session_id=session.session_id,
+               turn=turn, refined=refinement is not None, documents=len(documents))
+
+    return responses.json_response({
+        "request_id": token.request_id,
+        "query": query,
+        "llm_response": llm_response,
+        "similar_documents": documents[:3],
+        "remediation_version": remediation_knowledge.version,
+        "processing_time": time.time() - start_time,
+        "watermark": delta.watermark_iso(index_watermark.value),
+        "session_id": session.session_id,
+        "turn": turn,
+        "refined": refinement is not None,
+        "prewarmed": prewarmed
+    }), 200
+
+
+def _map_reduce_response(query, embedding, date_filter, partition, deadline, token, start_time):
+    """Run a map-reduce answer to completion for clients that do not accept event streams"""
+    final = None
+    for event in map_reduce_events(query, embedding, date_filter, partition):
+        final = event
+    if final["stage"] == "error":
+        if token.cancelled():
+            return _cancelled_error(token, "map-reduce")
+        if deadline.expired():
+            return _deadline_error(deadline, "map-reduce")
+        return responses.json_response({"error": final["error"]}), 500
+
+    return responses.json_response({
+        "request_id": token.request_id,
+        "query": query,
+        "mode": "map_reduce",
+        "llm_response": final["llm_response"],
+        "slices": final["slices"],
+        "failed_slices": final["failed_slices"],
+        "processing_time": time.time() - start_time
+    }), 200
+
+
+_standing_indices_ready = False
+
+def _ensure_standing_indices(client):
+    """Create the standing query and match indices on first registration"""
+    global _standing_indices_ready
+    if _standing_indices_ready:
+        return
+    for index, body in ((standing.STANDING_QUERIES_INDEX, standing.QUERIES_MAPPING),
+                        (standing.STANDING_MATCHES_INDEX, standing.MATCHES_MAPPING)):
+        if not client.indices.exists(index=index):
+            client.indices.create(index=index, body=body)
+            logger.info(f"Created index {index}")
+    _standing_indices_ready = True
+
+
+def _index_not_found(exc):
+    """True for searches of a standing index that has not been created yet (no query registered)"""
+    return isinstance(exc, TransportError) and exc.status_code == 404
+
+def _standing_query_hit(endpoints, query_id):
+    """Search hit of an active standing query, or None"""
+    body = {"size": 1, "_source": {"excludes": ["embedding"]},
+            "query": {"bool": {"filter": [{"term": {"query_id": query_id}}, {"term": {"active": True}}]}}}
+    response = _search(endpoints, body, index=standing.STANDING_QUERIES_INDEX, filter_path="hits.hits._id,hits.hits._source")
+    hits = response.get('hits', {}).get('hits', [])
+    return hits[0] if hits else None
+
+
+@app.route('/standing_queries', methods=['POST'])
+def register_standing_query():
+    """
+    Register a question once; the Kinesis consumer scores every ingested batch against it
+    and records the matching logs, read back from /standing_queries/<query_id>/matches
+    """
+    data = request.get_json(silent=True) or {}
+    if not data.get('query'):
+        return responses.json_response({"error": "Missing query parameter"}), 400
+    endpoints = ensure_opensearch_endpoints()
+    if endpoints is None:
+        return responses.json_response({"error": "OpenSearch client not available"}), 503
+    embedding = generate_embedding(data['query'])
+    if embedding is None:
+        return responses.json_response({"error": "Failed to generate embedding"}), 500
+
+    try:
+        document = standing.new_query(data['query'], embedding, data.get('min_score'))
+    except (TypeError, ValueError):
+        return responses.json_response({"error": "min_score must be a number"}), 400
+    try:
+        endpoints.call(_ensure_standing_indices, fails_over=_opensearch_fails_over)
+        endpoints.call(lambda client: client.index(index=standing.STANDING_QUERIES_INDEX, body=document),
+                       fails_over=_opensearch_fails_over)
+    except Exception as e:
+        logger.error(f"Error registering standing query: {e}")
+        return responses.json_response({"error": "Failed to register standing query"}), 500
+
+    logger.info(f"Registered standing query {document['query_id']}: {data['query'][:50]}")
+    document.pop('embedding')
+    return responses.json_response(document), 201
+
+
+@app.route('/standing_queries', methods=['GET'])
+def list_standing_queries():
+    endpoints = ensure_opensearch_endpoints()
+    if endpoints is None:
+        return responses.json_response({"error": "OpenSearch client not available"}), 503
+    try:
+        response = _search(endpoints, standing.list_query(), index=standing.STANDING_QUERIES_INDEX,
+                           filter_path="hits.hits._source")
+    except Exception as e:
+        if _index_not_found(e):
+            return responses.json_response({"standing_queries": []}), 200
+        logger.error(f"Error listing standing queries: {e}")
+        return responses.json_response({"error": "Failed to list standing queries"}), 500
+    return responses.json_response(
+        {"standing_queries": [hit['_source'] for hit in response.get('hits', {}).get('hits', [])]}), 200
+
+
+@app.route('/standing_queries/<query_id>', methods=['DELETE'])
+def delete_standing_query(query_id):
+    endpoints = ensure_opensearch_endpoints()
+    if endpoints is None:
+        return responses.json_response({"error": "OpenSearch client not available"}), 503
+    try:
+        hit = _standing_query_hit(endpoints, query_id)
+        if hit is None:
+            return responses.json_response({"error": f"Unknown standing query {query_id}"}), 404
+        endpoints.call(lambda client: client.delete(index=standing.STANDING_QUERIES_INDEX, id=hit['_id']),
+                       fails_over=_opensearch_fails_over)
+    except Exception as e:
+        if _index_not_found(e):
+            return responses.json_response({"error": f"Unknown standing query {query_id}"}), 404
+        logger.error(f"Error deleting standing query {query_id}: {e}")
+        return responses.json_response({"error": "Failed to delete standing query"}), 500
+    return responses.json_response({"query_id": query_id, "deleted": True}), 200
+
+
+@app.route('/standing_queries/<query_id>/matches', methods=['GET'])
+def standing_query_matches(query_id):
+    """
+    Matches of a standing query, oldest first. Pollers pass the previous response's
+    watermark and after_id as ?since=&after_id= to continue right after the last match it
+    delivered; "more" says another page is already waiting.
+    """
+    since = request.args.get('since')
+    after_id = request.args.get('after_id') or None
+    if since is not None:
+        try:
+            since = delta.parse_since(since)
+        except ValueError as e:
+            return responses.json_response({"error": str(e)}), 400
+    elif after_id is not None:
+        return responses.json_response({"error": "'after_id' needs 'since'"}), 400
+    endpoints = ensure_opensearch_endpoints()
+    if endpoints is None:
+        return responses.json_response({"error": "OpenSearch client not available"}), 503
+    try:
+        response = _search(endpoints, standing.matches_query(query_id, since, after_id),
+                           index=standing.STANDING_MATCHES_INDEX, filter_path="hits.hits._id,hits.hits._source,hits.hits.sort")
+        hits = response.get('hits', {}).get('hits', [])
+    except Exception as e:
+        if not _index_not_found(e):
+            logger.error(f"Error reading matches of standing query {query_id}: {e}")
+            return responses.json_response({"error": "Failed to read matches"}), 500
+        hits = []
+
+    matches = [hit['_source'] for hit in hits]
+    if hits:
+        # The sort value is matched_at as the index holds it (epoch ms), which search_after compares
+        watermark_value, after_id = delta.watermark_iso(hits[-1]['sort'][0]), hits[-1]['_id']
+    else:
+        watermark_value = tailer.iso(since) if since is not None else None
+    return responses.json_response({"query_id": query_id, "matches": matches, "watermark": watermark_value,
+                                    "after_id": after_id, "more": len(hits) == standing.STANDING_MATCHES_LIMIT}), 200
+
+
+@app.route('/cancel/<request_id>', methods=['POST'])
+def cancel_query(request_id):
+    """
+    Cancel an in-flight query by the request ID it was submitted with. A query not running
+    in this pod is looked for on the other replicas, over the peer port; 404 when none runs it.
+    """
+    if not cancellation.is_valid_request_id(request_id):
+        return responses.json_response({"error": "Invalid request ID"}), 400
+    found = cancellation.cancel(request_id)
+    if not found and not peercache.is_peer_request(request.environ, request.headers):
+        found = any((peercache.post(peer, f"/cancel/{request_id}") or {}).get("cancelled")
+                    for peer in peercache.other_peers())
+    if not found:
+        return responses.json_response({"request_id": request_id, "cancelled": False,
+                                        "error": "No query with this request ID is in flight"}), 404
+    return responses.json_response({"request_id": request_id, "cancelled": True}), 202
+
+
+def _check_opensearch():
+    """
+    Resolve the endpoints if needed and open (warm) a connection to the index on each,
+    which also keeps the latency scores of standby endpoints current
+    """
+    endpoints = ensure_opensearch_endpoints(discover=True)
+
+    def index_exists(client):
+        if not client.indices.exists(index=partitions.pattern()):
+            raise Exception(f"Index {partitions.pattern()} does not exist")
+
+    if endpoints.probe(index_exists) == 0:
+        return f"No OpenSearch endpoint serves index {partitions.pattern()}"
+
+def _check_bedrock():
+    """
+    Embed a short text, which also loads credentials and the Bedrock client. Runs at
+    startup and after BEDROCK_READINESS_IDLE_SECONDS without a successful embedding.
+    """
+    if _generate_embedding("readiness check") is None:
+        return "Embedding request failed"
+
+def _check_vllm():
+    response = requests.get(f"http://{VLLM_HOST}:{VLLM_PORT}/health", timeout=5)
+    if response.status_code != 200:
+        return f"vLLM health returned {response.status_code}"
+
+
+readiness.monitor.register('opensearch', _check_opensearch)
+readiness.monitor.register('bedrock', _check_bedrock, interval=BEDROCK_READINESS_IDLE_SECONDS)
+readiness.monitor.register('vllm', _check_vllm)
+
+
+@app.route(f'{peercache.PEER_PATH}/<group_name>', methods=['POST'])
+def peer_cache_fetch(group_name):
+    """
+    Serve a cache key owned by this replica to another replica. Only answered on the peer
+    port to requests carrying the shared secret; loads queue behind admission as batch work.
+    """
+    if not peercache.is_peer_request(request.environ, request.headers):
+        return responses.json_response({"error": "Not found"}), 404
+    group = peercache.groups.get(group_name)
+    data = request.get_json(silent=True) or {}
+    if group is None or not isinstance(data.get('key'), str):
+        return responses.json_response({"error": "Unknown cache group or missing key"}), 404
+    deadline = request_deadline.Deadline.from_headers(request.headers)
+    try:
+        ticket = admission_controller.admit(f"peer:{request.remote_addr}", 'batch',
+                                            timeout=min(deadline.remaining(), peercache.FETCH_TIMEOUT_SECONDS))
+    except admission.AdmissionRejected as e:
+        # The asking replica falls back to loading the key itself
+        return responses.json_response({"error": str(e)}), 429
+    try:
+        with request_deadline.activate(deadline):
+            value = group.serve(data['key'])
+    finally:
+        ticket.release()
+    if value is None:
+        return responses.json_response({"error": "No value"}), 404
+    return responses.json_response({"value": value}), 200
+
+
+@app.route('/prewarm/popularity', methods=['POST'])
+def receive_prewarm_popularity():
+    """
+    How often another replica was asked questions this one owns, so they are kept warm
+    here. Only answered on the peer port to requests carrying the shared secret.
+    """
+    if prewarmer is None or not peercache.is_peer_request(request.environ, request.headers):
+        return responses.json_response({"error": "Not found"}), 404
+    counts = (request.get_json(silent=True) or {}).get('counts')
+    if not isinstance(counts, dict) or len(counts) > prewarm.PREWARM_TRACKED_QUERIES or \
+            not all(isinstance(query, str) and isinstance(count, int) and count > 0 for query, count in counts.items()):
+        return responses.json_response({"error": "counts must map questions to ask counts"}), 400
+    prewarmer.receive(request.remote_addr, counts)
+    return responses.json_response({"received": len(counts)}), 200
+
+
+@app.route(f'{sessions.PEER_PATH}/<session_id>', methods=['POST'])
+def peer_session(session_id):
+    """
+    Read ("get") or keep ("put") a conversation this replica owns for another one. Only
+    answered on the peer port to requests carrying the shared secret.
+    """
+    if not peercache.is_peer_request(request.environ, request.headers):
+        return responses.json_response({"error": "Not found"}), 404
+    if not sessions.is_valid_session_id(session_id):
+        return responses.json_response({"error": "Invalid session_id"}), 400
+    data = request.get_json(silent=True) or {}
+    if data.get("op") == "get":
+        return responses.json_response({"state": session_store.load(session_id)}), 200
+    state = data.get("state")
+    if data.get("op") != "put" or not isinstance(state, dict) or state.get("session_id") != session_id:
+        return responses.json_response({"error": "Expected op 'get', or 'put' with this session's state"}), 400
+    session_store.save(state)
+    return responses.json_response({"stored": True}), 200
 
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy"}), 200
+    """Liveness: the worker is up and serving; dependencies are reported by /ready"""
+    return responses.json_response({"status": "healthy"}), 200
+
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness from the cached dependency status; 503 until required dependencies are healthy"""
+    readiness.monitor.start()
+    ready, dependencies = readiness.monitor.report()
+    return responses.json_response({
+        "status": "ready" if ready else "not_ready",
+        "dependencies": dependencies
+    }), 200 if ready else 503
 
 if __name__ == '__main__':
+    readiness.monitor.start()
+    if prewarmer is not None:
+        prewarmer.start()
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,70 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# How often the newest indexed timestamp is polled
+POLL_SECONDS = float(os.environ.get('WATERMARK_POLL_SECONDS', '5'))
+
+# Latest timestamp in the index, as a size-0 max aggregation
+WATERMARK_QUERY = {"size": 0, "aggs": {"latest": {"max": {"field": "timestamp"}}}}
+
+
+class IndexWatermark:
+    """
+    Newest document timestamp in the index, polled in the background.
+
+    `generation` increases every time the watermark advances, so caches can put it in
+    their keys (or register a listener) to drop results computed before new logs arrived.
+    """
+
+    def __init__(self, poll, interval=POLL_SECONDS):
+        """`poll()` returns the current watermark, or None when it cannot be read"""
+        self.poll = poll
+        self.interval = interval
+        self.value = None
+        self.generation = 0
+        self.updated_at = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._started_pid = None
+
+    def on_advance(self, listener):
+        """Call `listener(generation, value)` whenever the watermark advances"""
+        self._listeners.append(listener)
+
+    def start(self):
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        threading.Thread(target=self._run, name="index-watermark", daemon=True).start()
+
+    def current(self):
+        """Current generation (starting the poller in this process if needed)"""
+        self.start()
+        return self.generation
+
+    def _run(self):
+        while True:
+            try:
+                self.observe(self.poll())
+            except Exception as e:
+                logger.warning(f"Could not read index watermark: {e}")
+            time.sleep(self.interval)
+
+    def observe(self, value):
+        """Record a watermark reading; advances the generation if it moved forward"""
+        if value is None:
+            return
+        with self._lock:
+            self.updated_at = time.time()
+            if self.value is not None and value <= self.value:
+                return
+            self.value = value
+            self.generation += 1
+            generation = self.generation
+        for listener in self._listeners:
+            listener(generation, value)
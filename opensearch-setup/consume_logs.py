@@ -83,6 +83,9 @@ def index_messages(messages):
             embedding = generate_embedding(bedrock, log['message'])
             if embedding:
                 log['message_embedding'] = embedding
+                if log.get('location'):
+                    # geo_point copy of the coordinates for spatial filters
+                    log['location']['point'] = {"lat": log['location']['latitude'], "lon": log['location']['longitude']}
                 try:
                     os_client.index(
                         index=index_name,
@@ -48,7 +48,8 @@ def create_index_mapping(client, index_name):
                 "location": {
                     "properties": {
                         "latitude": {"type": "float"},
-                        "longitude": {"type": "float"}
+                        "longitude": {"type": "float"},
+                        "point": {"type": "geo_point"}
                     }
                 },
                 "sensor_readings": {
@@ -206,6 +207,9 @@ def main():
             if message_embedding and diagnostic_embedding:
                 log['message_embedding'] = message_embedding
                 log['diagnostic_embedding'] = diagnostic_embedding
+                if log.get('location'):
+                    # geo_point copy of the coordinates for spatial filters
+                    log['location']['point'] = {"lat": log['location']['latitude'], "lon": log['location']['longitude']}
                 try:
                     os_client.index(
                         index=index_name,
@@ -4,6 +4,8 @@ import requests
 import json
 import logging
 import os
+import threading
+import uuid
 
 # Configure logging
 logging.basicConfig(
@@ -13,27 +15,94 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-RAG_SERVICE_URL = f"http://{os.environ.get('RAG_SERVICE_HOST', 'eks-rag-service')}/submit_query"
+RAG_SERVICE_BASE_URL = f"http://{os.environ.get('RAG_SERVICE_HOST', 'eks-rag-service')}"
+RAG_SERVICE_URL = f"{RAG_SERVICE_BASE_URL}/submit_query"
 
+# End-to-end budget for a query; the RAG service splits it across its pipeline stages
+REQUEST_TIMEOUT_SECONDS = float(os.environ.get('RAG_REQUEST_TIMEOUT_SECONDS', '90'))
 
-# Send query to RAG service
-def send_query(query):
-    logger.info(f"Sending query: {query}")
+# Lets the UI's queries be served as interactive when the RAG service restricts that class
+PRIORITY_TOKEN = os.environ.get('RAG_PRIORITY_TOKEN', '')
+
+# In-flight request ID per browser session, so a resubmit cancels the previous query
+inflight_requests = {}
+inflight_lock = threading.Lock()
+
+# Conversation number per browser session; a question asked without ticking "Conversation"
+# ends the current conversation, so the next ticked question opens a new one
+conversations = {}
+
+
+def conversation_id(session_id, continue_conversation):
+    """RAG session ID of a follow-up, or None for a question that starts over"""
+    with inflight_lock:
+        if not continue_conversation:
+            conversations[session_id] = conversations.get(session_id, 0) + 1
+            return None
+        return f"{session_id}-{conversations.setdefault(session_id, 0)}"
+
+
+def cancel_request(request_id):
+    """Ask the RAG service to stop working on a query nobody will read"""
+    try:
+        requests.post(f"{RAG_SERVICE_BASE_URL}/cancel/{request_id}", timeout=2)
+        logger.info(f"Cancelled superseded request {request_id}")
+    except requests.RequestException as e:
+        logger.warning(f"Failed to cancel request {request_id}: {e}")
+
+
+# Answer modes offered by the RAG service
+ANSWER_MODES = ["top_k", "aggregate", "map_reduce"]
+
+
+def format_progress(event):
+    """Status line for a map-reduce progress event"""
+    if event.get('stage') == 'reduce':
+        return f"Combining {event['completed']} partial summaries..."
+    return f"Summarizing slices: {event['completed']}/{event['total']} done..."
+
+
+# Send query to RAG service; yields partial output so progress streams to the page
+def send_query(query, mode="top_k", continue_conversation=False, request: gr.Request = None):
+    logger.info(f"Sending query ({mode}, follow-up={continue_conversation}): {query}")
+    session_id = request.session_hash if request is not None else None
+    request_id = uuid.uuid4().hex
+    if session_id is not None:
+        with inflight_lock:
+            previous_request_id = inflight_requests.get(session_id)
+            inflight_requests[session_id] = request_id
+        if previous_request_id:
+            cancel_request(previous_request_id)
     try:
         payload = {
-            "query": query
+            "query": query,
+            "mode": mode
         }
+        if mode == "top_k" and session_id is not None:
+            # Only follow-ups ("only those while MOVING") join a conversation, to refine the
+            # logs of its earlier answers; other questions never count as one
+            conversation = conversation_id(session_id, continue_conversation)
+            if conversation is not None:
+                payload["session_id"] = conversation
         
         headers = {
             "Content-Type": "application/json",
-            "Accept": "text/event-stream"
+            "Accept": "text/event-stream",
+            "X-Request-Timeout": str(REQUEST_TIMEOUT_SECONDS),
+            "X-Request-ID": request_id,
+            # Interactive traffic is admitted ahead of batch work, fairly across UI sessions
+            "X-Priority": "interactive",
+            "X-Client-ID": f"ui-{session_id or 'anonymous'}"
         }
+        if PRIORITY_TOKEN:
+            headers["X-Priority-Token"] = PRIORITY_TOKEN
         
         # amazonq-ignore-next-line
         response = requests.post(RAG_SERVICE_URL,
                                  headers=headers,
                                  data=json.dumps(payload),
-                                 stream=True)
+                                 stream=True,
+                                 timeout=(5, REQUEST_TIMEOUT_SECONDS + 5))
         response.raise_for_status()
         
         # Process the streaming response
@@ -51,18 +120,34 @@ def send_query(query):
                     # Extract and append the LLM response
                     if 'llm_response' in json_response:
                         full_response += json_response['llm_response']
+                        yield full_response
+                    elif json_response.get('stage') in ('map', 'reduce'):
+                        yield format_progress(json_response)
+                    elif 'error' in json_response:
+                        full_response += f"Error: {json_response['error']}"
+                        yield full_response
                 except json.JSONDecodeError:
                     # If not JSON, append the raw text
                     full_response += decoded_line
+                    yield full_response
                 
-        return full_response
+        yield full_response
     
     except requests.RequestException as e:
         error_msg = f"Error: {str(e)}\nResponse content: {response.text if 'response' in locals() else 'No response'}"
         logger.error(error_msg)
-        return error_msg
+        yield error_msg
+    finally:
+        # Closing the stream (also when the page goes away) lets the RAG service stop the query
+        if 'response' in locals():
+            response.close()
+        if session_id is not None:
+            with inflight_lock:
+                if inflight_requests.get(session_id) == request_id:
+                    del inflight_requests[session_id]
 
-# Default prompts for testing
+# Default prompts for testing (also pinned in eks-rag/prewarm_queries.json, so the RAG
+# service keeps their answers warm when PREWARM_ENABLED is set)
 default_prompts = [
     "Are there any vehicles reporting engine temperatures above 110°C in the last hour? If yes, what immediate actions should be taken based on the sensor readings and diagnostic codes?",
     "Show me any vehicles with battery voltage below 11.5V that are currently in MOVING state. What should be communicated to the drivers?",
@@ -71,15 +156,26 @@ default_prompts = [
 
 iface = gr.Interface(
     fn=send_query,
-    inputs=gr.components.Textbox(
-        lines=3, 
-        placeholder="Enter your question here...",
-        label="Question"
-    ),
+    inputs=[
+        gr.components.Textbox(
+            lines=3, 
+            placeholder="Enter your question here...",
+            label="Question"
+        ),
+        gr.components.Radio(
+            choices=ANSWER_MODES,
+            value="top_k",
+            label="Answer mode (aggregate/map_reduce cover the whole time window)"
+        ),
+        gr.components.Checkbox(
+            value=False,
+            label="Conversation (top_k): tick from a conversation's first question on; follow-ups such as 'only those while MOVING' then refine its logs"
+        )
+    ],
     outputs=gr.components.Textbox(lines=10, label="Answer"),
     title="AI Assistant",
     description="Ask questions about the system being observed! (Responses will stream in real-time)",
-    examples=[[prompt] for prompt in default_prompts],
+    examples=[[prompt, "top_k", False] for prompt in default_prompts],
     theme="default"
 )
 